@@ -1,3 +1,32 @@
+from django.contrib.auth.models import User
 from django.test import TestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from core.testing import QueryBudgetMixin
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('analyst', password='secret')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+
+    def authenticate(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_register(self):
+        self.assertQueryBudget(3, 'post', '/api/auth/register/', {'username': 'new', 'password': 'secret'})
+
+    def test_login(self):
+        response = self.assertQueryBudget(2, 'post', '/api/auth/login/', {'username': 'analyst', 'password': 'secret'})
+        self.assertEqual(response.json()['token'], self.token.key)
+
+    def test_logout(self):
+        self.authenticate()
+        self.assertQueryBudget(2, 'post', '/api/auth/logout/')
+
+    def test_profile(self):
+        self.authenticate()
+        self.assertQueryBudget(1, 'get', '/api/auth/profile/')
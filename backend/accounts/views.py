@@ -31,7 +31,8 @@ def register(request):
         password=password,
         email=email
     )
-    token, _ = Token.objects.get_or_create(user=user)
+    # A new user has no token yet, so skip get_or_create's lookup
+    token = Token.objects.create(user=user)
 
     return Response({
         'user': {
@@ -0,0 +1,50 @@
+from itertools import repeat
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from .models import Equipment
+
+
+def insert_equipment(dataset_id: int, columns: dict, batch_size: int = None) -> int:
+    """
+    Insert equipment rows straight from column arrays.
+
+    `columns` maps Equipment field names to equal-length NumPy arrays. Rows
+    are sent as batched parameterized INSERTs of `batch_size` rows (defaults
+    to settings.ANALYTICS_INSERT_BATCH_SIZE), without building model
+    instances. Returns the number of rows inserted.
+    """
+    batch_size = batch_size or settings.ANALYTICS_INSERT_BATCH_SIZE
+    field_names = list(columns)
+    arrays = [columns[name] for name in field_names]
+    total = len(arrays[0]) if arrays else 0
+    if not total:
+        return 0
+
+    opts = Equipment._meta
+    quote = connection.ops.quote_name
+    db_columns = [opts.get_field('dataset').column] + [
+        opts.get_field(name).column for name in field_names
+    ]
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        quote(opts.db_table),
+        ', '.join(quote(column) for column in db_columns),
+        ', '.join(['%s'] * len(db_columns)),
+    )
+
+    with connection.cursor() as cursor:
+        for start in range(0, total, batch_size):
+            # tolist() converts a whole slice to native Python values in C
+            batch = [array[start:start + batch_size].tolist() for array in arrays]
+            cursor.executemany(sql, zip(repeat(dataset_id), *batch))
+    return total
+
+
+def last_inserted_ids(dataset_id: int, count: int) -> np.ndarray:
+    """Primary keys of the `count` most recently inserted rows of a dataset, ascending."""
+    ids = (
+        Equipment.objects.filter(dataset_id=dataset_id)
+        .order_by('-id')
+        .values_list('id', flat=True)[:count]
+    )
+    return np.fromiter(ids, dtype=np.int64, count=count)[::-1]
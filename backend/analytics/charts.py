@@ -0,0 +1,116 @@
+"""
+Chart data computed on the server, so clients draw bounded payloads
+instead of downloading every row.
+"""
+import numpy as np
+import pandas as pd
+
+CORRELATION_METHODS = ['pearson', 'spearman']
+
+
+def histogram(values: np.ndarray, bins: int) -> dict:
+    """Equal-width histogram of a column: `bins` counts and bins + 1 edges."""
+    counts, edges = np.histogram(values, bins=bins)
+    return {'edges': edges.tolist(), 'counts': counts.tolist()}
+
+
+def lttb(values: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling of a series plotted against
+    its row position. Returns the positions of at most `threshold` points,
+    always keeping the first and last, chosen so peaks and troughs survive.
+    Missing values (NaN) are never selected; the other points keep their
+    positions.
+    """
+    n = len(values)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    y = np.asarray(values, dtype=np.float64)
+    x = np.flatnonzero(~np.isnan(y))
+    if len(x) < n:
+        if threshold >= len(x):
+            return x
+        y, n = y[x], len(x)
+    # Boundaries of the threshold - 2 buckets between the first and last point
+    edges = 1 + np.arange(threshold - 1) * (n - 2) // (threshold - 2)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+
+    a = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # The next bucket's average is the triangle's third corner
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        areas = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(areas.argmax())
+        selected[bucket + 1] = a
+    return x[selected]
+
+
+def downsample(values: np.ndarray, points: int) -> dict:
+    """LTTB-downsampled series as row positions and values."""
+    index = lttb(values, points)
+    return {'index': index.tolist(), 'values': np.asarray(values)[index].tolist()}
+
+
+def compute_chart_data(columns: dict, bins: int, points: int) -> dict:
+    """Histogram and downsampled series for every column in `columns`."""
+    return {
+        parameter: {
+            'histogram': histogram(values, bins),
+            'series': downsample(values, points),
+        }
+        for parameter, values in columns.items()
+    }
+
+
+def _matrix(frame: pd.DataFrame, method: str) -> list:
+    # Undefined coefficients (constant columns, too few rows) become None
+    matrix = frame.corr(method=method).to_numpy()
+    return [[None if np.isnan(value) else float(value) for value in row] for row in matrix]
+
+
+def correlation(columns: dict, method: str = 'pearson', groups: np.ndarray = None) -> dict:
+    """
+    Correlation matrix between the columns in `columns`, in their order.
+    With `groups` (one label per row) a matrix is also computed per label.
+    """
+    frame = pd.DataFrame(columns)
+    result = {'matrix': _matrix(frame, method)}
+    if groups is not None:
+        result['groups'] = {
+            str(label): _matrix(group, method)
+            for label, group in frame.groupby(groups, sort=True)
+        }
+    return result
+
+
+def stratified_sample(groups: np.ndarray, size: int, seed: int = 0) -> np.ndarray:
+    """
+    Row positions of a reproducible random sample of at most `size` rows,
+    stratified so each group keeps its share of the rows (largest
+    remainders get the leftover places). The same seed always returns the
+    same rows, in ascending order.
+    """
+    n = len(groups)
+    if size >= n:
+        return np.arange(n)
+
+    labels, codes, counts = np.unique(groups, return_inverse=True, return_counts=True)
+    shares = counts * size / n
+    quotas = np.floor(shares).astype(np.int64)
+    leftover = size - quotas.sum()
+    quotas[np.argsort(quotas - shares, kind='stable')[:leftover]] += 1
+
+    # Shuffle within each group by sorting on random keys, then keep the
+    # first `quota` rows of every group
+    keys = np.random.default_rng(seed).random(n)
+    order = np.lexsort((keys, codes))
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    rank = np.arange(n) - starts[codes[order]]
+    return np.sort(order[rank < quotas[codes[order]]])
@@ -0,0 +1,50 @@
+"""
+Conditional GET for dataset resources. A dataset only changes when rows
+are appended (which bumps its revision and updated_at), so its ETag is
+derived from the dataset row alone: a request whose If-None-Match still
+matches is answered 304 after a single dataset lookup, without reading
+equipment rows or rendering anything. There is no Last-Modified: HTTP dates
+have one-second granularity, so If-Modified-Since would answer 304 after an
+append in the same second as the copy the client holds.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+
+
+def dataset_etag(dataset, media_type: str) -> str:
+    """
+    Strong ETag of a dataset resource in one representation. The status
+    thresholds are included because changing them reclassifies rows.
+    """
+    key = '|'.join(map(str, [
+        dataset.pk, dataset.revision, dataset.updated_at.isoformat(), media_type,
+        settings.ANALYTICS_STATUS_WARNING_TEMPERATURE, settings.ANALYTICS_STATUS_OFFLINE_TEMPERATURE,
+    ]))
+    return f'"{dataset.pk}-{dataset.revision}-{hashlib.sha256(key.encode()).hexdigest()[:16]}"'
+
+
+def conditional_dataset(view):
+    """
+    Decorate a DatasetViewSet method so its responses carry an ETag, and
+    matching conditional requests get 304 before the method runs. Responses
+    are private to the user and must be revalidated before reuse, since
+    appends change a dataset in place.
+    """
+    @wraps(view)
+    def wrapper(viewset, request, *args, **kwargs):
+        dataset = viewset.get_object()
+        etag = dataset_etag(dataset, request.accepted_media_type)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = view(viewset, request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        # A 304 repeats the validators and caching headers of the full response
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Accept', 'Authorization'])
+        return response
+    return wrapper
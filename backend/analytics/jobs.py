@@ -0,0 +1,327 @@
+import logging
+import multiprocessing
+import os
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Dataset, Equipment, IngestJob
+from .parsing import parse_file
+from .services import parse_csv_and_save, enforce_dataset_limit, save_spooled_dataset
+from .storage import delete_columnar
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_parse_pool = None
+_recovery_thread = None
+_executor_lock = threading.Lock()
+# Tells apart processes that reuse a pid after a restart
+_PROCESS_TOKEN = uuid.uuid4().hex[:8]
+ACTIVE_STAGES = [IngestJob.Stage.PARSING, IngestJob.Stage.FINALIZING]
+
+
+def worker_id() -> str:
+    """Identifies this process as the owner of the jobs it runs."""
+    return f'{socket.gethostname()}:{os.getpid()}:{_PROCESS_TOKEN}'
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    Return the process-wide ingest worker pool, creating it on first use
+    along with the thread that resumes jobs left behind by dead processes
+    (see recover_periodically).
+    """
+    global _executor, _recovery_thread
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.ANALYTICS_INGEST_WORKERS,
+                thread_name_prefix='ingest',
+            )
+            if settings.ANALYTICS_INGEST_RECOVERY_INTERVAL:
+                _recovery_thread = threading.Thread(
+                    target=recover_periodically, name='ingest-recovery', daemon=True
+                )
+                _recovery_thread.start()
+        return _executor
+
+
+def recover_periodically() -> None:
+    """
+    Every ANALYTICS_INGEST_RECOVERY_INTERVAL seconds, requeue the jobs of
+    dead workers and submit every queued job to this process's pool.
+    Several processes may submit the same job; only one claims it.
+    """
+    while True:
+        try:
+            for job_id in recover_stale_jobs():
+                get_executor().submit(_run_in_worker, job_id)
+        except Exception:
+            logger.exception('Recovering ingest jobs failed')
+        finally:
+            connection.close()
+        time.sleep(settings.ANALYTICS_INGEST_RECOVERY_INTERVAL)
+
+
+@contextmanager
+def heartbeat(job_ids: list):
+    """
+    Refresh the heartbeat of this process's jobs every
+    ANALYTICS_INGEST_HEARTBEAT seconds while the block runs, so recovery
+    can tell a slow job from one whose worker has died.
+    """
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(settings.ANALYTICS_INGEST_HEARTBEAT):
+                try:
+                    IngestJob.objects.filter(pk__in=job_ids, worker=worker_id(), stage__in=ACTIVE_STAGES).update(
+                        heartbeat_at=timezone.now()
+                    )
+                except Exception:
+                    logger.exception('Heartbeat of ingest jobs %s failed', job_ids)
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, name='ingest-heartbeat', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def available_cpus() -> int:
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    """
+    Return the process-wide pool used to parse batch uploads in parallel,
+    sized by ANALYTICS_BATCH_WORKERS or the number of available cores.
+    """
+    global _parse_pool
+    with _executor_lock:
+        if _parse_pool is None:
+            # Spawned workers only import analytics.parsing; they never
+            # inherit the server's threads or database connections
+            _parse_pool = ProcessPoolExecutor(
+                max_workers=settings.ANALYTICS_BATCH_WORKERS or available_cpus(),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _parse_pool
+
+
+def parse_in_parallel(func, *iterables):
+    """
+    Run `func` over the arguments on the parse pool. Yields one
+    (index, result) pair per call as the calls finish, where `index` is the
+    position of the call's arguments and `result` is the function's return
+    value or the exception it raised.
+    """
+    global _parse_pool
+    futures = {get_parse_pool().submit(func, *args): index for index, args in enumerate(zip(*iterables))}
+    try:
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except BrokenProcessPool as e:
+                # A worker died; start a fresh pool for the next request
+                with _executor_lock:
+                    _parse_pool = None
+                yield futures[future], e
+            except Exception as e:
+                yield futures[future], e
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def enqueue_ingest(dataset: Dataset) -> IngestJob:
+    """Create a job for `dataset` and schedule it once the transaction commits."""
+    job = IngestJob.objects.create(user=dataset.user, dataset=dataset)
+    transaction.on_commit(lambda: submit_job(job.pk))
+    return job
+
+
+def start_batch_job(dataset: Dataset) -> IngestJob:
+    """
+    Create the job of a batch upload file. The batch request parses and
+    stores the file itself (see ingest_batch); the job reports its progress
+    and lets recover_stale_jobs pick the file up if the request dies.
+    """
+    return IngestJob.objects.create(
+        user=dataset.user, dataset=dataset, stage=IngestJob.Stage.PARSING,
+        worker=worker_id(), heartbeat_at=timezone.now(),
+    )
+
+
+def ingest_batch(jobs: list) -> list:
+    """
+    Parse the files of batch jobs in parallel on the parse pool and store
+    each one as soon as its parse finishes. Workers spool the parsed rows
+    to disk and return only their running totals, so the request holds one
+    chunk of one file at a time. Returns one outcome per job, in order: the
+    output of parse_file with the file's `insert_seconds`, or the exception
+    that failed it. Failed files have their dataset deleted.
+    """
+    outcomes = [None] * len(jobs)
+    with heartbeat([job.pk for job in jobs]), \
+            tempfile.TemporaryDirectory(dir=settings.FILE_UPLOAD_TEMP_DIR) as spool_dir:
+        spools = [os.path.join(spool_dir, f'{job.pk}.spool') for job in jobs]
+        try:
+            for index, outcome in parse_in_parallel(
+                parse_file,
+                [job.dataset.file.path for job in jobs],
+                spools,
+                [settings.ANALYTICS_CSV_CHUNK_SIZE] * len(jobs),
+                [settings.ANALYTICS_CSV_ENGINE] * len(jobs),
+            ):
+                if not isinstance(outcome, Exception):
+                    try:
+                        outcome = _store_batch_file(jobs[index], spools[index], outcome)
+                    except Exception as e:
+                        logger.exception('Batch job %s failed', jobs[index].pk)
+                        outcome = e
+                if isinstance(outcome, Exception):
+                    _fail(jobs[index], outcome)
+                outcomes[index] = outcome
+                if os.path.exists(spools[index]):
+                    os.unlink(spools[index])
+        except BaseException as e:
+            # Don't leave half-stored datasets behind the failed request
+            for job, outcome in zip(jobs, outcomes):
+                if outcome is None:
+                    _fail(job, e)
+            raise
+    return outcomes
+
+
+def _store_batch_file(job: IngestJob, spool_path: str, parsed: dict) -> dict:
+    started = time.perf_counter()
+    dataset = job.dataset
+    _update(job.pk, rows_parsed=parsed['rows_parsed'])
+    save_spooled_dataset(
+        dataset, spool_path, parsed['running'],
+        progress=lambda rows_inserted: _update(job.pk, rows_inserted=rows_inserted),
+    )
+    _update(job.pk, stage=IngestJob.Stage.FINALIZING)
+    dataset.is_ready = True
+    dataset.save(update_fields=['is_ready'])
+    _update(job.pk, stage=IngestJob.Stage.COMPLETED, finished_at=timezone.now())
+    return {**parsed, 'insert_seconds': time.perf_counter() - started}
+
+
+def _fail(job: IngestJob, error: BaseException) -> None:
+    job.dataset.delete()
+    _update(job.pk, stage=IngestJob.Stage.FAILED, error=str(error), finished_at=timezone.now())
+
+
+def submit_job(job_id: int) -> None:
+    if settings.ANALYTICS_INGEST_EAGER:
+        run_job(job_id)
+    else:
+        get_executor().submit(_run_in_worker, job_id)
+
+
+def recover_stale_jobs() -> list:
+    """
+    Requeue jobs whose worker has died and return the ids of all queued
+    jobs. Workers refresh the heartbeat of their running jobs, so a job
+    mid-ingest whose heartbeat is older than ANALYTICS_INGEST_STALE_AFTER
+    seconds has lost its worker; jobs of live workers are left alone
+    however long they take.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.ANALYTICS_INGEST_STALE_AFTER)
+    stale = IngestJob.objects.filter(stage__in=ACTIVE_STAGES).filter(
+        # Jobs started before heartbeats were recorded go by their last update
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, updated_at__lt=cutoff)
+    )
+    for job in stale:
+        # Take the job over first, so a concurrent recovery leaves it alone
+        taken = IngestJob.objects.filter(
+            pk=job.pk, stage=job.stage, worker=job.worker, heartbeat_at=job.heartbeat_at
+        ).update(worker=worker_id(), heartbeat_at=timezone.now())
+        if not taken:
+            continue
+        # Partially inserted rows are discarded and the file is parsed again
+        Equipment.objects.filter(dataset_id=job.dataset_id).delete()
+        delete_columnar(job.dataset_id)
+        _update(
+            job.pk, stage=IngestJob.Stage.QUEUED, worker='', heartbeat_at=None, rows_parsed=0, rows_inserted=0
+        )
+    return list(
+        IngestJob.objects.filter(stage=IngestJob.Stage.QUEUED)
+        .order_by('created_at')
+        .values_list('pk', flat=True)
+    )
+
+
+def run_job(job_id: int) -> None:
+    """Process a queued ingest job: parse, insert, finalize, apply retention."""
+    # Claim the job atomically so it is never processed twice
+    claimed = IngestJob.objects.filter(pk=job_id, stage=IngestJob.Stage.QUEUED).update(
+        stage=IngestJob.Stage.PARSING, worker=worker_id(),
+        heartbeat_at=timezone.now(), updated_at=timezone.now(),
+    )
+    if not claimed:
+        return
+    with heartbeat([job_id]):
+        _process_job(job_id)
+
+
+def _process_job(job_id: int) -> None:
+    job = IngestJob.objects.select_related('dataset').get(pk=job_id)
+    dataset = job.dataset
+    if dataset is None:
+        _update(job_id, stage=IngestJob.Stage.FAILED, error='Dataset no longer exists',
+                finished_at=timezone.now())
+        return
+
+    def progress(rows_parsed, rows_inserted):
+        _update(job_id, rows_parsed=rows_parsed, rows_inserted=rows_inserted)
+
+    try:
+        parse_csv_and_save(dataset, progress=progress)
+
+        _update(job_id, stage=IngestJob.Stage.FINALIZING)
+        dataset.is_ready = True
+        dataset.save(update_fields=['is_ready'])
+
+        # Enforce last 5 datasets limit
+        enforce_dataset_limit(dataset.user)
+    except Exception as e:
+        logger.exception('Ingest job %s failed', job_id)
+        dataset.delete()
+        _update(job_id, stage=IngestJob.Stage.FAILED, error=str(e), finished_at=timezone.now())
+    else:
+        _update(job_id, stage=IngestJob.Stage.COMPLETED, finished_at=timezone.now())
+
+
+def _run_in_worker(job_id: int) -> None:
+    try:
+        run_job(job_id)
+    finally:
+        # Worker threads own their connection; don't leak it between jobs
+        connection.close()
+
+
+def _update(job_id: int, **fields) -> None:
+    fields['updated_at'] = timezone.now()
+    IngestJob.objects.filter(pk=job_id).update(**fields)
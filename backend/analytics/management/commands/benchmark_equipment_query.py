@@ -0,0 +1,100 @@
+import re
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from analytics.models import Dataset, Equipment
+from analytics.serializers import EquipmentQuerySerializer
+from analytics.services import filter_equipment
+from .benchmark_ingest import columnar_insert, make_frame, throwaway_database
+
+# Query parameters of the equipment endpoint, as a client would send them
+QUERIES = [
+    ('type', {'equipment_type': 'Pump'}),
+    ('type+range', {'equipment_type': 'Pump', 'temperature_min': '90', 'temperature_max': '150',
+                    'ordering': 'pressure'}),
+    ('narrow range', {'temperature_min': '100', 'temperature_max': '100.5'}),
+    ('name prefix', {'name_prefix': 'EQ-4242'}),
+    ('sort', {'ordering': '-pressure'}),
+    ('multi-key sort', {'ordering': 'flowrate,-temperature'}),
+]
+# The indexes added for the query API; the rest predate it
+QUERY_INDEXES = [
+    'equipment_dataset_type_temp', 'equipment_dataset_name', 'equipment_dataset_flowrate',
+    'equipment_dataset_pressure', 'equipment_dataset_temperature',
+]
+
+
+def first_page(dataset: Dataset, params: dict, page_size: int):
+    return list(filter_equipment(dataset.equipment.values(*params['fields']), params)[:page_size])
+
+
+def plan_indexes(dataset: Dataset, params: dict, page_size: int) -> list:
+    """Indexes SQLite uses for a first page, from EXPLAIN QUERY PLAN."""
+    queryset = filter_equipment(dataset.equipment.values(*params['fields']), params)[:page_size]
+    sql, sql_params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', sql_params)
+        plan = ' '.join(row[-1] for row in cursor.fetchall())
+    return re.findall(r'USING (?:COVERING )?INDEX (\w+)', plan)
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark first pages of equipment queries with and without the query API indexes, '
+        'and list the index each query uses. Query API indexes no query uses are reported.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Runs per query; the best run is reported.')
+
+    def handle(self, *args, **options):
+        queries = []
+        for label, data in QUERIES:
+            query = EquipmentQuerySerializer(data=data)
+            if not query.is_valid():
+                raise CommandError(f'Invalid query {label}: {query.errors}')
+            queries.append((label, query.validated_data))
+        indexes = [index for index in Equipment._meta.indexes if index.name in QUERY_INDEXES]
+
+        with throwaway_database() as user:
+            self.stdout.write(
+                f"{'rows':>10} {'query':>16} {'indexed ms':>12} {'scan ms':>10} {'speedup':>8}  index"
+            )
+            used = set()
+            for rows in options['rows']:
+                dataset = Dataset.objects.create(user=user, name=f'bench-{rows}', file='bench.csv')
+                columnar_insert(dataset, make_frame(rows), batch_size=5000)
+                timings = {}
+                plans = {label: plan_indexes(dataset, params, options['page_size']) for label, params in queries}
+                used.update(index for names in plans.values() for index in names)
+                for indexed in (True, False):
+                    for label, params in queries:
+                        best, output = None, None
+                        for _ in range(options['repeat']):
+                            start = time.perf_counter()
+                            output = first_page(dataset, params, options['page_size'])
+                            elapsed = time.perf_counter() - start
+                            best = elapsed if best is None else min(best, elapsed)
+                        timings.setdefault(label, []).append((best, output))
+                    if indexed:
+                        with connection.schema_editor() as editor:
+                            for index in indexes:
+                                editor.remove_index(Equipment, index)
+                for label, ((indexed_time, indexed_rows), (scan_time, scan_rows)) in timings.items():
+                    if indexed_rows != scan_rows:
+                        raise CommandError(f'{label} returned different rows without the indexes at {rows} rows')
+                    self.stdout.write(
+                        f'{rows:>10} {label:>16} {indexed_time * 1000:>12.2f} {scan_time * 1000:>10.2f}'
+                        f' {scan_time / indexed_time:>7.1f}x  {", ".join(plans[label]) or "-"}'
+                    )
+                dataset.delete()
+                with connection.schema_editor() as editor:
+                    for index in indexes:
+                        editor.add_index(Equipment, index)
+            unused = [index for index in QUERY_INDEXES if index not in used]
+            self.stdout.write(f"Unused query indexes: {', '.join(unused) or 'none'}")
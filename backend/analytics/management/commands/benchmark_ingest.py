@@ -0,0 +1,94 @@
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from analytics.bulk_insert import insert_equipment
+from analytics.models import Dataset, Equipment
+from analytics.parsing import chunk_columns
+from analytics.status import classify
+
+
+EQUIPMENT_TYPES = ['Pump', 'Valve', 'Reactor', 'Heat Exchanger', 'Compressor', 'Condenser']
+
+
+def make_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    """Build a synthetic equipment CSV frame with `rows` rows."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Equipment Name': [f'EQ-{i}' for i in range(rows)],
+        'Type': rng.choice(EQUIPMENT_TYPES, size=rows),
+        'Flowrate': rng.uniform(50, 500, size=rows),
+        'Pressure': rng.uniform(1, 20, size=rows),
+        'Temperature': rng.uniform(20, 200, size=rows),
+    })
+
+
+@contextmanager
+def throwaway_database():
+    """
+    Run the block against a fresh test database, so the real one is left
+    untouched, and yield a user to own the benchmark datasets.
+    """
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield User.objects.create_user('benchmark')
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def iterrows_insert(dataset: Dataset, df: pd.DataFrame) -> None:
+    """The previous insert path: one model instance per row, one bulk_create."""
+    equipment_objects = []
+    for _, row in df.iterrows():
+        equipment_objects.append(Equipment(
+            dataset=dataset,
+            name=row['Equipment Name'],
+            equipment_type=row['Type'],
+            flowrate=float(row['Flowrate']),
+            pressure=float(row['Pressure']),
+            temperature=float(row['Temperature']),
+            status=classify([row['Temperature']])[0]
+        ))
+    Equipment.objects.bulk_create(equipment_objects)
+
+
+def columnar_insert(dataset: Dataset, df: pd.DataFrame, batch_size: int) -> None:
+    columns = chunk_columns(df)
+    columns['status'] = classify(columns['temperature'])
+    insert_equipment(dataset.id, columns, batch_size=batch_size)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the iterrows insert path against the columnar insert engine.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--skip-iterrows-above', type=int, default=None,
+            help='Skip the slow iterrows path for row counts above this value.'
+        )
+
+    def handle(self, *args, **options):
+        with throwaway_database() as user:
+            self.stdout.write(f"{'rows':>10} {'path':>10} {'seconds':>10} {'rows/s':>12}")
+            for rows in options['rows']:
+                df = make_frame(rows)
+                paths = [('columnar', lambda ds: columnar_insert(ds, df, options['batch_size']))]
+                limit = options['skip_iterrows_above']
+                if limit is None or rows <= limit:
+                    paths.insert(0, ('iterrows', lambda ds: iterrows_insert(ds, df)))
+
+                for label, insert in paths:
+                    dataset = Dataset.objects.create(user=user, name=f'bench-{rows}', file='bench.csv')
+                    start = time.perf_counter()
+                    with transaction.atomic():
+                        insert(dataset)
+                    elapsed = time.perf_counter() - start
+                    self.stdout.write(f'{rows:>10} {label:>10} {elapsed:>10.3f} {rows / elapsed:>12,.0f}')
+                    dataset.delete()
@@ -0,0 +1,50 @@
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from analytics.parsing import available_engines, iter_csv_chunks, resolve_engine
+from .benchmark_ingest import make_frame
+
+
+class Command(BaseCommand):
+    help = 'Report CSV parse throughput (MB/s) for every available parser engine.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000,
+                            help='Rows in the generated CSV file.')
+        parser.add_argument('--file', help='Parse this CSV file instead of a generated one.')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Runs per engine; the best run is reported.')
+
+    def handle(self, *args, **options):
+        path = options['file']
+        cleanup = False
+        if path is None:
+            fd, path = tempfile.mkstemp(suffix='.csv')
+            os.close(fd)
+            make_frame(options['rows']).to_csv(path, index=False)
+            cleanup = True
+
+        try:
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+            self.stdout.write(f'File: {size_mb:.1f} MB, auto engine: {resolve_engine()}')
+            self.stdout.write(f"{'engine':>10} {'seconds':>10} {'MB/s':>10} {'rows/s':>14}")
+            for engine in available_engines():
+                best, rows = None, 0
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    with open(path, 'rb') as source:
+                        rows = sum(len(chunk) for _, chunk in iter_csv_chunks(
+                            source, settings.ANALYTICS_CSV_CHUNK_SIZE, engine
+                        ))
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                self.stdout.write(
+                    f'{engine:>10} {best:>10.3f} {size_mb / best:>10.1f} {rows / best:>14,.0f}'
+                )
+        finally:
+            if cleanup:
+                os.remove(path)
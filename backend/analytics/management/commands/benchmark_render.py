@@ -0,0 +1,56 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from analytics.models import Dataset
+from analytics.renderers import ORJSONRenderer
+from analytics.serializers import EquipmentSerializer
+from .benchmark_ingest import columnar_insert, make_frame, throwaway_database
+
+FIELDS = EquipmentSerializer.Meta.fields
+
+
+def serializer_path(dataset: Dataset) -> bytes:
+    """The previous path: a ModelSerializer instance per row, stdlib json."""
+    return JSONRenderer().render(EquipmentSerializer(dataset.equipment.order_by('id'), many=True).data)
+
+
+def values_path(dataset: Dataset) -> bytes:
+    return JSONRenderer().render(list(dataset.equipment.order_by('id').values(*FIELDS)))
+
+
+def fast_path(dataset: Dataset) -> bytes:
+    return ORJSONRenderer().render(list(dataset.equipment.order_by('id').values(*FIELDS)))
+
+
+class Command(BaseCommand):
+    help = 'Benchmark equipment row rendering: ModelSerializer + json against values() + orjson.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000])
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Runs per path; the best run is reported.')
+
+    def handle(self, *args, **options):
+        paths = [('serializer', serializer_path), ('values', values_path), ('orjson', fast_path)]
+        with throwaway_database() as user:
+            self.stdout.write(f"{'rows':>10} {'path':>12} {'seconds':>10} {'rows/s':>12}")
+            for rows in options['rows']:
+                dataset = Dataset.objects.create(user=user, name=f'bench-{rows}', file='bench.csv')
+                columnar_insert(dataset, make_frame(rows), batch_size=5000)
+                outputs = []
+                for label, render in paths:
+                    best = None
+                    for _ in range(options['repeat']):
+                        start = time.perf_counter()
+                        output = render(dataset)
+                        elapsed = time.perf_counter() - start
+                        best = elapsed if best is None else min(best, elapsed)
+                    # Compared parsed: orjson formats exponent floats differently
+                    outputs.append(json.loads(output))
+                    self.stdout.write(f'{rows:>10} {label:>12} {best:>10.3f} {rows / best:>12,.0f}')
+                if any(output != outputs[0] for output in outputs[1:]):
+                    raise CommandError(f'Rendered output differs between paths at {rows} rows')
+                dataset.delete()
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from analytics.jobs import recover_stale_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = 'Requeue ingest jobs whose worker has died and process every queued job in this process.'
+
+    def handle(self, *args, **options):
+        job_ids = recover_stale_jobs()
+        for job_id in job_ids:
+            run_job(job_id)
+        self.stdout.write(f'Processed {len(job_ids)} ingest job(s).')
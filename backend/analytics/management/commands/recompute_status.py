@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from analytics.status import recompute_status
+
+
+class Command(BaseCommand):
+    help = 'Reclassify equipment status after the status thresholds change.'
+
+    def handle(self, *args, **options):
+        # Reclassified datasets get a new revision, so no process serves
+        # cached responses with the old statuses
+        updated = recompute_status()
+        self.stdout.write(
+            f'Warning from {settings.ANALYTICS_STATUS_WARNING_TEMPERATURE}, '
+            f'Offline above {settings.ANALYTICS_STATUS_OFFLINE_TEMPERATURE}: '
+            f'{updated} rows updated'
+        )
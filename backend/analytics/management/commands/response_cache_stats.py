@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from analytics.response_cache import cache_stats, reset_cache_stats
+
+
+class Command(BaseCommand):
+    help = (
+        'Report response cache hits, misses and hit rate. With the locmem backend the '
+        'counters are per process, so this only sees them for file or redis; ask a '
+        'server process through GET /api/cache-stats/ instead.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Zero the counters after reporting.')
+
+    def handle(self, *args, **options):
+        stats = cache_stats()
+        hit_rate = 'n/a' if stats['hit_rate'] is None else f"{stats['hit_rate']:.1%}"
+        self.stdout.write(f"hits: {stats['hits']}, misses: {stats['misses']}, hit rate: {hit_rate}")
+        if options['reset']:
+            reset_cache_stats()
@@ -0,0 +1,72 @@
+# Generated by Django 4.2.30 on 2026-10-18 05:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Sum
+
+
+def backfill_aggregates(apps, schema_editor):
+    """Compute sums and per-type counts for datasets ingested before this migration."""
+    Dataset = apps.get_model('analytics', 'Dataset')
+    Equipment = apps.get_model('analytics', 'Equipment')
+    EquipmentTypeSummary = apps.get_model('analytics', 'EquipmentTypeSummary')
+    for dataset in Dataset.objects.all():
+        rows = Equipment.objects.filter(dataset=dataset)
+        sums = rows.aggregate(
+            flowrate=Sum('flowrate'), pressure=Sum('pressure'), temperature=Sum('temperature')
+        )
+        dataset.sum_flowrate = sums['flowrate'] or 0.0
+        dataset.sum_pressure = sums['pressure'] or 0.0
+        dataset.sum_temperature = sums['temperature'] or 0.0
+        dataset.save(update_fields=['sum_flowrate', 'sum_pressure', 'sum_temperature'])
+        EquipmentTypeSummary.objects.bulk_create([
+            EquipmentTypeSummary(dataset=dataset, equipment_type=item['equipment_type'], count=item['count'])
+            for item in rows.values('equipment_type').annotate(count=Count('id')).order_by()
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0004_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='revision',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='dataset',
+            name='sum_flowrate',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='dataset',
+            name='sum_pressure',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='dataset',
+            name='sum_temperature',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.CreateModel(
+            name='EquipmentTypeSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('equipment_type', models.CharField(max_length=100)),
+                ('count', models.IntegerField(default=0)),
+                ('dataset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='type_summaries', to='analytics.dataset')),
+            ],
+            options={
+                'ordering': ['equipment_type'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='equipmenttypesummary',
+            constraint=models.UniqueConstraint(fields=('dataset', 'equipment_type'), name='unique_type_summary_per_dataset'),
+        ),
+        migrations.RunPython(backfill_aggregates, migrations.RunPython.noop),
+    ]
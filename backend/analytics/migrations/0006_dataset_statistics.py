@@ -0,0 +1,80 @@
+# Generated by Django 4.2.30 on 2026-10-18 05:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+import numpy as np
+
+# Frozen copies of analytics.parsing as of this migration, so later changes
+# to the app cannot alter what the backfill computes
+PARAMETERS = ['flowrate', 'pressure', 'temperature']
+PERCENTILES = [5, 50, 95]
+STATISTICS = ['min', 'max', 'mean', 'std'] + [f'p{q}' for q in PERCENTILES]
+
+
+def describe(values: np.ndarray) -> dict:
+    if not len(values):
+        return dict.fromkeys(STATISTICS)
+    stats = {
+        'min': float(values.min()),
+        'max': float(values.max()),
+        'mean': float(values.mean()),
+        'std': float(values.std(ddof=1)) if len(values) > 1 else None,
+    }
+    for q, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        stats[f'p{q}'] = float(value)
+    return stats
+
+
+def backfill_statistics(apps, schema_editor):
+    """Compute extended statistics for datasets ingested before this migration."""
+    Dataset = apps.get_model('analytics', 'Dataset')
+    Equipment = apps.get_model('analytics', 'Equipment')
+    DatasetStatistics = apps.get_model('analytics', 'DatasetStatistics')
+    for dataset in Dataset.objects.all():
+        rows = np.array(
+            Equipment.objects.filter(dataset=dataset).values_list(*PARAMETERS), dtype=np.float64
+        ).reshape(-1, len(PARAMETERS))
+        statistics = {parameter: describe(column) for parameter, column in zip(PARAMETERS, rows.T)}
+        DatasetStatistics.objects.create(dataset=dataset, **{
+            f'{parameter}_{stat}': value
+            for parameter, values in statistics.items()
+            for stat, value in values.items()
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0005_append_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DatasetStatistics',
+            fields=[
+                ('dataset', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='statistics', serialize=False, to='analytics.dataset')),
+                ('flowrate_min', models.FloatField(null=True)),
+                ('flowrate_max', models.FloatField(null=True)),
+                ('flowrate_mean', models.FloatField(null=True)),
+                ('flowrate_std', models.FloatField(null=True)),
+                ('flowrate_p5', models.FloatField(null=True)),
+                ('flowrate_p50', models.FloatField(null=True)),
+                ('flowrate_p95', models.FloatField(null=True)),
+                ('pressure_min', models.FloatField(null=True)),
+                ('pressure_max', models.FloatField(null=True)),
+                ('pressure_mean', models.FloatField(null=True)),
+                ('pressure_std', models.FloatField(null=True)),
+                ('pressure_p5', models.FloatField(null=True)),
+                ('pressure_p50', models.FloatField(null=True)),
+                ('pressure_p95', models.FloatField(null=True)),
+                ('temperature_min', models.FloatField(null=True)),
+                ('temperature_max', models.FloatField(null=True)),
+                ('temperature_mean', models.FloatField(null=True)),
+                ('temperature_std', models.FloatField(null=True)),
+                ('temperature_p5', models.FloatField(null=True)),
+                ('temperature_p50', models.FloatField(null=True)),
+                ('temperature_p95', models.FloatField(null=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_statistics, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 4.2.30 on 2026-10-18 05:50
+
+from django.db import migrations, models
+from django.db.models import Max, Min, Sum
+
+PARAMETERS = ['flowrate', 'pressure', 'temperature']
+
+
+def backfill_type_aggregates(apps, schema_editor):
+    """Fill in per-type parameter aggregates for existing datasets."""
+    Equipment = apps.get_model('analytics', 'Equipment')
+    EquipmentTypeSummary = apps.get_model('analytics', 'EquipmentTypeSummary')
+    aggregates = {}
+    for parameter in PARAMETERS:
+        aggregates[f'{parameter}_sum'] = Sum(parameter)
+        aggregates[f'{parameter}_min'] = Min(parameter)
+        aggregates[f'{parameter}_max'] = Max(parameter)
+    for summary in EquipmentTypeSummary.objects.all():
+        values = Equipment.objects.filter(
+            dataset_id=summary.dataset_id, equipment_type=summary.equipment_type
+        ).aggregate(**aggregates)
+        for field, value in values.items():
+            setattr(summary, field, value or 0.0)
+        summary.save(update_fields=list(aggregates))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0006_dataset_statistics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='equipmenttypesummary',
+            name='flowrate_max',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='equipmenttypesummary',
+            name='flowrate_min',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='equipmenttypesummary',
+            name='flowrate_sum',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='equipmenttypesummary',
+            name='pressure_max',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='equipmenttypesummary',
+            name='pressure_min',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='equipmenttypesummary',
+            name='pressure_sum',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='equipmenttypesummary',
+            name='temperature_max',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='equipmenttypesummary',
+            name='temperature_min',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='equipmenttypesummary',
+            name='temperature_sum',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.RunPython(backfill_type_aggregates, migrations.RunPython.noop),
+    ]
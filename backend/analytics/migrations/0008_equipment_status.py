@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-18 05:54
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, Value, When
+
+
+def classify_existing(apps, schema_editor):
+    """Derive the status of existing rows in one UPDATE."""
+    Equipment = apps.get_model('analytics', 'Equipment')
+    Equipment.objects.update(status=Case(
+        When(temperature__gt=settings.ANALYTICS_STATUS_OFFLINE_TEMPERATURE, then=Value('Offline')),
+        When(temperature__gte=settings.ANALYTICS_STATUS_WARNING_TEMPERATURE, then=Value('Warning')),
+        default=Value('Active'),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0007_type_summary_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='equipment',
+            name='status',
+            field=models.CharField(choices=[('Active', 'Active'), ('Warning', 'Warning'), ('Offline', 'Offline')], default='Active', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(fields=['dataset', 'status'], name='equipment_dataset_status'),
+        ),
+        migrations.RunPython(classify_existing, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 4.2.30 on 2026-10-18 05:57
+
+import struct
+
+from django.db import migrations, models
+import django.db.models.deletion
+import numpy as np
+
+# Frozen copies of analytics.parsing and of the analytics.sketches
+# serialization format as of this migration
+PARAMETERS = ['flowrate', 'pressure', 'temperature']
+SKETCH_K = 200
+SKETCH_MAGIC = b'KLL1'
+SKETCH_HEADER = struct.Struct('<4sIqddI')
+
+
+def build_sketch(values: np.ndarray) -> bytes:
+    """
+    A serialized KLL sketch of `values`. The sorted values are thinned to
+    about SKETCH_K items of weight 2**h at level h, the last of every run
+    of 2**h; the few left over stay at level 0 with weight 1.
+    """
+    values = np.sort(values)
+    n = len(values)
+    if not n:
+        levels, minimum, maximum = [np.empty(0)], np.inf, -np.inf
+    else:
+        level = max(0, int(np.ceil(np.log2(n / SKETCH_K))))
+        step = 2 ** level
+        whole = n - n % step
+        levels = [values[whole:]] + [np.empty(0)] * level
+        levels[level] = np.concatenate([levels[level], values[step - 1:whole:step]])
+        minimum, maximum = float(values[0]), float(values[-1])
+    header = SKETCH_HEADER.pack(SKETCH_MAGIC, SKETCH_K, n, minimum, maximum, len(levels))
+    lengths = np.array([len(items) for items in levels], dtype='<u4').tobytes()
+    return header + lengths + np.concatenate(levels).astype('<f8').tobytes()
+
+
+def backfill_sketches(apps, schema_editor):
+    """Build quantile sketches for datasets ingested before this migration."""
+    Dataset = apps.get_model('analytics', 'Dataset')
+    Equipment = apps.get_model('analytics', 'Equipment')
+    ParameterSketch = apps.get_model('analytics', 'ParameterSketch')
+    for dataset in Dataset.objects.all():
+        rows = np.array(
+            Equipment.objects.filter(dataset=dataset).values_list(*PARAMETERS), dtype=np.float64
+        ).reshape(-1, len(PARAMETERS))
+        ParameterSketch.objects.bulk_create([
+            ParameterSketch(dataset=dataset, parameter=parameter, sketch=build_sketch(column))
+            for parameter, column in zip(PARAMETERS, rows.T)
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0008_equipment_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParameterSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('parameter', models.CharField(choices=[('flowrate', 'Flowrate'), ('pressure', 'Pressure'), ('temperature', 'Temperature')], max_length=20)),
+                ('sketch', models.BinaryField()),
+                ('dataset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sketches', to='analytics.dataset')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='parametersketch',
+            constraint=models.UniqueConstraint(fields=('dataset', 'parameter'), name='unique_sketch_per_dataset_parameter'),
+        ),
+        migrations.RunPython(backfill_sketches, migrations.RunPython.noop),
+    ]
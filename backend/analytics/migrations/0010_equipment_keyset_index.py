@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 05:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0009_parameter_sketches'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(fields=['dataset', 'id'], name='equipment_dataset_id'),
+        ),
+    ]
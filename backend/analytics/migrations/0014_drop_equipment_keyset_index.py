@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:04
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0013_ingest_job_heartbeat'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='equipment',
+            name='equipment_dataset_id',
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0014_drop_equipment_keyset_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatusThresholds',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('warning_temperature', models.FloatField()),
+                ('offline_temperature', models.FloatField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
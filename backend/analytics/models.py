@@ -1,12 +1,17 @@
+import uuid
 from django.db import models
 from django.contrib.auth.models import User
 
+from .parsing import PARAMETERS, STATISTICS
+
 
 class Dataset(models.Model):
     """Represents an uploaded CSV dataset."""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='datasets')
     name = models.CharField(max_length=255)
     file = models.FileField(upload_to='datasets/')
+    # SHA-256 of the uploaded file, used to spot repeat uploads
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     
     # Summary statistics (cached for quick retrieval)
@@ -15,6 +20,18 @@ class Dataset(models.Model):
     avg_pressure = models.FloatField(default=0.0)
     avg_temperature = models.FloatField(default=0.0)
 
+    # Exact running sums behind the averages, so appends can update them
+    sum_flowrate = models.FloatField(default=0.0)
+    sum_pressure = models.FloatField(default=0.0)
+    sum_temperature = models.FloatField(default=0.0)
+    # Bumped every time rows are appended
+    revision = models.IntegerField(default=0)
+    # Last change to the rows or summaries; part of the ETag of dataset resources
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Set once background ingestion has finished; hidden from listings until then
+    is_ready = models.BooleanField(default=False)
+
     class Meta:
         ordering = ['-uploaded_at']
 
@@ -24,12 +41,233 @@ class Dataset(models.Model):
 
 class Equipment(models.Model):
     """Represents a single row of equipment data from a CSV."""
+
+    class Status(models.TextChoices):
+        ACTIVE = 'Active', 'Active'
+        WARNING = 'Warning', 'Warning'
+        OFFLINE = 'Offline', 'Offline'
+
     dataset = models.ForeignKey(Dataset, on_delete=models.CASCADE, related_name='equipment')
     name = models.CharField(max_length=255)
     equipment_type = models.CharField(max_length=100)
     flowrate = models.FloatField()
     pressure = models.FloatField()
     temperature = models.FloatField()
+    # Derived from temperature at ingest (see analytics.status)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.ACTIVE)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination in id order needs no index of its own: every
+            # index ends in the rowid, so the dataset foreign key index
+            # already holds each dataset's rows in id order
+            models.Index(fields=['dataset', 'status'], name='equipment_dataset_status'),
+            # Filters and sort keys of the equipment query API. Type is led
+            # into temperature, the range most often combined with it.
+            models.Index(fields=['dataset', 'equipment_type', 'temperature'], name='equipment_dataset_type_temp'),
+            models.Index(fields=['dataset', 'name'], name='equipment_dataset_name'),
+            models.Index(fields=['dataset', 'flowrate'], name='equipment_dataset_flowrate'),
+            models.Index(fields=['dataset', 'pressure'], name='equipment_dataset_pressure'),
+            models.Index(fields=['dataset', 'temperature'], name='equipment_dataset_temperature'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.equipment_type})"
+
+
+class StatusThresholds(models.Model):
+    """
+    The status thresholds the stored Equipment statuses were computed with;
+    a single row. Compared with the settings at startup so a threshold
+    change reclassifies the stored rows (see analytics.status).
+    """
+    warning_temperature = models.FloatField()
+    offline_temperature = models.FloatField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Warning from {self.warning_temperature}, Offline above {self.offline_temperature}"
+
+
+class EquipmentTypeSummary(models.Model):
+    """
+    Per-type aggregates for a dataset, maintained as rows are ingested so
+    type breakdowns never have to scan the Equipment table.
+    """
+    dataset = models.ForeignKey(Dataset, on_delete=models.CASCADE, related_name='type_summaries')
+    equipment_type = models.CharField(max_length=100)
+    count = models.IntegerField(default=0)
+
+    flowrate_sum = models.FloatField(default=0.0)
+    flowrate_min = models.FloatField(default=0.0)
+    flowrate_max = models.FloatField(default=0.0)
+
+    pressure_sum = models.FloatField(default=0.0)
+    pressure_min = models.FloatField(default=0.0)
+    pressure_max = models.FloatField(default=0.0)
+
+    temperature_sum = models.FloatField(default=0.0)
+    temperature_min = models.FloatField(default=0.0)
+    temperature_max = models.FloatField(default=0.0)
+
+    # Fields written when the aggregates of a type change
+    AGGREGATE_FIELDS = ['count'] + [
+        f'{parameter}_{aggregate}'
+        for parameter in PARAMETERS
+        for aggregate in ('sum', 'min', 'max')
+    ]
+
+    class Meta:
+        ordering = ['equipment_type']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dataset', 'equipment_type'], name='unique_type_summary_per_dataset'
+            ),
+        ]
+
+    def aggregates(self) -> dict:
+        """The raw aggregates, in the form used by RunningStats.types."""
+        return {field: getattr(self, field) for field in self.AGGREGATE_FIELDS}
+
+    def as_dict(self) -> dict:
+        """Count plus the mean, min and max of every parameter."""
+        summary = {'equipment_type': self.equipment_type, 'count': self.count}
+        for parameter in PARAMETERS:
+            total = getattr(self, f'{parameter}_sum')
+            summary[parameter] = {
+                'mean': total / self.count if self.count else None,
+                'min': getattr(self, f'{parameter}_min'),
+                'max': getattr(self, f'{parameter}_max'),
+            }
+        return summary
+
+    def __str__(self):
+        return f"{self.equipment_type}: {self.count}"
+
+
+class DatasetStatistics(models.Model):
+    """
+    Extended statistics for each parameter of a dataset, computed at ingest
+    so the stats endpoint reads a single row. Null where undefined.
+    """
+    dataset = models.OneToOneField(
+        Dataset, on_delete=models.CASCADE, primary_key=True, related_name='statistics'
+    )
+
+    flowrate_min = models.FloatField(null=True)
+    flowrate_max = models.FloatField(null=True)
+    flowrate_mean = models.FloatField(null=True)
+    flowrate_std = models.FloatField(null=True)
+    flowrate_p5 = models.FloatField(null=True)
+    flowrate_p50 = models.FloatField(null=True)
+    flowrate_p95 = models.FloatField(null=True)
+
+    pressure_min = models.FloatField(null=True)
+    pressure_max = models.FloatField(null=True)
+    pressure_mean = models.FloatField(null=True)
+    pressure_std = models.FloatField(null=True)
+    pressure_p5 = models.FloatField(null=True)
+    pressure_p50 = models.FloatField(null=True)
+    pressure_p95 = models.FloatField(null=True)
+
+    temperature_min = models.FloatField(null=True)
+    temperature_max = models.FloatField(null=True)
+    temperature_mean = models.FloatField(null=True)
+    temperature_std = models.FloatField(null=True)
+    temperature_p5 = models.FloatField(null=True)
+    temperature_p50 = models.FloatField(null=True)
+    temperature_p95 = models.FloatField(null=True)
+
+    def as_dict(self) -> dict:
+        """Statistics grouped by parameter, e.g. {'flowrate': {'min': ...}}."""
+        return {
+            parameter: {
+                stat: getattr(self, f'{parameter}_{stat}') for stat in STATISTICS
+            }
+            for parameter in PARAMETERS
+        }
+
+    def __str__(self):
+        return f"Statistics for dataset {self.dataset_id}"
+
+
+class ParameterSketch(models.Model):
+    """
+    Serialized KLL quantile sketch of one parameter of a dataset (see
+    analytics.sketches). Sketches merge, so percentiles across datasets
+    are answered without reading Equipment rows.
+    """
+    dataset = models.ForeignKey(Dataset, on_delete=models.CASCADE, related_name='sketches')
+    parameter = models.CharField(max_length=20, choices=[(p, p.title()) for p in PARAMETERS])
+    sketch = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dataset', 'parameter'], name='unique_sketch_per_dataset_parameter'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.parameter} sketch for dataset {self.dataset_id}"
+
+
+class IngestJob(models.Model):
+    """Tracks background processing of an uploaded dataset."""
+
+    class Stage(models.TextChoices):
+        QUEUED = 'queued', 'Queued'
+        PARSING = 'parsing', 'Parsing'
+        FINALIZING = 'finalizing', 'Finalizing'
+        COMPLETED = 'completed', 'Completed'
+        FAILED = 'failed', 'Failed'
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ingest_jobs')
+    dataset = models.ForeignKey(
+        Dataset, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs'
+    )
+    stage = models.CharField(max_length=20, choices=Stage.choices, default=Stage.QUEUED)
+    rows_parsed = models.IntegerField(default=0)
+    rows_inserted = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    # The process running the job, which refreshes heartbeat_at while it works
+    worker = models.CharField(max_length=100, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Job {self.pk} ({self.stage})"
+
+
+class UploadSession(models.Model):
+    """A resumable upload, assembled on disk from numbered chunks."""
+
+    class Status(models.TextChoices):
+        ACTIVE = 'active', 'Active'
+        FINALIZED = 'finalized', 'Finalized'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    total_size = models.BigIntegerField()
+    chunk_size = models.IntegerField()
+    # Bytes received so far and the index of the chunk expected next
+    offset = models.BigIntegerField(default=0)
+    next_chunk = models.IntegerField(default=0)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.ACTIVE)
+    job = models.ForeignKey(
+        IngestJob, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.total_size})"
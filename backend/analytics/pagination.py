@@ -0,0 +1,100 @@
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+
+def _flip(key: str) -> str:
+    return key[1:] if key.startswith('-') else f'-{key}'
+
+
+class EquipmentCursorPagination(CursorPagination):
+    """
+    Keyset pagination over equipment rows, in id order unless the view
+    orders the queryset itself; the ordering always ends in the unique id.
+    A cursor holds every sort key of the row it starts after, and a page
+    is read as a series of index seeks: first the rows tied with that row
+    on all keys but the last, then on all keys but the last two, and so
+    on, stopping once the page is full. Deep pages cost the same as the
+    first one, however few distinct values the sort keys have.
+    """
+    ordering = 'id'
+    page_size = settings.ANALYTICS_EQUIPMENT_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.ANALYTICS_EQUIPMENT_MAX_PAGE_SIZE
+
+    def get_ordering(self, request, queryset, view):
+        # The view orders by the validated `ordering` parameter, ending in id
+        return tuple(queryset.query.order_by) or super().get_ordering(request, queryset, view)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        reverse, position = False, None
+        if self.cursor is not None:
+            reverse = self.cursor.reverse
+            try:
+                position = json.loads(self.cursor.position)
+            except (TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+            if not isinstance(position, list) or len(position) != len(self.ordering) or None in position:
+                raise NotFound(self.invalid_cursor_message)
+            # Cursors come from the client; each key must suit its field
+            fields = [queryset.model._meta.get_field(key.lstrip('-')) for key in self.ordering]
+            try:
+                position = [field.to_python(value) for field, value in zip(fields, position)]
+            except ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+
+        # Previous pages are read backwards from the cursor, then flipped
+        ordering = [_flip(key) for key in self.ordering] if reverse else list(self.ordering)
+        rows = self._seek(queryset.order_by(*ordering), ordering, position, self.page_size + 1)
+        has_more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        return self.page
+
+    @staticmethod
+    def _seek(queryset, ordering: list, position, limit: int) -> list:
+        """Up to `limit` rows of `queryset` after `position` in `ordering`."""
+        if position is None:
+            return list(queryset[:limit])
+        fields = [key.lstrip('-') for key in ordering]
+        rows = []
+        for depth in reversed(range(len(ordering))):
+            ties = dict(zip(fields[:depth], position[:depth]))
+            lookup = 'lt' if ordering[depth].startswith('-') else 'gt'
+            rows += queryset.filter(**ties, **{f'{fields[depth]}__{lookup}': position[depth]})[:limit - len(rows)]
+            if len(rows) == limit:
+                break
+        return rows
+
+    def _link(self, row, reverse: bool) -> str:
+        fields = [key.lstrip('-') for key in self.ordering]
+        if isinstance(row, dict):
+            position = [row[field] for field in fields]
+        else:
+            position = [getattr(row, field) for field in fields]
+        return self.encode_cursor(Cursor(offset=0, reverse=reverse, position=json.dumps(position)))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self._link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self._link(self.page[0], reverse=True)
@@ -0,0 +1,334 @@
+"""
+CSV parsing helpers. This module deliberately has no Django imports so it
+can run in worker processes that never set up Django.
+"""
+import gzip
+import math
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+import zstandard
+
+from .sketches import KLLSketch
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:  # pyarrow is optional for parsing; pandas engines still work
+    pa = pa_csv = None
+
+
+REQUIRED_COLUMNS = ['Equipment Name', 'Type', 'Flowrate', 'Pressure', 'Temperature']
+NUMERIC_COLUMNS = ['Flowrate', 'Pressure', 'Temperature']
+
+# Equipment fields the extended statistics are computed for
+PARAMETERS = ['flowrate', 'pressure', 'temperature']
+PERCENTILES = [5, 50, 95]
+STATISTICS = ['min', 'max', 'mean', 'std'] + [f'p{q}' for q in PERCENTILES]
+
+
+def merge_type_aggregates(a: dict, b: dict) -> dict:
+    """Combine two per-type aggregates (see RunningStats.types)."""
+    merged = {'count': a['count'] + b['count']}
+    for parameter in PARAMETERS:
+        merged[f'{parameter}_sum'] = a[f'{parameter}_sum'] + b[f'{parameter}_sum']
+        merged[f'{parameter}_min'] = min(a[f'{parameter}_min'], b[f'{parameter}_min'])
+        merged[f'{parameter}_max'] = max(a[f'{parameter}_max'], b[f'{parameter}_max'])
+    return merged
+
+
+class ParameterMoments:
+    """
+    Count, mean, sum of squared deviations from the mean (m2), minimum and
+    maximum of one parameter. Two instances merge exactly (Chan et al.'s
+    pairwise update), so the standard deviation of a whole file or of an
+    appended dataset follows from per-chunk moments without its values.
+    """
+
+    def __init__(self, count: int = 0, mean: float = 0.0, m2: float = 0.0,
+                 minimum: float = math.inf, maximum: float = -math.inf):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.min = minimum
+        self.max = maximum
+
+    @classmethod
+    def of(cls, values) -> 'ParameterMoments':
+        values = np.asarray(values, dtype=np.float64)
+        if not len(values):
+            return cls()
+        mean = float(values.mean())
+        return cls(len(values), mean, float(np.square(values - mean).sum()),
+                   float(values.min()), float(values.max()))
+
+    @classmethod
+    def from_statistics(cls, count: int, stats: dict) -> 'ParameterMoments':
+        """Rebuild the moments of `count` values from their stored min, max, mean and std."""
+        if not count or stats['mean'] is None:
+            return cls()
+        m2 = stats['std'] ** 2 * (count - 1) if stats['std'] is not None else 0.0
+        return cls(count, stats['mean'], m2, stats['min'], stats['max'])
+
+    def merge(self, other: 'ParameterMoments') -> 'ParameterMoments':
+        count = self.count + other.count
+        if other.count:
+            delta = other.mean - self.mean
+            self.mean += delta * other.count / count
+            self.m2 += other.m2 + delta * delta * self.count * other.count / count
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+        self.count = count
+        return self
+
+    def std(self):
+        """Sample standard deviation, None for fewer than two values."""
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else None
+
+
+class RunningStats:
+    """
+    Running totals for the summary statistics, updated one chunk at a time.
+    Totals are counts, sums, minima and maxima, so two instances can be
+    merged. `types` maps each equipment type to its count and the sum, min
+    and max of every parameter, e.g. {'Pump': {'count': 3, 'flowrate_sum': ...}}.
+    `moments` and `sketches` hold a ParameterMoments and a KLLSketch per
+    parameter, from which statistics() derives the extended statistics;
+    both merge too, so no chunk's values are kept once it is counted.
+    """
+
+    def __init__(self, count: int = 0, sums: dict = None, types: dict = None,
+                 moments: dict = None, sketches: dict = None):
+        self.count = count
+        self.sums = {column: 0.0 for column in NUMERIC_COLUMNS}
+        self.sums.update(sums or {})
+        self.types = dict(types or {})
+        self.moments = {parameter: ParameterMoments() for parameter in PARAMETERS}
+        self.moments.update(moments or {})
+        self.sketches = {parameter: KLLSketch() for parameter in PARAMETERS}
+        self.sketches.update(sketches or {})
+
+    def update(self, df: pd.DataFrame) -> None:
+        self.count += len(df)
+        for column, parameter in zip(NUMERIC_COLUMNS, PARAMETERS):
+            values = df[column].to_numpy(dtype=np.float64)
+            self.sums[column] += float(values.sum())
+            self.moments[parameter].merge(ParameterMoments.of(values))
+            self.sketches[parameter].update(values)
+
+        grouped = df.groupby('Type', observed=True, sort=False)
+        counts = grouped.size()
+        aggregates = grouped[NUMERIC_COLUMNS].agg(['sum', 'min', 'max'])
+        for equipment_type, count in counts.items():
+            row = aggregates.loc[equipment_type]
+            chunk_type = {'count': int(count)}
+            for column, parameter in zip(NUMERIC_COLUMNS, PARAMETERS):
+                for aggregate in ('sum', 'min', 'max'):
+                    chunk_type[f'{parameter}_{aggregate}'] = float(row[(column, aggregate)])
+            self._merge_type(equipment_type, chunk_type)
+
+    def merge(self, other: 'RunningStats') -> 'RunningStats':
+        self.count += other.count
+        for column in NUMERIC_COLUMNS:
+            self.sums[column] += other.sums[column]
+        for parameter in PARAMETERS:
+            self.moments[parameter].merge(other.moments[parameter])
+            self.sketches[parameter].merge(other.sketches[parameter])
+        for equipment_type, aggregate in other.types.items():
+            self._merge_type(equipment_type, aggregate)
+        return self
+
+    def _merge_type(self, equipment_type: str, aggregate: dict) -> None:
+        if equipment_type in self.types:
+            aggregate = merge_type_aggregates(self.types[equipment_type], aggregate)
+        self.types[equipment_type] = aggregate
+
+    def mean(self, column: str) -> float:
+        if not self.count:
+            return 0.0
+        return self.sums[column] / self.count
+
+    def statistics(self) -> dict:
+        """
+        Extended statistics of every parameter: min, max, mean, sample
+        standard deviation and the PERCENTILES, which are read from the
+        quantile sketches (see analytics.sketches for their error bound).
+        Values are None where undefined (everything when no rows were
+        counted, std for a single row).
+        """
+        statistics = {}
+        for parameter in PARAMETERS:
+            moments = self.moments[parameter]
+            if not moments.count:
+                statistics[parameter] = dict.fromkeys(STATISTICS)
+                continue
+            stats = {'min': moments.min, 'max': moments.max, 'mean': moments.mean, 'std': moments.std()}
+            quantiles = self.sketches[parameter].quantiles([q / 100 for q in PERCENTILES])
+            for q, value in zip(PERCENTILES, quantiles):
+                stats[f'p{q}'] = value
+            statistics[parameter] = stats
+        return statistics
+
+    def serialized_sketches(self) -> dict:
+        return {parameter: sketch.to_bytes() for parameter, sketch in self.sketches.items()}
+
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+
+def open_csv_stream(source):
+    """
+    Wrap a binary file object so gzip or zstd content is decompressed on
+    the fly as it is read. The format is detected from the magic bytes;
+    anything else is returned unchanged as plain CSV.
+    """
+    head = source.read(4)
+    source.seek(0)
+    if head.startswith(GZIP_MAGIC):
+        return gzip.GzipFile(fileobj=source, mode='rb')
+    if head.startswith(ZSTD_MAGIC):
+        return zstandard.ZstdDecompressor().stream_reader(source, read_across_frames=True)
+    return source
+
+
+# Fixed schema for the required columns; any other columns are inferred
+PANDAS_DTYPES = {
+    'Equipment Name': str,
+    'Type': 'category',
+    'Flowrate': 'float64',
+    'Pressure': 'float64',
+    'Temperature': 'float64',
+}
+
+PYARROW_TYPES = {
+    'Equipment Name': pa.string(),
+    'Type': pa.dictionary(pa.int32(), pa.string()),
+    'Flowrate': pa.float64(),
+    'Pressure': pa.float64(),
+    'Temperature': pa.float64(),
+} if pa is not None else {}
+
+# Parser backends, fastest first
+ENGINES = ['pyarrow', 'c', 'python']
+
+# Bytes handed to each pyarrow parsing block
+PYARROW_BLOCK_SIZE = 8 * 1024 * 1024
+
+
+def available_engines() -> list:
+    return [engine for engine in ENGINES if engine != 'pyarrow' or pa_csv is not None]
+
+
+def resolve_engine(engine: str = 'auto') -> str:
+    """Pick the parser backend: the fastest available one for 'auto'."""
+    if engine in (None, 'auto'):
+        return available_engines()[0]
+    if engine not in available_engines():
+        raise ValueError(f"CSV engine {engine!r} is not available; choose from {available_engines()}")
+    return engine
+
+
+def iter_csv_chunks(source, chunksize: int, engine: str = 'auto'):
+    """
+    Stream a CSV file as validated DataFrame chunks of at most `chunksize` rows.
+    Yields (rows_read, chunk) pairs, where rows_read counts rows before cleaning.
+    Compressed input is decompressed as it streams through the parser, and
+    only one chunk is held in memory at a time.
+
+    `engine` selects the parser: 'pyarrow' (multithreaded Arrow reader),
+    'c' or 'python' (pandas), or 'auto' for the fastest available. Every
+    engine applies the same fixed schema: `Type` is categorical and the
+    numeric columns are float64. pyarrow and the python engine parse floats
+    exactly; pandas' C engine can differ from them in the last bits.
+    """
+    engine = resolve_engine(engine)
+    stream = open_csv_stream(source)
+    if engine == 'pyarrow':
+        frames = _iter_pyarrow_frames(stream, chunksize)
+    else:
+        frames = _iter_pandas_frames(stream, chunksize, engine)
+
+    for chunk in frames:
+        # Validate required columns
+        missing = set(REQUIRED_COLUMNS) - set(chunk.columns)
+        if missing:
+            raise ValueError(f"Missing required columns: {missing}")
+
+        # Clean and process data
+        rows_read = len(chunk)
+        chunk = chunk.dropna()
+        chunk[NUMERIC_COLUMNS] = chunk[NUMERIC_COLUMNS].astype('float64')
+        yield rows_read, chunk
+
+
+def _iter_pandas_frames(stream, chunksize: int, engine: str):
+    with pd.read_csv(stream, chunksize=chunksize, encoding='utf-8',
+                     dtype=PANDAS_DTYPES, engine=engine) as reader:
+        yield from reader
+
+
+def _iter_pyarrow_frames(stream, chunksize: int):
+    reader = pa_csv.open_csv(
+        stream,
+        read_options=pa_csv.ReadOptions(use_threads=True, block_size=PYARROW_BLOCK_SIZE),
+        convert_options=pa_csv.ConvertOptions(
+            column_types=PYARROW_TYPES,
+            # Match pandas, which treats empty fields as missing
+            strings_can_be_null=True,
+        ),
+    )
+    empty = True
+    for batch in reader:
+        for start in range(0, batch.num_rows, chunksize):
+            empty = False
+            yield batch.slice(start, chunksize).to_pandas()
+    if empty:
+        # Still surface the header so an empty file is validated
+        yield reader.schema.empty_table().to_pandas()
+
+
+def chunk_columns(chunk: pd.DataFrame) -> dict:
+    """Map a validated CSV chunk onto Equipment field names as NumPy arrays."""
+    return {
+        'name': chunk['Equipment Name'].astype(str).to_numpy(),
+        'equipment_type': chunk['Type'].astype(str).to_numpy(),
+        'flowrate': chunk['Flowrate'].to_numpy(),
+        'pressure': chunk['Pressure'].to_numpy(),
+        'temperature': chunk['Temperature'].to_numpy(),
+    }
+
+
+def parse_file(path: str, spool_path: str, chunksize: int, engine: str = 'auto') -> dict:
+    """
+    Parse a CSV file into a spool of Equipment column arrays, one pickled
+    chunk after another (see read_spool), and return its running totals,
+    which carry its extended statistics and quantile sketches. Used by
+    batch uploads: each file is parsed in a separate worker process, which
+    holds one chunk at a time and sends back only the totals.
+    """
+    start = time.perf_counter()
+    running = RunningStats()
+    rows_parsed = 0
+    with open(path, 'rb') as source, open(spool_path, 'wb') as spool:
+        for rows_read, chunk in iter_csv_chunks(source, chunksize, engine):
+            rows_parsed += rows_read
+            running.update(chunk)
+            pickle.dump(chunk_columns(chunk), spool, protocol=pickle.HIGHEST_PROTOCOL)
+    return {
+        'running': running,
+        'rows_parsed': rows_parsed,
+        'parse_seconds': time.perf_counter() - start,
+    }
+
+
+def read_spool(spool_path: str):
+    """Yield the column arrays parse_file spooled, a chunk at a time."""
+    with open(spool_path, 'rb') as spool:
+        while True:
+            try:
+                yield pickle.load(spool)
+            except EOFError:
+                return
@@ -6,11 +6,15 @@ from reportlab.lib.units import inch
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
 from reportlab.lib.enums import TA_CENTER
 
+from .storage import get_store
+
 
 def generate_pdf_report(dataset, type_distribution: dict) -> BytesIO:
     """Generate a PDF report for the dataset."""
     buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=0.5*inch)
+    # Invariant output (no timestamp or random document id) keeps the bytes
+    # identical between requests, as the response's ETag promises
+    doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=0.5*inch, invariant=1)
     
     styles = getSampleStyleSheet()
     title_style = ParagraphStyle(
@@ -92,25 +96,16 @@ def generate_pdf_report(dataset, type_distribution: dict) -> BytesIO:
     elements.append(Spacer(1, 30))
     elements.append(Paragraph("Equipment Details", heading_style))
     
-    # Status logic based on temperature (matches web frontend)
-    def get_status(temp):
-        if temp > 150:
-            return 'Offline'
-        elif temp >= 90:
-            return 'Warning'
-        else:
-            return 'Active'
-    
     eq_data = [['ID', 'Name', 'Type', 'Flowrate', 'Pressure', 'Temp', 'Status']]
-    for eq in dataset.equipment.all()[:20]:  # Limit to first 20
+    for eq in get_store(dataset).records(limit=20):  # Limit to first 20
         eq_data.append([
-            f'#{eq.id}',
-            eq.name, 
-            eq.equipment_type,
-            f'{eq.flowrate:.1f}',
-            f'{eq.pressure:.1f}',
-            f'{eq.temperature:.1f}',
-            get_status(eq.temperature)
+            f"#{eq['id']}",
+            eq['name'], 
+            eq['equipment_type'],
+            f"{eq['flowrate']:.1f}",
+            f"{eq['pressure']:.1f}",
+            f"{eq['temperature']:.1f}",
+            eq['status']
         ])
     
     eq_table = Table(eq_data, colWidths=[0.5*inch, 1.3*inch, 1*inch, 0.8*inch, 0.8*inch, 0.7*inch, 0.7*inch])
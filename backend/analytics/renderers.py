@@ -0,0 +1,158 @@
+import msgpack
+import orjson
+import pyarrow as pa
+import pyarrow.ipc as ipc
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+# orjson leaves these line separators raw; DRF escapes them so the output
+# stays a strict JavaScript subset
+_LINE_SEPARATORS = ((b'\xe2\x80\xa8', b'\\u2028'), (b'\xe2\x80\xa9', b'\\u2029'))
+
+# Arrow type of every equipment field a page can hold. Low-cardinality
+# text columns are dictionary-encoded: one small table of labels plus a
+# packed int32 code per row.
+COLUMN_TYPES = {
+    'id': pa.int64(),
+    'name': pa.string(),
+    'equipment_type': pa.dictionary(pa.int32(), pa.string()),
+    'flowrate': pa.float64(),
+    'pressure': pa.float64(),
+    'temperature': pa.float64(),
+    'status': pa.dictionary(pa.int32(), pa.string()),
+}
+# Pagination links carried alongside the columns
+PAGE_LINKS = ['next', 'previous']
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson, several times faster than the
+    standard library on large lists of rows. The output parses to the same
+    data as JSONRenderer's compact UTF-8 output, and matches it byte for
+    byte except for floats written with an exponent: orjson drops the
+    exponent's sign and padding and writes small values out in full
+    (`1e16` and `0.000025` where JSONRenderer writes `1e+16` and
+    `2.5e-05`). Types orjson does not know natively (and
+    datetimes, which DRF formats differently) go through DRF's encoder.
+    Indented output, as the browsable API asks for, falls back to
+    JSONRenderer.
+    """
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        if not self.compact or self.ensure_ascii or self.get_indent(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default=self.encoder_class().default, option=self.options)
+        for raw, escaped in _LINE_SEPARATORS:
+            if raw in ret:
+                ret = ret.replace(raw, escaped)
+        return ret
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Lets the streaming endpoint accept `Accept: application/x-ndjson`. The
+    rows themselves are streamed by the view; this only renders the other
+    payloads (validation errors, 404s) as a single JSON line.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return orjson.dumps(data, option=orjson.OPT_APPEND_NEWLINE)
+
+
+def page_table(rows: list, fields: list = None) -> pa.Table:
+    """
+    A page of equipment row dicts as an Arrow table, one column per field.
+    The columns follow `fields` when given, otherwise the keys of the rows
+    (every field for an empty page), so an empty page keeps its schema.
+    """
+    if fields is None:
+        fields = list(rows[0]) if rows else list(COLUMN_TYPES)
+    columns = {}
+    for field in fields:
+        values = [row[field] for row in rows]
+        column_type = COLUMN_TYPES[field]
+        if pa.types.is_dictionary(column_type):
+            columns[field] = pa.array(values, pa.string()).dictionary_encode()
+        else:
+            columns[field] = pa.array(values, column_type)
+    return pa.table(columns)
+
+
+class ColumnarRenderer(BaseRenderer):
+    """
+    Base for the binary column formats of paginated equipment pages. The
+    view lists the requested fields in the response's `fields` attribute.
+    Any other payload (validation errors, 404s) is sent as JSON, with the
+    response's content type switched to match.
+    """
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        response = (renderer_context or {}).get('response')
+        if not isinstance(data, dict) or 'results' not in data:
+            if response is not None:
+                response['Content-Type'] = ORJSONRenderer.media_type
+            return ORJSONRenderer().render(data)
+        table = page_table(data['results'], getattr(response, 'fields', None))
+        return self.encode(table, {link: data.get(link) for link in PAGE_LINKS})
+
+    def encode(self, table: pa.Table, links: dict) -> bytes:
+        raise NotImplementedError
+
+
+class ArrowIPCRenderer(ColumnarRenderer):
+    """
+    Apache Arrow IPC stream: a single record batch. Pagination links are
+    stored in the schema metadata.
+    """
+    media_type = 'application/vnd.apache.arrow.stream'
+    format = 'arrow'
+
+    def encode(self, table, links):
+        metadata = {link: url for link, url in links.items() if url is not None}
+        table = table.replace_schema_metadata(metadata)
+        sink = pa.BufferOutputStream()
+        with ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+
+class MessagePackRenderer(ColumnarRenderer):
+    """
+    MessagePack map of `length`, the pagination links and `columns`.
+    Numeric columns are raw little-endian arrays (`dtype`, `data`) that
+    numpy.frombuffer reads without copying; dictionary-encoded columns
+    add their `categories` to int32 codes; text columns are lists.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+
+    def encode(self, table, links):
+        columns = {}
+        for name, column in zip(table.column_names, table.columns):
+            column = column.combine_chunks()
+            if pa.types.is_dictionary(column.type):
+                columns[name] = {
+                    'dtype': '<i4',
+                    'data': column.indices.to_numpy().astype('<i4', copy=False).tobytes(),
+                    'categories': column.dictionary.to_pylist(),
+                }
+            elif pa.types.is_string(column.type):
+                columns[name] = {'dtype': 'str', 'values': column.to_pylist()}
+            else:
+                array = column.to_numpy()
+                array = array.astype(array.dtype.newbyteorder('<'), copy=False)
+                columns[name] = {'dtype': array.dtype.str, 'data': array.tobytes()}
+        return msgpack.packb({'length': table.num_rows, **links, 'columns': columns})
@@ -0,0 +1,126 @@
+"""
+Server-side cache of rendered dataset responses, in the 'responses' cache
+alias (see CACHES in settings for the backend choices and size bounds).
+
+Keys are scoped to the user and the dataset, and include the dataset's
+ETag and the full request path, so every query string and representation
+is cached separately. Each dataset also has a generation token in the key:
+invalidate_dataset() replaces it, which makes every cached response of
+that dataset unreachable at once (they age out through the backend's
+eviction) without touching other datasets. A generation evicted from the
+cache is replaced by a fresh one, so old entries can never reappear.
+
+Hit and miss counts are kept in the same cache, so with a shared backend
+they cover every worker. See `manage.py response_cache_stats`, or for the
+per-process locmem backend, GET /api/cache-stats/ on the server itself.
+"""
+import hashlib
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.template.response import SimpleTemplateResponse
+
+from .conditional import dataset_etag
+
+RESPONSE_CACHE = 'responses'
+KEY_PREFIX = 'analytics:response'
+HITS_KEY = f'{KEY_PREFIX}:hits'
+MISSES_KEY = f'{KEY_PREFIX}:misses'
+# Response headers stored with the body and restored on a hit
+STORED_HEADERS = ['Content-Disposition']
+
+
+def _generation_key(dataset_id: int) -> str:
+    return f'{KEY_PREFIX}:generation:{dataset_id}'
+
+
+def _generation(cache, dataset_id: int) -> str:
+    generation = cache.get(_generation_key(dataset_id))
+    if generation is None:
+        cache.add(_generation_key(dataset_id), uuid.uuid4().hex, None)
+        generation = cache.get(_generation_key(dataset_id))
+    return generation
+
+
+def invalidate_dataset(dataset_id: int) -> None:
+    """Drop every cached response of a dataset, for all users."""
+    caches[RESPONSE_CACHE].set(_generation_key(dataset_id), uuid.uuid4().hex, None)
+
+
+def _count(cache, key: str) -> None:
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Evicted between add() and incr(); the count restarts
+            pass
+
+
+def cache_stats() -> dict:
+    """Hit and miss counts since the last reset."""
+    counts = caches[RESPONSE_CACHE].get_many([HITS_KEY, MISSES_KEY])
+    hits, misses = counts.get(HITS_KEY, 0), counts.get(MISSES_KEY, 0)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / (hits + misses) if hits + misses else None,
+    }
+
+
+def reset_cache_stats() -> None:
+    caches[RESPONSE_CACHE].delete_many([HITS_KEY, MISSES_KEY])
+
+
+def _response_key(cache, request, dataset) -> str:
+    digest = hashlib.sha256('|'.join([
+        dataset_etag(dataset, request.accepted_media_type), request.get_full_path(),
+    ]).encode()).hexdigest()
+    return f'{KEY_PREFIX}:{request.user.pk}:{dataset.pk}:{_generation(cache, dataset.pk)}:{digest}'
+
+
+def _store(cache, key: str, response) -> None:
+    if response.streaming or len(response.content) > settings.ANALYTICS_RESPONSE_CACHE_MAX_BYTES:
+        return
+    cache.set(key, {
+        'content': response.content,
+        'content_type': response['Content-Type'],
+        'headers': [(header, response[header]) for header in STORED_HEADERS if header in response],
+    })
+
+
+def cached_response(view):
+    """
+    Decorate a DatasetViewSet method so successful responses are cached
+    and served from the cache until the dataset changes. Responses carry
+    X-Cache: HIT or MISS.
+    """
+    @wraps(view)
+    def wrapper(viewset, request, *args, **kwargs):
+        # Browsable API pages embed per-session form state
+        if request.accepted_renderer.format == 'api':
+            return view(viewset, request, *args, **kwargs)
+        cache = caches[RESPONSE_CACHE]
+        key = _response_key(cache, request, viewset.get_object())
+        entry = cache.get(key)
+        if entry is not None:
+            _count(cache, HITS_KEY)
+            response = HttpResponse(entry['content'], content_type=entry['content_type'])
+            for header, value in entry['headers']:
+                response[header] = value
+            response['X-Cache'] = 'HIT'
+            return response
+
+        _count(cache, MISSES_KEY)
+        response = view(viewset, request, *args, **kwargs)
+        response['X-Cache'] = 'MISS'
+        if response.status_code == 200:
+            # API responses are only rendered after the view returns
+            if isinstance(response, SimpleTemplateResponse):
+                response.add_post_render_callback(lambda rendered: _store(cache, key, rendered))
+            else:
+                _store(cache, key, response)
+        return response
+    return wrapper
@@ -1,5 +1,29 @@
+import math
+
 from rest_framework import serializers
-from .models import Dataset, Equipment
+from django.conf import settings
+from .models import Dataset, Equipment, IngestJob, UploadSession
+from .charts import CORRELATION_METHODS
+from .parsing import PARAMETERS
+from .services import get_type_distribution
+from .storage import RECORD_FIELDS
+from .streaming import OUTPUT_FORMATS
+
+
+# Compressed uploads are recognised by their magic bytes when parsed
+CSV_EXTENSIONS = ['.csv', '.csv.gz', '.csv.zst', '.gz', '.zst']
+
+# Also accept common CSV MIME types
+CSV_CONTENT_TYPES = [
+    'text/csv',
+    'application/csv',
+    'application/vnd.ms-excel',
+    'text/plain',
+    'application/octet-stream',  # Sometimes browsers send this
+    'application/gzip',
+    'application/x-gzip',
+    'application/zstd',
+]
 
 
 class EquipmentSerializer(serializers.ModelSerializer):
@@ -9,7 +33,8 @@ class EquipmentSerializer(serializers.ModelSerializer):
 
 
 class DatasetSerializer(serializers.ModelSerializer):
-    equipment_count = serializers.SerializerMethodField()
+    # Kept up to date by ingest and append, so listing needs no COUNT per dataset
+    equipment_count = serializers.IntegerField(source='total_count', read_only=True)
 
     class Meta:
         model = Dataset
@@ -19,12 +44,10 @@ class DatasetSerializer(serializers.ModelSerializer):
             'equipment_count'
         ]
 
-    def get_equipment_count(self, obj):
-        return obj.equipment.count()
-
 
 class DatasetDetailSerializer(serializers.ModelSerializer):
-    equipment = EquipmentSerializer(many=True, read_only=True)
+    # Rows are fetched page by page from the equipment endpoint
+    equipment_url = serializers.HyperlinkedIdentityField(view_name='dataset-equipment')
     type_distribution = serializers.SerializerMethodField()
 
     class Meta:
@@ -32,17 +55,24 @@ class DatasetDetailSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'name', 'uploaded_at', 'total_count',
             'avg_flowrate', 'avg_pressure', 'avg_temperature',
-            'equipment', 'type_distribution'
+            'equipment_url', 'type_distribution'
         ]
 
     def get_type_distribution(self, obj):
         """Returns count of equipment grouped by type."""
-        from django.db.models import Count
-        return list(
-            obj.equipment.values('equipment_type')
-            .annotate(count=Count('id'))
-            .order_by('equipment_type')
-        )
+        return [
+            {'equipment_type': equipment_type, 'count': count}
+            for equipment_type, count in get_type_distribution(obj).items()
+        ]
+
+
+class IngestJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = IngestJob
+        fields = [
+            'id', 'dataset', 'stage', 'rows_parsed', 'rows_inserted',
+            'error', 'created_at', 'updated_at', 'finished_at'
+        ]
 
 
 class UploadSerializer(serializers.Serializer):
@@ -51,23 +81,164 @@ class UploadSerializer(serializers.Serializer):
     def validate_file(self, value):
         # Check file extension (case-insensitive)
         filename = value.name.lower() if value.name else ''
-        valid_extensions = ['.csv']
-        
-        # Also accept common CSV MIME types
-        valid_content_types = [
-            'text/csv',
-            'application/csv',
-            'application/vnd.ms-excel',
-            'text/plain',
-            'application/octet-stream',  # Sometimes browsers send this
-        ]
-        
-        has_valid_extension = any(filename.endswith(ext) for ext in valid_extensions)
-        has_valid_content_type = value.content_type in valid_content_types
+        has_valid_extension = any(filename.endswith(ext) for ext in CSV_EXTENSIONS)
+        has_valid_content_type = value.content_type in CSV_CONTENT_TYPES
         
         if not has_valid_extension and not has_valid_content_type:
             raise serializers.ValidationError(
-                f"Only CSV files are allowed. Got: {value.name} ({value.content_type})"
+                f"Only CSV files (optionally gzip or zstd compressed) are allowed. "
+                f"Got: {value.name} ({value.content_type})"
             )
         return value
 
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    chunk_size = serializers.IntegerField(required=False, min_value=1)
+
+    class Meta:
+        model = UploadSession
+        fields = [
+            'id', 'filename', 'total_size', 'chunk_size', 'offset',
+            'next_chunk', 'status', 'job', 'created_at', 'updated_at'
+        ]
+        read_only_fields = ['offset', 'next_chunk', 'status', 'job']
+
+    def validate_filename(self, value):
+        if not any(value.lower().endswith(ext) for ext in CSV_EXTENSIONS):
+            raise serializers.ValidationError(
+                f"Only CSV files (optionally gzip or zstd compressed) are allowed. Got: {value}"
+            )
+        return value
+
+    def validate_total_size(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("total_size must be positive")
+        return value
+
+    def validate_chunk_size(self, value):
+        # Chunks are streamed to disk, but keep each request reasonably sized
+        return min(value, settings.ANALYTICS_UPLOAD_MAX_CHUNK_SIZE)
+
+    def create(self, validated_data):
+        validated_data.setdefault('chunk_size', settings.ANALYTICS_UPLOAD_MAX_CHUNK_SIZE)
+        return super().create(validated_data)
+
+
+class CommaSeparatedField(serializers.CharField):
+    """A comma-separated query parameter, parsed into a list of `child` values."""
+
+    def __init__(self, child, **kwargs):
+        self.child = child
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        items = [item.strip() for item in super().to_internal_value(data).split(',') if item.strip()]
+        if not items:
+            raise serializers.ValidationError("Provide at least one value.")
+        return [self.child.run_validation(item) for item in items]
+
+
+def validate_finite(value):
+    # FloatField accepts 'nan' and 'inf', which match no row
+    if not math.isfinite(value):
+        raise serializers.ValidationError("A finite number is required.")
+
+
+def parameters_field(**kwargs):
+    return CommaSeparatedField(
+        serializers.ChoiceField(choices=PARAMETERS), required=False,
+        default=list(PARAMETERS), **kwargs
+    )
+
+
+class ChartDataQuerySerializer(serializers.Serializer):
+    """Query parameters of the chart-data endpoint."""
+    bins = serializers.IntegerField(required=False, default=30, min_value=1)
+    points = serializers.IntegerField(required=False, default=1000, min_value=3)
+    parameters = parameters_field()
+
+    def validate_bins(self, value):
+        return min(value, settings.ANALYTICS_CHART_MAX_BINS)
+
+    def validate_points(self, value):
+        return min(value, settings.ANALYTICS_CHART_MAX_POINTS)
+
+
+class CorrelationQuerySerializer(serializers.Serializer):
+    """Query parameters of the correlation endpoint."""
+    method = serializers.ChoiceField(choices=CORRELATION_METHODS, required=False, default='pearson')
+    group_by = serializers.ChoiceField(choices=['equipment_type'], required=False, allow_blank=True, default='')
+    sample = serializers.IntegerField(required=False, default=1000, min_value=0)
+    seed = serializers.IntegerField(required=False, default=0, min_value=0)
+
+    def validate_sample(self, value):
+        return min(value, settings.ANALYTICS_CHART_MAX_POINTS)
+
+
+class QuantileQuerySerializer(serializers.Serializer):
+    """Query parameters of the quantiles endpoint."""
+    ids = CommaSeparatedField(serializers.IntegerField(), required=False)
+    parameters = parameters_field()
+    q = CommaSeparatedField(
+        serializers.FloatField(min_value=0, max_value=1, validators=[validate_finite]),
+        required=False, default=[0.5, 0.9, 0.95, 0.99]
+    )
+
+
+# Sort keys of the equipment endpoint; a leading '-' sorts descending
+ORDERING_KEYS = [key for field in RECORD_FIELDS for key in (field, f'-{field}')]
+
+
+class EquipmentQuerySerializer(serializers.Serializer):
+    """Query parameters of the equipment endpoint."""
+    fields = CommaSeparatedField(
+        serializers.ChoiceField(choices=RECORD_FIELDS), required=False, default=list(RECORD_FIELDS)
+    )
+    status = serializers.ChoiceField(choices=Equipment.Status.choices, required=False)
+    equipment_type = CommaSeparatedField(serializers.CharField(max_length=100), required=False)
+    name_prefix = serializers.CharField(required=False, max_length=255)
+    flowrate_min = serializers.FloatField(required=False, validators=[validate_finite])
+    flowrate_max = serializers.FloatField(required=False, validators=[validate_finite])
+    pressure_min = serializers.FloatField(required=False, validators=[validate_finite])
+    pressure_max = serializers.FloatField(required=False, validators=[validate_finite])
+    temperature_min = serializers.FloatField(required=False, validators=[validate_finite])
+    temperature_max = serializers.FloatField(required=False, validators=[validate_finite])
+    ordering = CommaSeparatedField(
+        serializers.ChoiceField(choices=ORDERING_KEYS), required=False, default=['id']
+    )
+
+    def validate_fields(self, value):
+        # The id is always returned; pages are keyed on it
+        return ['id'] + [field for field in dict.fromkeys(value) if field != 'id']
+
+    def validate_ordering(self, value):
+        ordering, seen = [], set()
+        for key in value:
+            field = key.lstrip('-')
+            if field in seen:
+                continue
+            seen.add(field)
+            ordering.append(key)
+            if field == 'id':
+                break  # ids are unique, so later keys never apply
+        else:
+            # A unique last key keeps the order, and so the pages, stable.
+            # It runs the same way as the key before it, so a descending sort
+            # reads the (dataset, key) index backwards rather than sorting.
+            ordering.append('-id' if ordering and ordering[-1].startswith('-') else 'id')
+        return ordering
+
+    def validate(self, attrs):
+        for parameter in PARAMETERS:
+            low, high = attrs.get(f'{parameter}_min'), attrs.get(f'{parameter}_max')
+            if low is not None and high is not None and low > high:
+                raise serializers.ValidationError({
+                    f'{parameter}_min': f"Must not be greater than {parameter}_max."
+                })
+        return attrs
+
+
+class EquipmentStreamQuerySerializer(EquipmentQuerySerializer):
+    """Query parameters of the streaming equipment endpoint."""
+    output = serializers.ChoiceField(choices=list(OUTPUT_FORMATS), default='json')
@@ -1,67 +1,389 @@
-import pandas as pd
-from io import StringIO
-from .models import Dataset, Equipment
+import hashlib
+import sys
+from functools import partial
+from io import BytesIO
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from .models import Dataset, DatasetStatistics, Equipment, EquipmentTypeSummary, ParameterSketch
+from .bulk_insert import insert_equipment, last_inserted_ids
+from .response_cache import invalidate_dataset
+from .parsing import (
+    NUMERIC_COLUMNS, PARAMETERS, ParameterMoments, RunningStats, chunk_columns, iter_csv_chunks,
+    read_spool,
+)
+from .sketches import KLLSketch
+from .status import classify
+from .storage import ColumnarStore, ColumnarWriter, compact_columnar, get_store
 
 
-def parse_csv_and_save(dataset: Dataset, file_content: bytes) -> dict:
+def parse_csv_and_save(dataset: Dataset, source=None, chunksize: int = None, progress=None) -> dict:
     """
     Parse CSV file content and save equipment data to database.
+
+    The file is streamed in chunks of `chunksize` rows (defaults to
+    settings.ANALYTICS_CSV_CHUNK_SIZE); each chunk is validated and inserted
+    in its own transaction before the next one is read, and folded into
+    mergeable running totals and quantile sketches, so memory does not
+    grow with the size of the file. Callers are responsible for deleting the
+    dataset if parsing fails part way through.
+    `source` may be raw bytes or a binary file object; when omitted the
+    dataset's stored file is read. `progress`, if given, is called after
+    every chunk with the running (rows_parsed, rows_inserted) totals.
+    Returns summary statistics.
+    """
+    chunksize = chunksize or settings.ANALYTICS_CSV_CHUNK_SIZE
+    if isinstance(source, bytes):
+        source = BytesIO(source)
+
+    running = RunningStats()
+    if source is None:
+        with dataset.file.open('rb') as stored_file:
+            _ingest_chunks(dataset, stored_file, chunksize, running, progress, _open_writer(dataset))
+    else:
+        _ingest_chunks(dataset, source, chunksize, running, progress, _open_writer(dataset))
+    return _save_summary(dataset, running)
+
+
+def append_csv(dataset: Dataset, source, chunksize: int = None) -> dict:
+    """
+    Append the rows of another CSV file to an existing dataset.
+
+    Only the new rows are read: their counts, sums, moments, per-type
+    aggregates and quantile sketches are merged into the ones stored on the
+    dataset, so the cost of an append depends on the size of the new data
+    alone. The append is a single transaction; if any row fails validation
+    nothing is added.
+    Returns summary statistics for the whole dataset.
+    """
+    chunksize = chunksize or settings.ANALYTICS_CSV_CHUNK_SIZE
+    if isinstance(source, bytes):
+        source = BytesIO(source)
+
+    writer = None
+    try:
+        with transaction.atomic():
+            # Serialise concurrent appends to the same dataset
+            dataset = Dataset.objects.select_for_update().get(pk=dataset.pk)
+
+            # A dataset read from the row store keeps being read from it, so
+            # only extend the columnar copy when there is one to extend
+            if isinstance(get_store(dataset), ColumnarStore) or not dataset.total_count:
+                writer = _open_writer(dataset)
+
+            appended = RunningStats()
+            # The new segment is published when the transaction commits
+            _ingest_chunks(dataset, source, chunksize, appended, None, writer)
+            running = _stored_stats(dataset, appended.types).merge(appended)
+            dataset.revision += 1
+            transaction.on_commit(partial(invalidate_dataset, dataset.pk))
+            if writer is not None:
+                # Every append adds a segment; merge them once there are too many
+                transaction.on_commit(partial(compact_columnar, dataset.pk))
+            # The content no longer matches the uploaded file
+            dataset.content_hash = ''
+            return _save_summary(dataset, running)
+    except BaseException:
+        # Rolled back, or the commit failed: the segment was never published
+        if writer is not None:
+            writer.abort()
+        raise
+
+
+def save_spooled_dataset(dataset: Dataset, spool_path: str, running: RunningStats, progress=None) -> dict:
+    """
+    Store the rows parsing.parse_file spooled for a dataset, one chunk per
+    transaction, along with the running totals of the parse. Callers are
+    responsible for deleting the dataset if this fails part way through.
+    `progress`, if given, is called after every chunk with the number of
+    rows inserted so far.
     Returns summary statistics.
     """
-    # Read CSV content
-    content = file_content.decode('utf-8')
-    df = pd.read_csv(StringIO(content))
-    
-    # Validate required columns
-    required_columns = ['Equipment Name', 'Type', 'Flowrate', 'Pressure', 'Temperature']
-    missing = set(required_columns) - set(df.columns)
-    if missing:
-        raise ValueError(f"Missing required columns: {missing}")
-    
-    # Clean and process data
-    df = df.dropna()
-    
-    # Create Equipment objects
-    equipment_objects = []
-    for _, row in df.iterrows():
-        equipment_objects.append(Equipment(
-            dataset=dataset,
-            name=row['Equipment Name'],
-            equipment_type=row['Type'],
-            flowrate=float(row['Flowrate']),
-            pressure=float(row['Pressure']),
-            temperature=float(row['Temperature'])
-        ))
-    
-    # Bulk create
-    Equipment.objects.bulk_create(equipment_objects)
-    
+    writer = _open_writer(dataset)
+    rows_inserted = 0
+    try:
+        for columns in read_spool(spool_path):
+            _store_chunk(dataset, columns, writer)
+            rows_inserted += len(columns['name'])
+            if progress is not None:
+                progress(rows_inserted)
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+    if writer is not None:
+        writer.close()
+        transaction.on_commit(writer.publish)
+    return _save_summary(dataset, running)
+
+
+def _stored_stats(dataset: Dataset, types) -> RunningStats:
+    """
+    The dataset's stored totals, moments and sketches, with the per-type
+    aggregates of `types`.
+    """
+    statistics = DatasetStatistics.objects.filter(dataset=dataset).first()
+    return RunningStats(
+        count=dataset.total_count,
+        sums={column: getattr(dataset, f'sum_{column.lower()}') for column in NUMERIC_COLUMNS},
+        types={
+            summary.equipment_type: summary.aggregates()
+            for summary in dataset.type_summaries.filter(equipment_type__in=list(types))
+        },
+        moments={
+            parameter: ParameterMoments.from_statistics(dataset.total_count, stats)
+            for parameter, stats in statistics.as_dict().items()
+        } if statistics is not None else None,
+        sketches={
+            parameter: KLLSketch.from_bytes(sketch)
+            for parameter, sketch in dataset.sketches.values_list('parameter', 'sketch')
+        },
+    )
+
+
+def _save_summary(dataset: Dataset, running: RunningStats) -> dict:
+    _save_statistics(dataset, running.statistics())
+    _save_sketches(dataset, running.serialized_sketches())
+
     # Calculate and save statistics
     stats = {
-        'total_count': len(df),
-        'avg_flowrate': df['Flowrate'].mean(),
-        'avg_pressure': df['Pressure'].mean(),
-        'avg_temperature': df['Temperature'].mean(),
+        'total_count': running.count,
+        'avg_flowrate': running.mean('Flowrate'),
+        'avg_pressure': running.mean('Pressure'),
+        'avg_temperature': running.mean('Temperature'),
     }
-    
+
     # Update dataset with stats
     dataset.total_count = stats['total_count']
     dataset.avg_flowrate = round(stats['avg_flowrate'], 2)
     dataset.avg_pressure = round(stats['avg_pressure'], 2)
     dataset.avg_temperature = round(stats['avg_temperature'], 2)
+    for column in NUMERIC_COLUMNS:
+        setattr(dataset, f'sum_{column.lower()}', running.sums[column])
     dataset.save()
-    
+
+    # Only the types present in `running` are written; others keep their aggregates
+    EquipmentTypeSummary.objects.bulk_create(
+        [
+            EquipmentTypeSummary(dataset=dataset, equipment_type=equipment_type, **aggregates)
+            for equipment_type, aggregates in running.types.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['dataset', 'equipment_type'],
+        update_fields=EquipmentTypeSummary.AGGREGATE_FIELDS,
+    )
+
     return stats
 
 
+def _save_statistics(dataset: Dataset, statistics: dict) -> None:
+    fields = {
+        f'{parameter}_{stat}': value
+        for parameter, values in statistics.items()
+        for stat, value in values.items()
+    }
+    DatasetStatistics.objects.bulk_create(
+        [DatasetStatistics(dataset=dataset, **fields)],
+        update_conflicts=True,
+        unique_fields=['dataset'],
+        update_fields=list(fields),
+    )
+
+
+def _save_sketches(dataset: Dataset, sketches: dict) -> None:
+    ParameterSketch.objects.bulk_create(
+        [
+            ParameterSketch(dataset=dataset, parameter=parameter, sketch=sketch)
+            for parameter, sketch in sketches.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['dataset', 'parameter'],
+        update_fields=['sketch'],
+    )
+
+
+def _open_writer(dataset: Dataset):
+    # Optionally keep a columnar copy alongside the Equipment rows
+    if settings.ANALYTICS_STORAGE_BACKEND == ColumnarStore.name:
+        return ColumnarWriter(dataset.id)
+    return None
+
+
+def _store_chunk(dataset: Dataset, columns: dict, writer) -> None:
+    with transaction.atomic():
+        insert_equipment(dataset.id, {**columns, 'status': classify(columns['temperature'])})
+        if writer is not None:
+            ids = last_inserted_ids(dataset.id, len(columns['name']))
+    if writer is not None:
+        writer.write(ids, columns)
+
+
+def _ingest_chunks(dataset: Dataset, source, chunksize: int, running: RunningStats, progress, writer) -> None:
+    """Store every chunk of `source`, counting it into `running`."""
+    rows_parsed = 0
+    try:
+        for rows_read, chunk in iter_csv_chunks(source, chunksize, settings.ANALYTICS_CSV_ENGINE):
+            columns = chunk_columns(chunk)
+            _store_chunk(dataset, columns, writer)
+            rows_parsed += rows_read
+            running.update(chunk)
+            if progress is not None:
+                progress(rows_parsed, running.count)
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+    if writer is not None:
+        writer.close()
+        # Readers see the segment once its rows are committed
+        transaction.on_commit(writer.publish)
+
+
+def file_digest(uploaded_file) -> str:
+    """SHA-256 hex digest of a Django file, read chunk by chunk."""
+    hasher = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        hasher.update(chunk)
+    uploaded_file.seek(0)
+    return hasher.hexdigest()
+
+
+def enforce_dataset_limit(user, limit: int = 5) -> None:
+    """Delete older datasets beyond the limit."""
+    datasets = Dataset.objects.filter(user=user, is_ready=True).order_by('-uploaded_at')
+    if datasets.count() > limit:
+        for old_dataset in datasets[limit:]:
+            old_dataset.delete()
+
+
 def get_type_distribution(dataset: Dataset) -> dict:
-    """Get equipment count by type for a dataset."""
-    from django.db.models import Count
-    
-    distribution = (
-        dataset.equipment
-        .values('equipment_type')
-        .annotate(count=Count('id'))
-        .order_by('equipment_type')
+    """Get equipment count by type for a dataset, from its type summary."""
+    return dict(dataset.type_summaries.values_list('equipment_type', 'count'))
+
+
+def get_type_summary(dataset: Dataset) -> list:
+    """Count and per-parameter mean, min and max for every equipment type."""
+    return [summary.as_dict() for summary in dataset.type_summaries.all()]
+
+
+def get_status_counts(dataset: Dataset) -> dict:
+    """Equipment count per status, counted from the (dataset, status) index."""
+    counts = dict.fromkeys(Equipment.Status.values, 0)
+    counts.update(
+        dataset.equipment.order_by().values_list('status').annotate(count=Count('status'))
     )
-    return {item['equipment_type']: item['count'] for item in distribution}
+    return counts
+
+
+def _prefix_upper_bound(prefix: str):
+    """The smallest string above every string starting with `prefix`, or None."""
+    prefix = prefix.rstrip(chr(sys.maxunicode))
+    if not prefix:
+        return None
+    successor = ord(prefix[-1]) + 1
+    # Surrogates cannot be encoded for the database; U+E000 follows U+D7FF
+    if 0xD800 <= successor <= 0xDFFF:
+        successor = 0xE000
+    return prefix[:-1] + chr(successor)
+
+
+def filter_equipment(queryset, params: dict):
+    """
+    Apply the equipment query API (validated by EquipmentQuerySerializer)
+    to an equipment queryset: status, type, name prefix and parameter
+    range filters, then the requested ordering. Every filter and sort key
+    has a (dataset, field) index, so a dataset's matching rows are read
+    from an index range rather than by scanning the dataset.
+    """
+    if 'status' in params:
+        queryset = queryset.filter(status=params['status'])
+    if 'equipment_type' in params:
+        queryset = queryset.filter(equipment_type__in=params['equipment_type'])
+    if params.get('name_prefix'):
+        # A range rather than LIKE: SQLite's LIKE is case-insensitive and
+        # cannot use the (dataset, name) index
+        queryset = queryset.filter(name__gte=params['name_prefix'])
+        upper = _prefix_upper_bound(params['name_prefix'])
+        if upper is not None:
+            queryset = queryset.filter(name__lt=upper)
+    for parameter in PARAMETERS:
+        if f'{parameter}_min' in params:
+            queryset = queryset.filter(**{f'{parameter}__gte': params[f'{parameter}_min']})
+        if f'{parameter}_max' in params:
+            queryset = queryset.filter(**{f'{parameter}__lte': params[f'{parameter}_max']})
+    return queryset.order_by(*params.get('ordering', ['id']))
+
+
+def compare_datasets(datasets: list, baseline: Dataset) -> list:
+    """
+    Side-by-side summaries of `datasets` with deltas against `baseline`,
+    built from the precomputed summaries: the type and status breakdowns
+    of every dataset are read in one query each, however many are compared.
+    Expects the datasets to have their statistics select_related.
+    """
+    ids = [dataset.pk for dataset in datasets]
+    type_distributions = {pk: {} for pk in ids}
+    for dataset_id, equipment_type, count in (
+        EquipmentTypeSummary.objects.filter(dataset_id__in=ids)
+        .values_list('dataset_id', 'equipment_type', 'count')
+    ):
+        type_distributions[dataset_id][equipment_type] = count
+    status_counts = {pk: dict.fromkeys(Equipment.Status.values, 0) for pk in ids}
+    for dataset_id, equipment_status, count in (
+        Equipment.objects.filter(dataset_id__in=ids).order_by()
+        .values_list('dataset_id', 'status').annotate(count=Count('status'))
+    ):
+        status_counts[dataset_id][equipment_status] = count
+
+    summary_fields = ['total_count', 'avg_flowrate', 'avg_pressure', 'avg_temperature']
+    base_types = type_distributions[baseline.pk]
+    results = []
+    for dataset in datasets:
+        statistics = getattr(dataset, 'statistics', None)
+        types = type_distributions[dataset.pk]
+        results.append({
+            'id': dataset.pk,
+            'name': dataset.name,
+            'uploaded_at': dataset.uploaded_at,
+            **{field: getattr(dataset, field) for field in summary_fields},
+            'statistics': statistics.as_dict() if statistics is not None else None,
+            'type_distribution': types,
+            'status_counts': status_counts[dataset.pk],
+            'deltas': {
+                **{
+                    field: round(getattr(dataset, field) - getattr(baseline, field), 2)
+                    for field in summary_fields
+                },
+                'type_distribution': {
+                    equipment_type: types.get(equipment_type, 0) - base_types.get(equipment_type, 0)
+                    for equipment_type in sorted(set(types) | set(base_types))
+                },
+            },
+        })
+    return results
+
+
+def merge_quantiles(datasets, parameters: list, qs: list) -> dict:
+    """
+    Approximate quantiles `qs` of each parameter over all rows of
+    `datasets` (a queryset), from their merged KLL sketches. Reads one row
+    per dataset and parameter; no Equipment rows are touched.
+    """
+    merged = {parameter: KLLSketch() for parameter in parameters}
+    dataset_ids = set()
+    for dataset_id, parameter, sketch in (
+        ParameterSketch.objects.filter(dataset__in=datasets, parameter__in=parameters)
+        .values_list('dataset_id', 'parameter', 'sketch')
+    ):
+        dataset_ids.add(dataset_id)
+        merged[parameter].merge(KLLSketch.from_bytes(sketch))
+    return {
+        'datasets': sorted(dataset_ids),
+        'parameters': {
+            parameter: {
+                'count': sketch.n,
+                'quantiles': dict(zip(map(str, qs), sketch.quantiles(qs))),
+            }
+            for parameter, sketch in merged.items()
+        },
+    }
@@ -0,0 +1,26 @@
+from django.db.models.signals import post_delete, post_migrate
+from django.dispatch import receiver
+
+from .models import Dataset
+from .response_cache import invalidate_dataset
+from .status import sync_status_thresholds
+from .storage import delete_columnar
+
+
+@receiver(post_delete, sender=Dataset)
+def remove_columnar_copy(sender, instance, **kwargs):
+    """Remove a deleted dataset's columnar segments from disk."""
+    delete_columnar(instance.pk)
+
+
+@receiver(post_delete, sender=Dataset)
+def invalidate_cached_responses(sender, instance, **kwargs):
+    """Drop a deleted dataset's cached responses."""
+    invalidate_dataset(instance.pk)
+
+
+@receiver(post_migrate)
+def reclassify_equipment(sender, **kwargs):
+    """Reclassify stored statuses if the thresholds changed since the last run."""
+    if sender.name == 'analytics':
+        sync_status_thresholds()
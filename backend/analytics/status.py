@@ -0,0 +1,80 @@
+"""
+Equipment status, derived from temperature. Active below the warning
+threshold, Warning from it up to the offline threshold, Offline above it.
+Thresholds come from settings so each deployment can tune them; stored
+statuses are reclassified when they change.
+"""
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from .models import Dataset, Equipment, StatusThresholds
+
+
+def classify(temperature: np.ndarray) -> np.ndarray:
+    """Status of every row of a temperature column, as a string array."""
+    temperature = np.asarray(temperature, dtype=np.float64)
+    return np.select(
+        [
+            temperature > settings.ANALYTICS_STATUS_OFFLINE_TEMPERATURE,
+            temperature >= settings.ANALYTICS_STATUS_WARNING_TEMPERATURE,
+        ],
+        [Equipment.Status.OFFLINE.value, Equipment.Status.WARNING.value],
+        default=Equipment.Status.ACTIVE.value,
+    )
+
+
+def status_expression() -> Case:
+    """The same classification as a database expression, for bulk updates."""
+    return Case(
+        When(temperature__gt=settings.ANALYTICS_STATUS_OFFLINE_TEMPERATURE,
+             then=Value(Equipment.Status.OFFLINE)),
+        When(temperature__gte=settings.ANALYTICS_STATUS_WARNING_TEMPERATURE,
+             then=Value(Equipment.Status.WARNING)),
+        default=Value(Equipment.Status.ACTIVE),
+    )
+
+
+def recompute_status(queryset=None) -> int:
+    """
+    Reclassify equipment after the thresholds change, in a single UPDATE
+    statement. Only rows whose status changes are written. Their datasets
+    get a new revision, which changes their ETags and so the keys of their
+    cached responses in every process. Reclassifying every row also records
+    the thresholds as the ones the stored statuses follow. Returns the
+    number of rows updated.
+    """
+    everything = queryset is None
+    queryset = Equipment.objects.all() if queryset is None else queryset
+    changed = queryset.alias(new_status=status_expression()).exclude(status=F('new_status'))
+    with transaction.atomic():
+        Dataset.objects.filter(pk__in=changed.values('dataset')).update(
+            revision=F('revision') + 1, updated_at=timezone.now()
+        )
+        updated = changed.update(status=status_expression())
+        if everything:
+            thresholds = _configured_thresholds()
+            if not StatusThresholds.objects.filter(pk=1).update(**thresholds, updated_at=timezone.now()):
+                StatusThresholds.objects.create(pk=1, **thresholds)
+    return updated
+
+
+def sync_status_thresholds() -> int:
+    """
+    Reclassify every row if the configured thresholds differ from the ones
+    the stored statuses were computed with. Run after migrations and when a
+    server process starts. Returns the number of rows updated.
+    """
+    stored = StatusThresholds.objects.filter(pk=1).values(*_configured_thresholds()).first()
+    if stored == _configured_thresholds():
+        return 0
+    return recompute_status()
+
+
+def _configured_thresholds() -> dict:
+    return {
+        'warning_temperature': settings.ANALYTICS_STATUS_WARNING_TEMPERATURE,
+        'offline_temperature': settings.ANALYTICS_STATUS_OFFLINE_TEMPERATURE,
+    }
@@ -0,0 +1,287 @@
+import os
+import shutil
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.ipc as ipc
+from django.conf import settings
+
+from .models import Dataset, Equipment
+
+
+EQUIPMENT_FIELDS = ['id', 'name', 'equipment_type', 'flowrate', 'pressure', 'temperature']
+# Fields of the records returned by the stores; status is not kept in the
+# columnar copy, which is never rewritten, so it is read from the table there
+RECORD_FIELDS = EQUIPMENT_FIELDS + ['status']
+
+COLUMNAR_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('name', pa.string()),
+    ('equipment_type', pa.string()),
+    ('flowrate', pa.float64()),
+    ('pressure', pa.float64()),
+    ('temperature', pa.float64()),
+])
+
+
+def columnar_dir(dataset_id: int) -> Path:
+    """Directory holding the columnar segments of a dataset."""
+    return Path(settings.MEDIA_ROOT) / 'columnar' / str(dataset_id)
+
+
+def delete_columnar(dataset_id: int) -> None:
+    shutil.rmtree(columnar_dir(dataset_id), ignore_errors=True)
+
+
+def _id_range(path: Path):
+    """
+    First and last row id of a segment, or None if it holds no rows.
+    Segments are named after their id range; older ones, named by a
+    sequence number, are read for it.
+    """
+    bounds = path.stem.split('-')[1:]
+    if len(bounds) == 2:
+        return int(bounds[0]), int(bounds[1])
+    ids = feather.read_table(str(path), columns=['id'], memory_map=True).column('id').to_numpy()
+    return (int(ids.min()), int(ids.max())) if len(ids) else None
+
+
+def list_segments(dataset_id: int) -> list:
+    """
+    Paths of a dataset's columnar segments, in row id order. While a
+    compaction is under way the merged segment and the segments it replaces
+    are both on disk; segments whose rows a merged one covers are left out.
+    """
+    paths = sorted(columnar_dir(dataset_id).glob('part-*.arrow'))
+    if all(len(path.stem.split('-')) == 2 for path in paths):
+        # Only sequence-numbered segments, which are never merged
+        return paths
+    ranges = []
+    for path in paths:
+        try:
+            id_range = _id_range(path)
+        except FileNotFoundError:
+            # Removed by a compaction since the directory was listed
+            continue
+        if id_range is not None:
+            ranges.append((id_range, path))
+    ranges.sort(key=lambda item: (item[0][0], -item[0][1]))
+    segments, covered = [], None
+    for (first, last), path in ranges:
+        if covered is None or last > covered:
+            segments.append(path)
+            covered = last
+    return segments
+
+
+def compact_columnar(dataset_id: int, max_segments: int = None) -> bool:
+    """
+    Merge a dataset's segments into one once there are more than
+    `max_segments` (ANALYTICS_COLUMNAR_MAX_SEGMENTS by default), so that
+    appends don't leave every read opening ever more files. The merged
+    segment is renamed into place before the ones it replaces are deleted.
+    Returns whether the segments were merged.
+    """
+    max_segments = max_segments or settings.ANALYTICS_COLUMNAR_MAX_SEGMENTS
+    segments = list_segments(dataset_id)
+    if len(segments) <= max_segments:
+        return False
+    writer = ColumnarWriter(dataset_id)
+    try:
+        for path in segments:
+            with pa.memory_map(str(path)) as source:
+                reader = ipc.open_file(source)
+                for index in range(reader.num_record_batches):
+                    writer.write_batch(reader.get_batch(index))
+    except FileNotFoundError:
+        # Another process compacted these segments first
+        writer.abort()
+        return False
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+    writer.publish()
+    for path in segments:
+        path.unlink(missing_ok=True)
+    return True
+
+
+class ColumnarWriter:
+    """
+    Write equipment rows to a new Arrow IPC segment for a dataset, one
+    record batch per call to write(). Rows go to a temporary file of the
+    writer's own, which readers never open; close() finishes it and
+    publish() renames it to `part-<first id>-<last id>.arrow`, which makes
+    the segment visible to readers at once. Callers publish once the rows
+    are committed. Row ids are unique, so concurrent writers never pick
+    the same name.
+    """
+
+    def __init__(self, dataset_id: int):
+        self.directory = columnar_dir(dataset_id)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.tmp_path = self.directory / f'.part-{uuid.uuid4().hex}.arrow.tmp'
+        # Known once close() has named the segment
+        self.path = None
+        self._first_id = self._last_id = None
+        compression = settings.ANALYTICS_COLUMNAR_COMPRESSION
+        options = ipc.IpcWriteOptions(compression=None if compression == 'none' else compression)
+        self._writer = ipc.new_file(str(self.tmp_path), COLUMNAR_SCHEMA, options=options)
+        self._closed = False
+
+    def write(self, ids, columns: dict) -> None:
+        arrays = [pa.array(ids, type=pa.int64())] + [
+            pa.array(columns[field.name], type=field.type) for field in list(COLUMNAR_SCHEMA)[1:]
+        ]
+        self.write_batch(pa.record_batch(arrays, schema=COLUMNAR_SCHEMA))
+
+    def write_batch(self, batch: pa.RecordBatch) -> None:
+        if batch.num_rows:
+            ids = batch.column(0).to_numpy()
+            first, last = int(ids.min()), int(ids.max())
+            self._first_id = first if self._first_id is None else min(self._first_id, first)
+            self._last_id = last if self._last_id is None else max(self._last_id, last)
+        self._writer.write_batch(batch)
+
+    def close(self) -> None:
+        self._close_writer()
+        if self._first_id is None:
+            # Nothing was written; an empty segment would only cost reads
+            self.tmp_path.unlink(missing_ok=True)
+            return
+        self.path = self.directory / f'part-{self._first_id:020d}-{self._last_id:020d}.arrow'
+
+    def publish(self) -> None:
+        """Rename the closed segment into place."""
+        if self.path is not None:
+            os.replace(self.tmp_path, self.path)
+
+    def abort(self) -> None:
+        """Discard the segment, before or after close(), unless it was published."""
+        self._close_writer()
+        self.tmp_path.unlink(missing_ok=True)
+
+    def _close_writer(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._writer.close()
+
+
+class RowStore:
+    """Reads equipment data from the Equipment table."""
+    name = 'row'
+
+    def __init__(self, dataset: Dataset):
+        self.dataset = dataset
+
+    def read_columns(self, columns: list) -> dict:
+        rows = self.dataset.equipment.order_by('id').values_list(*columns)
+        values = list(zip(*rows)) or [()] * len(columns)
+        return {
+            column: np.asarray(column_values, dtype=COLUMNAR_SCHEMA.field(column).type.to_pandas_dtype())
+            for column, column_values in zip(columns, values)
+        }
+
+    def records(self, limit: int = None) -> list:
+        queryset = self.dataset.equipment.order_by('id').values(*RECORD_FIELDS)
+        if limit is not None:
+            queryset = queryset[:limit]
+        return list(queryset)
+
+
+class ColumnarStore:
+    """
+    Reads equipment data from the dataset's Arrow IPC segments.
+    Segments are memory-mapped and only the requested columns are read;
+    with ANALYTICS_COLUMNAR_COMPRESSION = 'none' numeric columns are
+    returned without copying.
+    """
+    name = 'columnar'
+
+    def __init__(self, dataset: Dataset):
+        self.dataset = dataset
+        self.segments = list_segments(dataset.id)
+
+    def read_table(self, columns: list = None) -> pa.Table:
+        try:
+            return self._read_table(columns)
+        except FileNotFoundError:
+            # A compaction replaced the segments since they were listed
+            self.segments = list_segments(self.dataset.id)
+            return self._read_table(columns)
+
+    def _read_table(self, columns: list = None) -> pa.Table:
+        tables = [
+            feather.read_table(str(path), columns=columns, memory_map=True)
+            for path in self.segments
+        ]
+        if not tables:
+            return COLUMNAR_SCHEMA.empty_table().select(columns or COLUMNAR_SCHEMA.names)
+        return pa.concat_tables(tables)
+
+    def read_columns(self, columns: list) -> dict:
+        table = self.read_table(columns)
+        result = {}
+        for column in columns:
+            chunked = table.column(column)
+            if chunked.num_chunks == 1:
+                result[column] = chunked.chunk(0).to_numpy(zero_copy_only=False)
+            else:
+                result[column] = chunked.to_numpy()
+        return result
+
+    def records(self, limit: int = None) -> list:
+        if limit is None:
+            return _with_status(self.read_table(EQUIPMENT_FIELDS), self.dataset.id).to_pylist()
+        try:
+            return self._first_records(limit)
+        except FileNotFoundError:
+            self.segments = list_segments(self.dataset.id)
+            return self._first_records(limit)
+
+    def _first_records(self, limit: int) -> list:
+        # Only decode as many record batches as the limit needs
+        records = []
+        for path in self.segments:
+            with pa.memory_map(str(path)) as source:
+                reader = ipc.open_file(source)
+                for index in range(reader.num_record_batches):
+                    batch = reader.get_batch(index).slice(0, limit - len(records))
+                    records.extend(_with_status(batch, self.dataset.id).to_pylist())
+                    if len(records) >= limit:
+                        return records
+        return records
+
+
+def _with_status(table, dataset_id: int):
+    """
+    Append the status column to a table or record batch of equipment rows.
+    Statuses are read from the Equipment table, the same values the status
+    filter and counts use, for the id range the rows cover.
+    """
+    ids = table.column('id').to_numpy()
+    stored = {}
+    if len(ids):
+        stored = dict(
+            Equipment.objects.filter(dataset_id=dataset_id, id__range=(int(ids.min()), int(ids.max())))
+            .values_list('id', 'status')
+        )
+    return table.append_column('status', pa.array([stored.get(pk) for pk in ids.tolist()], type=pa.string()))
+
+
+def get_store(dataset: Dataset, backend: str = None):
+    """
+    Return the storage backend used to read a dataset's equipment data,
+    chosen by settings.ANALYTICS_STORAGE_BACKEND. Datasets without a
+    columnar copy are always read from the row store.
+    """
+    backend = backend or settings.ANALYTICS_STORAGE_BACKEND
+    if backend == ColumnarStore.name:
+        store = ColumnarStore(dataset)
+        if store.segments:
+            return store
+    return RowStore(dataset)
@@ -1,3 +1,1245 @@
-from django.test import TestCase
+import base64
+import copy
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import msgpack
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import zstandard
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from core.testing import QueryBudgetMixin
+from .bulk_insert import insert_equipment
+from .charts import correlation, lttb, stratified_sample
+from .jobs import recover_stale_jobs
+from .models import Dataset, DatasetStatistics, Equipment, IngestJob, ParameterSketch, UploadSession
+from .pagination import EquipmentCursorPagination
+from .parsing import PARAMETERS, available_engines, chunk_columns, iter_csv_chunks
+from .renderers import ORJSONRenderer
+from .services import append_csv, get_type_summary, parse_csv_and_save
+from .sketches import DEFAULT_RANK_ERROR, KLLSketch
+from .status import classify, recompute_status, sync_status_thresholds
+from .storage import (
+    ColumnarStore, ColumnarWriter, RowStore, columnar_dir, compact_columnar, get_store, list_segments,
+)
+from .streaming import negotiate_encoding
+from .uploads import part_path
+from .views import UploadSessionViewSet
+
+QUANTILES = np.linspace(0.01, 0.99, 99)
+
+
+def rank_errors(values: np.ndarray, estimates) -> np.ndarray:
+    """Distance between the normalised rank of each estimate and its quantile."""
+    ranks = np.searchsorted(np.sort(values), estimates, side='right') / len(values)
+    return np.abs(ranks - QUANTILES)
+
+
+def reference_lttb(x: list, y: list, threshold: int) -> list:
+    """Plain-Python LTTB as published by Steinarsson: positions of the kept points."""
+    every = (len(x) - 2) / (threshold - 2)
+    kept, a = [x[0]], 0
+    for i in range(threshold - 2):
+        avg_start, avg_end = int((i + 1) * every) + 1, min(int((i + 2) * every) + 1, len(x))
+        avg_x = sum(x[avg_start:avg_end]) / (avg_end - avg_start)
+        avg_y = sum(y[avg_start:avg_end]) / (avg_end - avg_start)
+        best, best_area = None, -1
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = abs((x[a] - avg_x) * (y[j] - y[a]) - (x[a] - x[j]) * (avg_y - y[a]))
+            if area > best_area:
+                best, best_area = j, area
+        kept.append(x[best])
+        a = best
+    return kept + [x[-1]]
+
+
+class AnalystTestCase(TestCase):
+    """
+    Tests run with a temporary MEDIA_ROOT and a client authenticated as
+    the `analyst` user, who owns every dataset made by create_dataset.
+    """
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.user = User.objects.create_user('analyst', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_dataset(self, content: bytes, name: str = 'a.csv', **kwargs) -> Dataset:
+        """A ready dataset of the analyst's, ingested from CSV `content`."""
+        dataset = Dataset.objects.create(user=self.user, name=name, file='unused.csv', is_ready=True)
+        # Columnar segments are published once the rows are committed
+        with self.captureOnCommitCallbacks(execute=True):
+            parse_csv_and_save(dataset, content, **kwargs)
+        return dataset
+
+
+class KLLSketchTests(SimpleTestCase):
+    """Sketch answers are checked against exact quantiles of the same data."""
+
+    def test_quantiles_within_error_bound(self):
+        rng = np.random.default_rng(0)
+        for values in (rng.uniform(size=100_000), rng.lognormal(size=100_000), rng.normal(size=100_000)):
+            sketch = KLLSketch(seed=1)
+            for chunk in np.array_split(values, 7):
+                sketch.update(chunk)
+            self.assertEqual(sketch.n, len(values))
+            self.assertLessEqual(rank_errors(values, sketch.quantiles(QUANTILES)).max(), DEFAULT_RANK_ERROR)
+
+    def test_merged_sketches_match_union(self):
+        rng = np.random.default_rng(2)
+        parts = [rng.normal(loc=i, size=size) for i, size in enumerate([500, 20_000, 80_000, 3_000])]
+        merged = KLLSketch(seed=3)
+        for seed, part in enumerate(parts):
+            merged.merge(KLLSketch(seed=seed).update(part))
+        values = np.concatenate(parts)
+        self.assertEqual(merged.n, len(values))
+        self.assertLessEqual(rank_errors(values, merged.quantiles(QUANTILES)).max(), DEFAULT_RANK_ERROR)
+
+    def test_extremes_are_exact(self):
+        values = np.random.default_rng(4).normal(size=50_000)
+        sketch = KLLSketch().update(values)
+        self.assertEqual(sketch.quantiles([0, 1]), [values.min(), values.max()])
+
+    def test_small_input_is_exact(self):
+        values = np.arange(1, 101, dtype=np.float64)
+        sketch = KLLSketch().update(values)
+        expected = np.quantile(values, QUANTILES, method='inverted_cdf')
+        self.assertEqual(sketch.quantiles(QUANTILES), expected.tolist())
+
+    def test_serialization_round_trip(self):
+        sketch = KLLSketch(seed=5).update(np.random.default_rng(5).uniform(size=30_000))
+        restored = KLLSketch.from_bytes(sketch.to_bytes())
+        self.assertEqual(restored.n, sketch.n)
+        self.assertEqual(restored.quantiles(QUANTILES), sketch.quantiles(QUANTILES))
+
+    def test_empty_sketch(self):
+        sketch = KLLSketch.from_bytes(KLLSketch().to_bytes())
+        self.assertEqual(sketch.n, 0)
+        self.assertEqual(sketch.quantiles([0.5]), [None])
+
+
+class LTTBTests(SimpleTestCase):
+    """Downsampled positions are checked against a plain-Python LTTB."""
+
+    def test_matches_reference(self):
+        rng = np.random.default_rng(6)
+        for n, threshold in ((10, 3), (100, 7), (1000, 100), (5003, 97)):
+            values = rng.normal(size=n).cumsum()
+            self.assertEqual(lttb(values, threshold).tolist(),
+                             reference_lttb(list(range(n)), values.tolist(), threshold))
+
+    def test_keeps_peak(self):
+        self.assertEqual(lttb(np.array([0, 1, 0, 5, 0, 1, 0.]), 3).tolist(), [0, 3, 6])
+
+    def test_small_thresholds_keep_every_point(self):
+        values = np.arange(10.)
+        for threshold in (0, 1, 2, 10, 11):
+            self.assertEqual(lttb(values, threshold).tolist(), list(range(10)))
+
+    def test_missing_values_are_skipped(self):
+        values = np.random.default_rng(7).normal(size=500)
+        values[[0, 3, 4, 250, 499]] = np.nan
+        x = np.flatnonzero(~np.isnan(values))
+        positions = lttb(values, 50)
+        self.assertEqual(positions.tolist(), reference_lttb(x.tolist(), values[x].tolist(), 50))
+        self.assertFalse(np.isnan(values[positions]).any())
+        self.assertEqual(lttb(values, 496).tolist(), x.tolist())
+        self.assertEqual(lttb(np.full(10, np.nan), 5).tolist(), [])
+
+
+
+class CorrelationTests(SimpleTestCase):
+    """Matrices are checked against numpy.corrcoef of the same columns."""
+
+    def columns(self, n, seed):
+        rng = np.random.default_rng(seed)
+        flowrate = rng.normal(size=n)
+        return {
+            'Flowrate': flowrate,
+            'Pressure': flowrate * 2 + rng.normal(size=n),
+            'Temperature': np.exp(rng.normal(size=n)),
+        }
+
+    def assertMatrixEqual(self, matrix, expected):
+        np.testing.assert_allclose(np.array(matrix, dtype=np.float64), expected, rtol=1e-10, atol=1e-12)
+
+    def test_pearson_matches_numpy(self):
+        columns = self.columns(500, seed=8)
+        self.assertMatrixEqual(correlation(columns)['matrix'], np.corrcoef(list(columns.values())))
+
+    def test_spearman_is_pearson_of_ranks(self):
+        columns = self.columns(500, seed=9)
+        ranks = [np.argsort(np.argsort(values)) for values in columns.values()]
+        self.assertMatrixEqual(correlation(columns, 'spearman')['matrix'], np.corrcoef(ranks))
+
+    def test_constant_column_is_none(self):
+        columns = self.columns(100, seed=10)
+        columns['Temperature'] = np.full(100, 3.)
+        for method in ('pearson', 'spearman'):
+            matrix = correlation(columns, method)['matrix']
+            self.assertEqual(matrix[2], [None, None, None])
+            self.assertEqual([row[2] for row in matrix], [None, None, None])
+            self.assertAlmostEqual(matrix[0][0], 1.)
+
+    def test_groups_match_per_group_matrices(self):
+        columns = self.columns(600, seed=11)
+        groups = np.random.default_rng(12).choice(['Valve', 'Pump', 'Reactor'], size=600)
+        result = correlation(columns, groups=groups)
+        self.assertEqual(list(result['groups']), ['Pump', 'Reactor', 'Valve'])
+        for label, matrix in result['groups'].items():
+            mask = groups == label
+            self.assertMatrixEqual(matrix, np.corrcoef([values[mask] for values in columns.values()]))
+        self.assertNotIn('groups', correlation(columns))
+
+
+class StratifiedSampleTests(SimpleTestCase):
+    """Samples are checked for reproducibility and per-group quotas."""
+
+    def groups(self, counts):
+        labels = np.repeat([f'type-{i}' for i in range(len(counts))], counts)
+        return np.random.default_rng(13).permutation(labels)
+
+    def test_same_seed_same_sample(self):
+        groups = self.groups([400, 300, 200, 100])
+        first = stratified_sample(groups, 50, seed=1)
+        self.assertEqual(first.tolist(), stratified_sample(groups, 50, seed=1).tolist())
+        self.assertNotEqual(first.tolist(), stratified_sample(groups, 50, seed=2).tolist())
+        self.assertEqual(first.tolist(), sorted(set(first.tolist())))
+
+    def test_groups_keep_their_share(self):
+        counts = [400, 300, 200, 97, 3]
+        groups = self.groups(counts)
+        n = len(groups)
+        for size in (1, 10, 77, 500, n - 1):
+            sample = stratified_sample(groups, size, seed=size)
+            self.assertEqual(len(sample), size)
+            labels, sampled = np.unique(groups[sample], return_counts=True)
+            quotas = dict(zip(labels, sampled))
+            for i, count in enumerate(counts):
+                share = count * size / n
+                self.assertIn(quotas.get(f'type-{i}', 0), (np.floor(share), np.ceil(share)))
+
+    def test_size_bound(self):
+        groups = self.groups([5, 3])
+        for size in (8, 9, 1000):
+            self.assertEqual(stratified_sample(groups, size).tolist(), list(range(8)))
+        self.assertEqual(len(stratified_sample(groups, 0)), 0)
+
+class QuantilesEndpointTests(AnalystTestCase):
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.default_rng(6)
+        self.temperatures = []
+        for index in range(3):
+            temperature = rng.uniform(20, 200, size=5_000 * (index + 1))
+            frame = pd.DataFrame({
+                'Equipment Name': [f'EQ-{i}' for i in range(len(temperature))],
+                'Type': 'Pump',
+                'Flowrate': rng.uniform(50, 500, size=len(temperature)),
+                'Pressure': rng.uniform(1, 20, size=len(temperature)),
+                'Temperature': temperature,
+            })
+            self.create_dataset(frame.to_csv(index=False).encode(), name=f'{index}.csv')
+            self.temperatures.append(temperature)
+
+    def test_merged_quantiles_match_exact_answers(self):
+        response = self.client.get('/api/datasets/quantiles/', {
+            'parameters': 'temperature', 'q': ','.join(map(str, QUANTILES)),
+        })
+        self.assertEqual(response.status_code, 200)
+        result = response.json()['parameters']['temperature']
+        values = np.concatenate(self.temperatures)
+        self.assertEqual(result['count'], len(values))
+        estimates = [result['quantiles'][str(q)] for q in QUANTILES]
+        self.assertLessEqual(rank_errors(values, estimates).max(), DEFAULT_RANK_ERROR)
+
+    def test_ids_select_datasets(self):
+        first = Dataset.objects.get(name='0.csv')
+        response = self.client.get('/api/datasets/quantiles/', {'ids': str(first.pk), 'q': '1'})
+        self.assertEqual(response.json()['datasets'], [first.pk])
+        result = response.json()['parameters']['temperature']
+        self.assertEqual(result['count'], len(self.temperatures[0]))
+        self.assertAlmostEqual(result['quantiles']['1.0'], self.temperatures[0].max())
+
+    def test_other_users_datasets_are_excluded(self):
+        other = User.objects.create_user('other', password='secret')
+        client = APIClient()
+        client.force_authenticate(other)
+        response = client.get('/api/datasets/quantiles/', {'parameters': 'temperature'})
+        self.assertEqual(response.json()['datasets'], [])
+        self.assertEqual(response.json()['parameters']['temperature']['count'], 0)
+
+    def test_invalid_quantile(self):
+        response = self.client.get('/api/datasets/quantiles/', {'q': '1.5'})
+        self.assertEqual(response.status_code, 400)
+
+
+def equipment_csv(rows: int, seed: int = 0) -> bytes:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Equipment Name': [f'EQ-{i}' for i in range(rows)],
+        'Type': rng.choice(['Pump', 'Valve', 'Reactor'], size=rows),
+        'Flowrate': rng.uniform(50, 500, size=rows),
+        'Pressure': rng.uniform(1, 20, size=rows),
+        'Temperature': rng.uniform(20, 200, size=rows),
+    }).to_csv(index=False).encode()
+
+
+class ExtendedStatisticsTests(AnalystTestCase):
+    """
+    Statistics are folded in chunk by chunk and merged on append; they are
+    checked against NumPy over all of the values.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.dataset = Dataset.objects.create(user=self.user, name='a.csv', file='unused.csv', is_ready=True)
+
+    def assertStatisticsMatch(self, values: dict):
+        statistics = DatasetStatistics.objects.get(dataset=self.dataset).as_dict()
+        for parameter, column in values.items():
+            stats = statistics[parameter]
+            self.assertAlmostEqual(stats['min'], column.min(), places=9)
+            self.assertAlmostEqual(stats['max'], column.max(), places=9)
+            self.assertAlmostEqual(stats['mean'], column.mean(), places=9)
+            self.assertAlmostEqual(stats['std'], column.std(ddof=1), places=9)
+            ranks = np.searchsorted(np.sort(column), [stats['p5'], stats['p50'], stats['p95']], side='right')
+            errors = np.abs(ranks / len(column) - [0.05, 0.5, 0.95])
+            self.assertLessEqual(errors.max(), DEFAULT_RANK_ERROR)
+
+    def test_chunked_ingest_matches_whole_file(self):
+        frame = pd.read_csv(BytesIO(equipment_csv(5_000, seed=1)))
+        parse_csv_and_save(self.dataset, equipment_csv(5_000, seed=1), chunksize=777)
+        self.assertStatisticsMatch({
+            'flowrate': frame['Flowrate'].to_numpy(),
+            'pressure': frame['Pressure'].to_numpy(),
+            'temperature': frame['Temperature'].to_numpy(),
+        })
+
+    def test_append_merges_statistics(self):
+        parse_csv_and_save(self.dataset, equipment_csv(3_000, seed=2), chunksize=500)
+        append_csv(self.dataset, equipment_csv(1_000, seed=3), chunksize=300)
+        frame = pd.concat([
+            pd.read_csv(BytesIO(equipment_csv(3_000, seed=2))), pd.read_csv(BytesIO(equipment_csv(1_000, seed=3))),
+        ])
+        self.assertStatisticsMatch({'temperature': frame['Temperature'].to_numpy()})
+        self.assertEqual(ParameterSketch.objects.filter(dataset=self.dataset).count(), 3)
+
+    def test_single_row_has_no_std(self):
+        parse_csv_and_save(self.dataset, equipment_csv(1))
+        stats = DatasetStatistics.objects.get(dataset=self.dataset).as_dict()['flowrate']
+        self.assertIsNone(stats['std'])
+        self.assertEqual(stats['min'], stats['p50'])
+
+
+class IngestTests(AnalystTestCase):
+    """Chunked, compressed and multi-engine ingestion store the same rows as a plain single-chunk parse."""
+
+    def stored_rows(self, dataset):
+        return list(dataset.equipment.order_by('id').values_list(
+            'name', 'equipment_type', 'flowrate', 'pressure', 'temperature', 'status'
+        ))
+
+    def test_streamed_ingest_matches_single_chunk(self):
+        content = equipment_csv(1_000, seed=1)
+        whole = self.create_dataset(content, chunksize=1_000)
+        stored = Dataset.objects.create(
+            user=self.user, name='b.csv', file=SimpleUploadedFile('b.csv', content, content_type='text/csv'),
+        )
+        progress = []
+        summary = parse_csv_and_save(stored, chunksize=300, progress=lambda *totals: progress.append(totals))
+        self.assertEqual(progress, [(300, 300), (600, 600), (900, 900), (1_000, 1_000)])
+        self.assertEqual(self.stored_rows(stored), self.stored_rows(whole))
+        self.assertEqual(summary['total_count'], 1_000)
+
+    def test_columnar_insert_matches_model_instances(self):
+        frame = pd.read_csv(BytesIO(equipment_csv(250, seed=2)))
+        first = Dataset.objects.create(user=self.user, name='a.csv', file='unused.csv')
+        second = Dataset.objects.create(user=self.user, name='b.csv', file='unused.csv')
+        columns = chunk_columns(frame)
+        insert_equipment(first.pk, {**columns, 'status': classify(columns['temperature'])}, batch_size=40)
+        Equipment.objects.bulk_create([
+            Equipment(dataset=second, name=row['Equipment Name'], equipment_type=row['Type'],
+                      flowrate=float(row['Flowrate']), pressure=float(row['Pressure']),
+                      temperature=float(row['Temperature']), status=classify([row['Temperature']])[0])
+            for _, row in frame.iterrows()
+        ])
+        self.assertEqual(self.stored_rows(first), self.stored_rows(second))
+
+    def test_compressed_uploads(self):
+        content = equipment_csv(400, seed=3)
+        plain = self.create_dataset(content)
+        for name, compressed in (('a.csv.gz', gzip.compress(content)),
+                                 ('a.csv.zst', zstandard.ZstdCompressor().compress(content))):
+            dataset = self.create_dataset(compressed, name=name, chunksize=150)
+            self.assertEqual(self.stored_rows(dataset), self.stored_rows(plain), name)
+
+    def test_engines_agree(self):
+        content = equipment_csv(300, seed=4) + b'"EQ, quoted",Pump,1.5,2.5,30\nEQ-missing,Valve,,1,1\n'
+        parsed = {}
+        for engine in available_engines():
+            chunks = list(iter_csv_chunks(BytesIO(content), 128, engine))
+            self.assertEqual(sum(rows_read for rows_read, _ in chunks), 302, engine)
+            self.assertTrue(all(isinstance(chunk['Type'].dtype, pd.CategoricalDtype) for _, chunk in chunks))
+            columns = [chunk_columns(chunk) for _, chunk in chunks]
+            parsed[engine] = {field: np.concatenate([chunk[field] for chunk in columns]).tolist()
+                              for field in columns[0]}
+        self.assertIn('pyarrow', parsed)
+        self.assertEqual(parsed['pyarrow']['name'][-1], 'EQ, quoted')
+        for engine, columns in parsed.items():
+            for field, values in columns.items():
+                if field in PARAMETERS:
+                    # pandas' C parser may round the last bits differently
+                    np.testing.assert_allclose(values, parsed['pyarrow'][field], rtol=1e-15, err_msg=engine)
+                else:
+                    self.assertEqual(values, parsed['pyarrow'][field], f'{engine} {field}')
+
+    def test_type_summaries(self):
+        dataset = self.create_dataset(equipment_csv(500, seed=5), chunksize=120)
+        append_csv(dataset, equipment_csv(80, seed=6))
+        frame = pd.concat([pd.read_csv(BytesIO(equipment_csv(500, seed=5))),
+                           pd.read_csv(BytesIO(equipment_csv(80, seed=6)))])
+        summaries = {summary['equipment_type']: summary for summary in get_type_summary(dataset)}
+        self.assertEqual(sorted(summaries), sorted(frame['Type'].unique()))
+        for equipment_type, group in frame.groupby('Type'):
+            summary = summaries[equipment_type]
+            self.assertEqual(summary['count'], len(group))
+            for parameter, column in (('flowrate', 'Flowrate'), ('temperature', 'Temperature')):
+                self.assertAlmostEqual(summary[parameter]['mean'], group[column].mean(), places=9)
+                self.assertAlmostEqual(summary[parameter]['min'], group[column].min(), places=9)
+                self.assertAlmostEqual(summary[parameter]['max'], group[column].max(), places=9)
+        stats = self.client.get(f'/api/datasets/{dataset.pk}/stats/').json()
+        self.assertEqual(stats['type_distribution'], frame['Type'].value_counts().to_dict())
+
+
+class DeduplicationTests(AnalystTestCase):
+    """A repeat upload of the same content returns the dataset the user already has."""
+
+    def upload(self, content, name='a.csv'):
+        upload = SimpleUploadedFile(name, content, content_type='text/csv')
+        return self.client.post('/api/datasets/', {'file': upload}, format='multipart')
+
+    def test_repeat_upload_returns_existing_dataset(self):
+        content = equipment_csv(100)
+        response = self.upload(content)
+        self.assertEqual(response.status_code, 202)
+        dataset = Dataset.objects.get()
+        self.assertEqual(dataset.content_hash, hashlib.sha256(content).hexdigest())
+
+        # Still ingesting: the same job is returned
+        self.assertEqual(self.upload(content, name='again.csv').json()['id'], response.json()['id'])
+        Dataset.objects.filter(pk=dataset.pk).update(is_ready=True)
+        repeat = self.upload(content, name='again.csv')
+        self.assertEqual((repeat.status_code, repeat.json()['id']), (200, dataset.pk))
+        self.assertEqual(Dataset.objects.count(), 1)
+
+    def test_other_users_content_is_not_shared(self):
+        content = equipment_csv(100)
+        other = User.objects.create_user(username='other', password='x')
+        Dataset.objects.create(user=other, name='a.csv', file='unused.csv', is_ready=True,
+                               content_hash=hashlib.sha256(content).hexdigest())
+        self.assertEqual(self.upload(content).status_code, 202)
+        self.assertEqual(Dataset.objects.filter(user=self.user).count(), 1)
+
+
+class QueryBudgetTests(QueryBudgetMixin, AnalystTestCase):
+    """
+    Every endpoint runs a fixed number of queries, however many datasets
+    the user has. Token authentication accounts for one query per request.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        caches['responses'].clear()
+
+        self.client.force_authenticate(None)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user).key}')
+        self.datasets = [
+            self.create_dataset(equipment_csv(200, seed=index), name=f'{index}.csv') for index in range(3)
+        ]
+        self.dataset = self.datasets[0]
+
+    def test_list(self):
+        response = self.assertQueryBudget(2, 'get', '/api/datasets/')
+        self.assertEqual([item['equipment_count'] for item in response.json()], [200, 200, 200])
+
+    def test_retrieve(self):
+        self.assertQueryBudget(3, 'get', f'/api/datasets/{self.dataset.pk}/')
+
+    def test_stats(self):
+        self.assertQueryBudget(4, 'get', f'/api/datasets/{self.dataset.pk}/stats/')
+
+    def test_chart_data(self):
+        self.assertQueryBudget(2, 'get', f'/api/datasets/{self.dataset.pk}/chart-data/')
+
+    def test_correlation(self):
+        path = f'/api/datasets/{self.dataset.pk}/correlation/'
+        self.assertQueryBudget(2, 'get', path)
+        # Cached responses still look the dataset up for its revision
+        self.assertQueryBudget(2, 'get', path)
+
+    def test_equipment(self):
+        response = self.assertQueryBudget(3, 'get', f'/api/datasets/{self.dataset.pk}/equipment/?page_size=50')
+        self.assertQueryBudget(3, 'get', response.json()['next'])
+
+    def test_compare(self):
+        ids = ','.join(str(dataset.pk) for dataset in self.datasets)
+        self.assertQueryBudget(4, 'get', '/api/datasets/compare/', {'ids': ids})
+
+    def test_quantiles(self):
+        self.assertQueryBudget(2, 'get', '/api/datasets/quantiles/')
+
+    def test_report(self):
+        # The listed rows' statuses come from the table, the rest from the columnar copy
+        self.assertQueryBudget(4, 'get', f'/api/datasets/{self.dataset.pk}/report/')
+
+    def test_upload(self):
+        upload = SimpleUploadedFile('new.csv', equipment_csv(50, seed=9), content_type='text/csv')
+        # Ingestion itself runs on the worker pool after the request
+        self.assertQueryBudget(4, 'post', '/api/datasets/', {'file': upload}, format='multipart')
+
+    def test_append(self):
+        # Row inserts add one query per batch; 50 rows fit in one
+        upload = SimpleUploadedFile('more.csv', equipment_csv(50, seed=9), content_type='text/csv')
+        self.assertQueryBudget(17, 'post', f'/api/datasets/{self.dataset.pk}/append/', {'file': upload}, format='multipart')
+
+    def test_not_modified(self):
+        for path in ['', 'stats/', 'equipment/', 'report/']:
+            url = f'/api/datasets/{self.dataset.pk}/{path}'
+            etag = self.client.get(url)['ETag']
+            # Only the dataset row is read to answer a conditional request
+            response = self.assertQueryBudget(2, 'get', url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+    def test_cached_responses(self):
+        for path in ['', 'stats/', 'equipment/', 'report/']:
+            url = f'/api/datasets/{self.dataset.pk}/{path}'
+            self.client.get(url)
+            response = self.assertQueryBudget(2, 'get', url)
+            self.assertEqual(response['X-Cache'], 'HIT')
+
+    def test_append_invalidates_cached_responses(self):
+        url = f'/api/datasets/{self.dataset.pk}/stats/'
+        self.client.get(url)
+        upload = SimpleUploadedFile('more.csv', equipment_csv(50, seed=9), content_type='text/csv')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/datasets/{self.dataset.pk}/append/', {'file': upload}, format='multipart')
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['total_count'], 250)
+
+    def test_jobs(self):
+        self.assertQueryBudget(2, 'get', '/api/jobs/')
+
+    def test_job(self):
+        job = IngestJob.objects.create(user=self.user, dataset=self.dataset, stage=IngestJob.Stage.COMPLETED)
+        self.assertQueryBudget(2, 'get', f'/api/jobs/{job.pk}/')
+
+    def test_destroy(self):
+        # Related rows go in one bulk query per table
+        self.assertQueryBudget(8, 'delete', f'/api/datasets/{self.dataset.pk}/')
+
+    def test_update(self):
+        path = f'/api/datasets/{self.dataset.pk}/'
+        self.assertQueryBudget(3, 'put', path, {'name': 'renamed.csv'}, format='multipart')
+        self.assertQueryBudget(3, 'patch', path, {'name': 'again.csv'}, format='multipart')
+        self.assertEqual(Dataset.objects.get(pk=self.dataset.pk).name, 'again.csv')
+
+    def test_cache_stats(self):
+        self.user.is_staff = True
+        self.user.save()
+        # Counters live in the cache, only authentication touches the database
+        self.assertQueryBudget(1, 'get', '/api/cache-stats/')
+        self.assertQueryBudget(1, 'delete', '/api/cache-stats/')
+
+    def test_batch(self):
+        uploads = [
+            SimpleUploadedFile(f'{seed}.csv', equipment_csv(50, seed=seed), content_type='text/csv') for seed in (7, 8)
+        ]
+        # 3 queries per request, 18 per stored file
+        self.assertQueryBudget(39, 'post', '/api/datasets/batch/', {'files': uploads}, format='multipart')
+
+    def test_equipment_stream(self):
+        response = self.assertQueryBudget(3, 'get', f'/api/datasets/{self.dataset.pk}/equipment/stream/')
+        self.assertEqual(len(json.loads(response.getvalue())), 200)
+
+    def test_upload_session(self):
+        content = equipment_csv(50, seed=9)
+        response = self.assertQueryBudget(
+            2, 'post', '/api/uploads/', {'filename': 'new.csv', 'total_size': len(content), 'chunk_size': 1024}
+        )
+        url = f"/api/uploads/{response.json()['id']}/"
+        for index, start in enumerate(range(0, len(content), 1024)):
+            chunk = content[start:start + 1024]
+            # The session row is re-read under the lock, in a savepoint
+            self.assertQueryBudget(6, 'put', f'{url}chunks/{index}/', chunk, content_type='application/octet-stream',
+                                   HTTP_X_CHUNK_SHA256=hashlib.sha256(chunk).hexdigest())
+        self.assertQueryBudget(2, 'get', url)
+        self.assertQueryBudget(9, 'post', f'{url}finalize/')
+        self.assertQueryBudget(3, 'delete', url)
+
+    def test_headers_only_when_enabled(self):
+        with override_settings(QUERY_COUNT_HEADERS=False):
+            response = self.client.get('/api/datasets/')
+        self.assertNotIn('X-Query-Count', response)
+
+
+@override_settings(ANALYTICS_STREAM_CHUNK_SIZE=100)
+class EquipmentStreamTests(AnalystTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.dataset = self.create_dataset(equipment_csv(250))
+        self.url = f'/api/datasets/{self.dataset.pk}/equipment/'
+        self.rows = self.client.get(self.url, {'page_size': 1000}).json()['results']
+
+    def test_json_array_matches_pages(self):
+        response = self.client.get(self.url + 'stream/')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), self.rows)
+
+    def test_gzip_ndjson(self):
+        response = self.client.get(self.url + 'stream/', {'output': 'ndjson', 'fields': 'temperature'},
+                                   HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        lines = gzip.decompress(b''.join(response.streaming_content)).splitlines()
+        self.assertEqual(
+            [json.loads(line) for line in lines],
+            [{'id': row['id'], 'temperature': row['temperature']} for row in self.rows],
+        )
+
+    def test_accept_ndjson(self):
+        response = self.client.get(self.url + 'stream/', HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual([json.loads(line) for line in lines], self.rows)
+
+        response = self.client.get(self.url + 'stream/', {'ordering': 'dataset'}, HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ordering', json.loads(response.content))
+
+    def test_encoding_follows_quality(self):
+        for accept_encoding, expected in [
+            ('gzip;q=1.0, br;q=0.1', 'gzip'),
+            ('gzip, br', 'br'),
+            ('br;q=0, gzip;q=0.5', 'gzip'),
+            ('*;q=0.2, gzip;q=0.1', 'br'),
+            ('identity', None),
+        ]:
+            self.assertEqual(negotiate_encoding(accept_encoding), expected, accept_encoding)
+
+
+class EquipmentQueryTests(AnalystTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.dataset = self.create_dataset(equipment_csv(500))
+        self.url = f'/api/datasets/{self.dataset.pk}/equipment/'
+        self.rows = self.client.get(self.url, {'page_size': 1000}).json()['results']
+
+    def walk(self, url, params):
+        rows, response = [], self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            rows += response.json()['results']
+            if response.json()['next'] is None:
+                return rows
+            response = self.client.get(response.json()['next'])
+
+    def test_pages_follow_id_order(self):
+        rows = self.walk(self.url, {'page_size': 64, 'fields': 'name,pressure'})
+        self.assertEqual(
+            rows, [{'id': row['id'], 'name': row['name'], 'pressure': row['pressure']} for row in self.rows]
+        )
+        self.assertEqual([row['id'] for row in self.rows], sorted(row['id'] for row in self.rows))
+
+    def test_page_size_is_capped(self):
+        with mock.patch.object(EquipmentCursorPagination, 'max_page_size', 100):
+            response = self.client.get(self.url, {'page_size': 1000, 'fields': 'name'}).json()
+        self.assertEqual(response['results'], [{'id': row['id'], 'name': row['name']} for row in self.rows[:100]])
+
+    def test_retrieve_links_to_rows(self):
+        detail = self.client.get(f'/api/datasets/{self.dataset.pk}/').json()
+        self.assertNotIn('equipment', detail)
+        self.assertTrue(detail['equipment_url'].endswith(self.url))
+
+    def test_filters_and_multi_key_sort_across_pages(self):
+        rows = self.walk(self.url, {
+            'equipment_type': 'Pump,Valve', 'temperature_min': 90, 'temperature_max': 150,
+            'ordering': 'equipment_type,-pressure', 'page_size': 7,
+        })
+        expected = sorted(
+            (row for row in self.rows
+             if row['equipment_type'] in ('Pump', 'Valve') and 90 <= row['temperature'] <= 150),
+            key=lambda row: (row['equipment_type'], -row['pressure'], row['id']),
+        )
+        self.assertGreater(len(expected), 7)
+        self.assertEqual(rows, expected)
+
+    def test_sort_key_outside_fields_is_not_returned(self):
+        rows = self.walk(self.url, {'fields': 'name', 'ordering': 'temperature', 'page_size': 50})
+        expected = sorted(self.rows, key=lambda row: (row['temperature'], row['id']))
+        self.assertEqual(rows, [{'id': row['id'], 'name': row['name']} for row in expected])
+
+    def test_low_cardinality_sort_pages_both_ways(self):
+        params = {'ordering': 'status', 'page_size': 9, 'fields': 'name'}
+        rows = self.walk(self.url, params)
+        expected = sorted(self.rows, key=lambda row: (row['status'], row['id']))
+        self.assertEqual(rows, [{'id': row['id'], 'name': row['name']} for row in expected])
+
+        # Walk back from the third page to the first
+        response = self.client.get(self.url, params)
+        for _ in range(2):
+            response = self.client.get(response.json()['next'])
+        previous = self.client.get(response.json()['previous']).json()
+        self.assertEqual(previous['results'], rows[9:18])
+        first = self.client.get(previous['previous']).json()
+        self.assertEqual(first['results'], rows[:9])
+        self.assertIsNone(first['previous'])
+
+    def test_descending_sort_breaks_ties_by_descending_id(self):
+        rows = self.walk(self.url, {'ordering': '-status', 'page_size': 40, 'fields': 'status'})
+        expected = sorted(self.rows, key=lambda row: (row['status'], row['id']), reverse=True)
+        self.assertEqual(rows, [{'id': row['id'], 'status': row['status']} for row in expected])
+
+    def test_invalid_cursor(self):
+        next_url = self.client.get(self.url, {'ordering': 'status', 'page_size': 9}).json()['next']
+        cursor = next_url.split('cursor=')[1].split('&')[0]
+        response = self.client.get(self.url, {'ordering': 'temperature,-pressure', 'cursor': cursor})
+        self.assertEqual(response.status_code, 404)
+
+    def test_malformed_cursor(self):
+        for ordering, position in (('id', '["x"]'), ('id', '[null]'), ('id', '[[1]]'), ('id', '{"id": 1}'),
+                                   ('id', 'not json'), ('-flowrate', '["high", 3]')):
+            cursor = base64.b64encode(f'o=0&p={position}'.encode()).decode()
+            response = self.client.get(self.url, {'ordering': ordering, 'cursor': cursor})
+            self.assertEqual(response.status_code, 404, position)
+
+    def test_name_prefix(self):
+        response = self.client.get(self.url, {'name_prefix': 'EQ-1', 'page_size': 1000, 'fields': 'name'})
+        self.assertEqual(
+            [row['name'] for row in response.json()['results']],
+            [row['name'] for row in self.rows if row['name'].startswith('EQ-1')],
+        )
+
+    def test_name_prefix_at_code_point_limits(self):
+        for prefix in ('퟿', 'EQ-퟿', '\U0010ffff', 'EQ-1\U0010ffff'):
+            response = self.client.get(self.url, {'name_prefix': prefix})
+            self.assertEqual(response.status_code, 200, prefix)
+            self.assertEqual(response.json()['results'], [])
+
+    def test_stream_takes_the_same_query(self):
+        params = {'equipment_type': 'Reactor', 'flowrate_max': 200, 'ordering': '-flowrate'}
+        streamed = self.client.get(self.url + 'stream/', params)
+        self.assertEqual(
+            json.loads(b''.join(streamed.streaming_content)),
+            self.walk(self.url, {**params, 'page_size': 1000}),
+        )
+
+    def test_invalid_query(self):
+        for params in ({'temperature_min': 150, 'temperature_max': 90}, {'ordering': 'dataset'}):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+    def test_non_finite_ranges_are_rejected(self):
+        for value in ('nan', 'inf', '-inf', 'NaN'):
+            response = self.client.get(self.url, {'temperature_min': value})
+            self.assertEqual(response.status_code, 400, value)
+            self.assertIn('temperature_min', response.json())
+        self.assertEqual(self.client.get('/api/datasets/quantiles/', {'q': '0.5,nan'}).status_code, 400)
+
+
+class ORJSONRendererTests(SimpleTestCase):
+    """orjson output parses to what JSONRenderer writes; only exponent floats are spelled differently."""
+
+    def test_floats_parse_equal(self):
+        rows = [{'name': 'EQ-1\u2028', 'flowrate': value} for value in
+                (0.1, 120.5, -3.25, 0.0001, 1e-7, 2.5e-5, 1e16, 1.2345678901234568e17, 1e300, 5e-324)]
+        stdlib, fast = JSONRenderer().render(rows), ORJSONRenderer().render(rows)
+        self.assertEqual(json.loads(fast), json.loads(stdlib))
+        self.assertEqual(json.loads(fast), rows)
+
+    def test_only_exponent_formatting_differs(self):
+        self.assertEqual(ORJSONRenderer().render([0.1, 120.5, 0.0001]), JSONRenderer().render([0.1, 120.5, 0.0001]))
+        for value, stdlib, fast in ((1e-7, b'[1e-07]', b'[1e-7]'), (2.5e-5, b'[2.5e-05]', b'[0.000025]'),
+                                    (1e16, b'[1e+16]', b'[1e16]')):
+            self.assertEqual(JSONRenderer().render([value]), stdlib)
+            self.assertEqual(ORJSONRenderer().render([value]), fast)
+
+
+class StatusTests(AnalystTestCase):
+    """Stored statuses, their filter and counts follow the configured thresholds."""
+
+    def setUp(self):
+        super().setUp()
+        self.dataset = self.create_dataset(equipment_csv(400, seed=7))
+        self.url = f'/api/datasets/{self.dataset.pk}/'
+
+    def assertStatusesMatchThresholds(self):
+        temperatures = np.array(self.dataset.equipment.order_by('id').values_list('temperature', flat=True))
+        self.assertEqual(list(self.dataset.equipment.order_by('id').values_list('status', flat=True)),
+                         classify(temperatures).tolist())
+
+    def test_filter_and_counts(self):
+        self.assertStatusesMatchThresholds()
+        counts = self.client.get(self.url + 'stats/').json()['status_counts']
+        warning = self.client.get(self.url + 'equipment/', {'status': 'Warning', 'page_size': 1000}).json()
+        self.assertEqual(len(warning['results']), counts['Warning'])
+        self.assertTrue(all(
+            settings.ANALYTICS_STATUS_WARNING_TEMPERATURE <= row['temperature']
+            <= settings.ANALYTICS_STATUS_OFFLINE_TEMPERATURE
+            for row in warning['results']
+        ))
+        self.assertEqual(sum(counts.values()), 400)
+
+    def test_recompute_after_threshold_change(self):
+        with override_settings(ANALYTICS_STATUS_WARNING_TEMPERATURE=60, ANALYTICS_STATUS_OFFLINE_TEMPERATURE=120):
+            # One UPDATE each for the datasets, the rows and the recorded
+            # thresholds, in a savepoint
+            with self.assertNumQueries(5):
+                updated = recompute_status()
+            self.assertGreater(updated, 0)
+            self.assertStatusesMatchThresholds()
+            self.assertEqual(recompute_status(), 0)
+
+    def test_threshold_change_is_detected(self):
+        self.assertEqual(sync_status_thresholds(), 0)
+        with override_settings(ANALYTICS_STATUS_WARNING_TEMPERATURE=60):
+            self.assertGreater(sync_status_thresholds(), 0)
+            self.assertStatusesMatchThresholds()
+            self.assertEqual(sync_status_thresholds(), 0)
+
+    def test_columnar_records_carry_stored_status(self):
+        with override_settings(ANALYTICS_STATUS_WARNING_TEMPERATURE=60):
+            # Not reclassified yet: every reader still sees the stored statuses
+            stored = RowStore(self.dataset).records()
+            self.assertEqual(ColumnarStore(self.dataset).records(), stored)
+            self.assertEqual(ColumnarStore(self.dataset).records(limit=20), stored[:20])
+
+
+class CompareTests(AnalystTestCase):
+    """Compared datasets carry the same figures as their own stats, with deltas against the baseline."""
+
+    def test_side_by_side_with_deltas(self):
+        datasets = [self.create_dataset(equipment_csv(rows, seed=rows), name=f'{rows}.csv') for rows in (100, 250, 40)]
+        ids = ','.join(str(dataset.pk) for dataset in datasets)
+        response = self.client.get('/api/datasets/compare/', {'ids': ids, 'baseline': datasets[1].pk})
+        self.assertEqual(response.status_code, 200)
+        compared = response.json()['datasets']
+        self.assertEqual([item['id'] for item in compared], [dataset.pk for dataset in datasets])
+
+        baseline = self.client.get(f'/api/datasets/{datasets[1].pk}/stats/').json()
+        for dataset, item in zip(datasets, compared):
+            stats = self.client.get(f'/api/datasets/{dataset.pk}/stats/').json()
+            for field in ('total_count', 'type_distribution', 'status_counts', 'statistics'):
+                self.assertEqual(item[field], stats[field], field)
+            self.assertEqual(item['deltas']['total_count'], stats['total_count'] - baseline['total_count'])
+            self.assertAlmostEqual(item['deltas']['avg_pressure'], stats['avg_pressure'] - baseline['avg_pressure'],
+                                   places=2)
+            for equipment_type, delta in item['deltas']['type_distribution'].items():
+                self.assertEqual(delta, stats['type_distribution'].get(equipment_type, 0)
+                                 - baseline['type_distribution'].get(equipment_type, 0))
+
+    def test_invalid_ids(self):
+        dataset = self.create_dataset(equipment_csv(10))
+        for params, status_code in (({'ids': ''}, 400), ({'ids': 'x'}, 400),
+                                    ({'ids': f'{dataset.pk},999'}, 404),
+                                    ({'ids': str(dataset.pk), 'baseline': 999}, 400)):
+            self.assertEqual(self.client.get('/api/datasets/compare/', params).status_code, status_code, params)
+
+
+class ColumnarPageTests(AnalystTestCase):
+    """Arrow IPC and MessagePack pages hold the same rows as JSON pages."""
+
+    def setUp(self):
+        super().setUp()
+        self.dataset = self.create_dataset(equipment_csv(120))
+        self.url = f'/api/datasets/{self.dataset.pk}/equipment/'
+
+    def arrow_page(self, params):
+        response = self.client.get(self.url, params, HTTP_ACCEPT='application/vnd.apache.arrow.stream')
+        self.assertEqual(response.status_code, 200)
+        return pa.ipc.open_stream(response.content).read_all()
+
+    def msgpack_columns(self, params):
+        response = self.client.get(self.url, params, HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response.status_code, 200)
+        page = msgpack.unpackb(response.content)
+        columns = {}
+        for name, column in page['columns'].items():
+            if column['dtype'] == 'str':
+                columns[name] = column['values']
+            elif 'categories' in column:
+                codes = np.frombuffer(column['data'], dtype=column['dtype'])
+                columns[name] = [column['categories'][code] for code in codes]
+            else:
+                columns[name] = np.frombuffer(column['data'], dtype=column['dtype']).tolist()
+        return page, columns
+
+    def test_pages_match_json(self):
+        params = {'page_size': 50, 'ordering': '-temperature', 'fields': 'name,equipment_type,temperature'}
+        rows = self.client.get(self.url, params).json()
+        expected = {field: [row[field] for row in rows['results']] for field in rows['results'][0]}
+
+        table = self.arrow_page(params)
+        self.assertEqual(table.to_pydict(), expected)
+        self.assertEqual(table.schema.metadata[b'next'].decode(), rows['next'])
+
+        page, columns = self.msgpack_columns(params)
+        self.assertEqual(columns, expected)
+        self.assertEqual((page['length'], page['next']), (50, rows['next']))
+
+    def test_empty_page_keeps_requested_columns(self):
+        params = {'temperature_max': 0, 'fields': 'name,status,pressure'}
+        table = self.arrow_page(params)
+        self.assertEqual(table.num_rows, 0)
+        self.assertEqual(table.column_names, ['id', 'name', 'status', 'pressure'])
+        self.assertEqual(table.schema.field('pressure').type, pa.float64())
+
+        page, columns = self.msgpack_columns(params)
+        self.assertEqual(page['length'], 0)
+        self.assertEqual(columns, {'id': [], 'name': [], 'status': [], 'pressure': []})
+
+
+class BatchUploadTests(AnalystTestCase):
+    """Batch files are parsed on the process pool and stored under jobs of their own."""
+
+    def post_batch(self, files):
+        uploads = [SimpleUploadedFile(name, content, content_type='text/csv') for name, content in files]
+        response = self.client.post('/api/datasets/batch/', {'files': uploads}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_results_per_file(self):
+        results = self.post_batch([
+            ('a.csv', equipment_csv(300, seed=1)),
+            ('bad.csv', b'Name,Type\nEQ-1,Pump\n'),
+            ('b.csv', equipment_csv(40, seed=2)),
+            ('again.csv', equipment_csv(300, seed=1)),
+        ])
+        self.assertEqual([result['status'] for result in results], ['created', 'failed', 'created', 'duplicate'])
+        self.assertIn('Missing required columns', results[1]['error'])
+        self.assertEqual(results[3]['dataset'], results[0]['dataset'])
+
+        for result, rows in ((results[0], 300), (results[2], 40)):
+            self.assertEqual((result['rows_parsed'], result['rows_inserted']), (rows, rows))
+            dataset = Dataset.objects.get(pk=result['dataset'])
+            self.assertTrue(dataset.is_ready)
+            self.assertEqual(dataset.equipment.count(), rows)
+            job = IngestJob.objects.get(pk=result['job'])
+            self.assertEqual((job.stage, job.rows_inserted), (IngestJob.Stage.COMPLETED, rows))
+        failed = IngestJob.objects.get(pk=results[1]['job'])
+        self.assertEqual((failed.stage, failed.dataset), (IngestJob.Stage.FAILED, None))
+        self.assertEqual(Dataset.objects.count(), 2)
+
+    def test_retention_runs_before_results(self):
+        results = self.post_batch([(f'{index}.csv', equipment_csv(20, seed=index)) for index in range(7)])
+        self.assertEqual([result['status'] for result in results], ['removed'] * 2 + ['created'] * 5)
+        self.assertEqual(
+            sorted(Dataset.objects.values_list('pk', flat=True)),
+            sorted(result['dataset'] for result in results[2:]),
+        )
+
+    def test_failed_insert_deletes_dataset(self):
+        with mock.patch('analytics.jobs.save_spooled_dataset', side_effect=RuntimeError('disk full')), \
+                self.assertLogs('analytics.jobs', 'ERROR'):
+            results = self.post_batch([('a.csv', equipment_csv(50))])
+        self.assertEqual((results[0]['status'], results[0]['error']), ('failed', 'disk full'))
+        self.assertFalse(Dataset.objects.exists())
+        self.assertEqual(IngestJob.objects.get(pk=results[0]['job']).stage, IngestJob.Stage.FAILED)
+
+
+class UploadSessionTests(AnalystTestCase):
+    """Resumable uploads: chunks are checked, ordered and appended on disk until finalize."""
+
+    def setUp(self):
+        super().setUp()
+        self.content = equipment_csv(100)
+        response = self.client.post(
+            '/api/uploads/', {'filename': 'a.csv', 'total_size': len(self.content), 'chunk_size': 1024}
+        )
+        self.assertEqual(response.status_code, 201)
+        self.url = f"/api/uploads/{response.json()['id']}/"
+        self.session = UploadSession.objects.get()
+        self.chunks = [self.content[start:start + 1024] for start in range(0, len(self.content), 1024)]
+
+    def put_chunk(self, index, chunk=None, checksum=None):
+        chunk = self.chunks[index] if chunk is None else chunk
+        return self.client.put(
+            f'{self.url}chunks/{index}/', chunk, content_type='application/octet-stream',
+            HTTP_X_CHUNK_SHA256=checksum or hashlib.sha256(chunk).hexdigest(),
+        )
+
+    def test_resume_after_partial_upload(self):
+        for index in range(2):
+            self.assertEqual(self.put_chunk(index).status_code, 200)
+        # A client that lost its place asks where to carry on
+        session = self.client.get(self.url).json()
+        self.assertEqual((session['offset'], session['next_chunk']), (2048, 2))
+        for index in range(2, len(self.chunks)):
+            self.assertEqual(self.put_chunk(index).status_code, 200)
+
+        response = self.client.post(f'{self.url}finalize/')
+        self.assertEqual(response.status_code, 202)
+        dataset = Dataset.objects.get()
+        self.assertEqual(dataset.content_hash, hashlib.sha256(self.content).hexdigest())
+        with dataset.file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+        self.assertFalse(part_path(self.session).exists())
+        self.assertEqual(self.client.get(self.url).json()['status'], 'finalized')
+        # Finalizing again returns the same job
+        self.assertEqual(self.client.post(f'{self.url}finalize/').json()['id'], response.json()['id'])
+
+    def test_checksum_mismatch_is_rejected(self):
+        self.assertEqual(self.put_chunk(0).status_code, 200)
+        response = self.put_chunk(1, checksum=hashlib.sha256(b'other').hexdigest())
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Checksum mismatch', response.json()['error'])
+        self.assertEqual(self.client.get(self.url).json()['offset'], 1024)
+        self.assertEqual(part_path(self.session).stat().st_size, 1024)
+        self.assertEqual(self.put_chunk(1).status_code, 200)
+
+    def test_out_of_order_and_duplicate_chunks(self):
+        response = self.put_chunk(1)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['next_chunk'], 0)
+        self.assertEqual(self.put_chunk(0).status_code, 200)
+        # A retried chunk is acknowledged without being stored twice
+        self.assertEqual(self.put_chunk(0).json()['offset'], 1024)
+        self.assertEqual(part_path(self.session).stat().st_size, 1024)
+
+    def stale(self):
+        """Make the view start from the session as it is now, whatever happens to it next."""
+        session = UploadSession.objects.get()
+        return mock.patch.object(UploadSessionViewSet, 'get_object', side_effect=lambda: copy.copy(session))
+
+    def test_stale_chunk_retry_is_acknowledged(self):
+        self.put_chunk(0)
+        with self.stale():
+            self.put_chunk(1)
+            self.put_chunk(2)
+            # A retry of chunk 1 that read the session before chunk 2 arrived
+            response = self.put_chunk(1)
+        self.assertEqual((response.status_code, response.json()['offset']), (200, 3072))
+        with part_path(self.session).open('rb') as part:
+            self.assertEqual(part.read(), b''.join(self.chunks[:3]))
+
+    def test_concurrent_finalize_returns_the_same_job(self):
+        for index in range(len(self.chunks)):
+            self.put_chunk(index)
+        with self.stale():
+            first = self.client.post(f'{self.url}finalize/')
+            second = self.client.post(f'{self.url}finalize/')
+        self.assertEqual((first.status_code, second.status_code), (202, 202))
+        self.assertEqual(first.json()['id'], second.json()['id'])
+        self.assertEqual(Dataset.objects.count(), 1)
+
+    def test_finalize_incomplete_upload(self):
+        self.put_chunk(0)
+        response = self.client.post(f'{self.url}finalize/')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Upload incomplete', response.json()['error'])
+        self.assertEqual(self.client.get(self.url).json()['status'], 'active')
+        self.assertFalse(Dataset.objects.exists())
+
+
+class JobRecoveryTests(AnalystTestCase):
+    """Only jobs whose worker stopped sending heartbeats are taken over."""
+
+    def stuck_job(self, seconds_since_heartbeat: int) -> IngestJob:
+        name = f'{seconds_since_heartbeat}.csv'
+        dataset = Dataset.objects.create(
+            user=self.user, name=name, file=SimpleUploadedFile(name, equipment_csv(60), content_type='text/csv'),
+        )
+        # The worker got part way through the file
+        parse_csv_and_save(dataset, equipment_csv(20))
+        job = IngestJob.objects.create(user=self.user, dataset=dataset, stage=IngestJob.Stage.PARSING,
+                                       worker='elsewhere:1:abc')
+        # A slow job reports no progress for a long time, but keeps beating
+        long_ago = timezone.now() - timedelta(hours=1)
+        IngestJob.objects.filter(pk=job.pk).update(
+            updated_at=long_ago, heartbeat_at=timezone.now() - timedelta(seconds=seconds_since_heartbeat),
+        )
+        return job
+
+    def test_dead_worker_jobs_are_requeued(self):
+        dead, alive = self.stuck_job(3600), self.stuck_job(5)
+        self.assertEqual(recover_stale_jobs(), [dead.pk])
+
+        dead.refresh_from_db()
+        self.assertEqual((dead.stage, dead.worker, dead.rows_inserted), (IngestJob.Stage.QUEUED, '', 0))
+        self.assertFalse(dead.dataset.equipment.exists())
+        alive.refresh_from_db()
+        self.assertEqual((alive.stage, alive.worker), (IngestJob.Stage.PARSING, 'elsewhere:1:abc'))
+        self.assertEqual(alive.dataset.equipment.count(), 20)
+
+    def test_command_finishes_recovered_jobs(self):
+        job = self.stuck_job(3600)
+        call_command('process_ingest_jobs', stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.stage, job.rows_inserted), (IngestJob.Stage.COMPLETED, 60))
+        self.assertTrue(job.dataset.is_ready)
+        self.assertEqual(job.dataset.equipment.count(), 60)
+
+
+class ColumnarStorageTests(AnalystTestCase):
+    """The Arrow copy of a dataset holds the same rows as the Equipment table."""
+
+    def assertStoresMatch(self, dataset):
+        fields = ['id', 'name', 'flowrate', 'temperature']
+        columnar = ColumnarStore(dataset).read_columns(fields)
+        rows = RowStore(dataset).read_columns(fields)
+        for field in fields:
+            self.assertEqual(columnar[field].tolist(), rows[field].tolist(), field)
+
+    def test_endpoints_answer_the_same_from_either_store(self):
+        columnar = self.create_dataset(equipment_csv(300), name='columnar.csv')
+        with override_settings(ANALYTICS_STORAGE_BACKEND='row'):
+            rows = self.create_dataset(equipment_csv(300), name='rows.csv')
+        self.assertIsInstance(get_store(columnar), ColumnarStore)
+        self.assertIsInstance(get_store(rows), RowStore)
+        self.assertStoresMatch(columnar)
+        for path in ('chart-data/?points=50', 'correlation/?sample=40'):
+            columnar_answer, rows_answer = (
+                self.client.get(f'/api/datasets/{dataset.pk}/{path}').json() for dataset in (columnar, rows)
+            )
+            self.assertEqual(columnar_answer, rows_answer, path)
+
+    @override_settings(ANALYTICS_COLUMNAR_MAX_SEGMENTS=3)
+    def test_appends_are_compacted(self):
+        dataset = self.create_dataset(equipment_csv(100))
+        for seed in range(1, 6):
+            with self.captureOnCommitCallbacks(execute=True):
+                append_csv(dataset, equipment_csv(30, seed=seed))
+            self.assertLessEqual(len(list_segments(dataset.pk)), 3)
+        self.assertEqual(len(list(columnar_dir(dataset.pk).iterdir())), len(list_segments(dataset.pk)))
+        self.assertEqual(dataset.equipment.count(), 250)
+        self.assertStoresMatch(dataset)
+
+    def test_appended_segment_is_published_on_commit(self):
+        dataset = self.create_dataset(equipment_csv(100))
+        with self.captureOnCommitCallbacks() as callbacks:
+            append_csv(dataset, equipment_csv(30, seed=1))
+        self.assertEqual(len(list_segments(dataset.pk)), 1)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(len(list_segments(dataset.pk)), 2)
+        self.assertStoresMatch(dataset)
+
+    def test_rolled_back_append_leaves_no_segment(self):
+        dataset = self.create_dataset(equipment_csv(100))
+        files = set(columnar_dir(dataset.pk).iterdir())
+        with mock.patch('analytics.services._save_summary', side_effect=RuntimeError('disk full')), \
+                self.captureOnCommitCallbacks(execute=True), self.assertRaises(RuntimeError):
+            append_csv(dataset, equipment_csv(30, seed=1))
+        self.assertEqual(set(columnar_dir(dataset.pk).iterdir()), files)
+        self.assertEqual(dataset.equipment.count(), 100)
+
+    def test_segments_covered_by_a_merge_are_skipped(self):
+        dataset = self.create_dataset(equipment_csv(100))
+        with self.captureOnCommitCallbacks(execute=True):
+            append_csv(dataset, equipment_csv(30, seed=1))
+        segments = list_segments(dataset.pk)
+        # Stop a compaction after the merged segment is in place
+        with mock.patch.object(Path, 'unlink'):
+            self.assertTrue(compact_columnar(dataset.pk, max_segments=1))
+        self.assertEqual(len(list(columnar_dir(dataset.pk).glob('part-*.arrow'))), 3)
+        merged = list_segments(dataset.pk)
+        self.assertEqual(len(merged), 1)
+        self.assertNotIn(merged[0], segments)
+        self.assertStoresMatch(dataset)
+
+    def test_concurrent_writers_get_their_own_segments(self):
+        dataset = self.create_dataset(equipment_csv(10))
+        columns = {
+            'name': ['x'], 'equipment_type': ['Pump'], 'flowrate': [1.0], 'pressure': [1.0], 'temperature': [1.0],
+        }
+        first, second = ColumnarWriter(dataset.pk), ColumnarWriter(dataset.pk)
+        self.assertNotEqual(first.tmp_path, second.tmp_path)
+        first.write([1000], columns)
+        second.write([1001], columns)
+        second.close()
+        first.close()
+        self.assertNotIn(first.path, list_segments(dataset.pk))
+        second.publish()
+        first.publish()
+        self.assertEqual(list_segments(dataset.pk)[-2:], [first.path, second.path])
+
+
+class ResponseCacheTests(AnalystTestCase):
+
+    def setUp(self):
+        super().setUp()
+        caches['responses'].clear()
+        self.dataset = self.create_dataset(equipment_csv(100))
+
+    def test_append_in_the_same_second_is_modified(self):
+        url = f'/api/datasets/{self.dataset.pk}/stats/'
+        first = self.client.get(url)
+        self.assertNotIn('Last-Modified', first)
+        with mock.patch('django.utils.timezone.now', return_value=self.dataset.updated_at), \
+                self.captureOnCommitCallbacks(execute=True):
+            append_csv(self.dataset, equipment_csv(10, seed=1))
+        self.dataset.refresh_from_db()
+        self.assertEqual(self.dataset.revision, 1)
+        # A date-based validator could not tell the two versions apart
+        since = http_date(self.dataset.updated_at.timestamp())
+        for headers in ({'HTTP_IF_NONE_MATCH': first['ETag']}, {'HTTP_IF_MODIFIED_SINCE': since}):
+            response = self.client.get(url, **headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['total_count'], 110)
+
+    def test_stats_endpoint_reports_serving_process(self):
+        url = f'/api/datasets/{self.dataset.pk}/stats/'
+        for _ in range(3):
+            self.client.get(url)
+        self.assertEqual(self.client.get('/api/cache-stats/').status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save()
+        stats = self.client.get('/api/cache-stats/').json()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 1))
+        self.assertEqual(stats['pid'], os.getpid())
+        self.assertEqual(self.client.delete('/api/cache-stats/').status_code, 204)
+        self.assertEqual(self.client.get('/api/cache-stats/').json()['hits'], 0)
+
+    def test_recompute_status_moves_revision_of_changed_datasets(self):
+        calm = pd.DataFrame({
+            'Equipment Name': ['EQ-1', 'EQ-2'], 'Type': 'Pump', 'Flowrate': 100.0, 'Pressure': 5.0,
+            'Temperature': 25.0,
+        })
+        unchanged = self.create_dataset(calm.to_csv(index=False).encode(), name='calm.csv')
+        with override_settings(ANALYTICS_STATUS_WARNING_TEMPERATURE=50):
+            call_command('recompute_status', stdout=StringIO())
+        self.dataset.refresh_from_db()
+        unchanged.refresh_from_db()
+        self.assertEqual((self.dataset.revision, unchanged.revision), (1, 0))
@@ -0,0 +1,35 @@
+import hashlib
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+
+
+class ContentDigestMixin:
+    """
+    Hash uploaded file content as it streams in, and expose the SHA-256
+    hex digest as `content_digest` on the resulting uploaded file.
+    """
+
+    def new_file(self, *args, **kwargs):
+        # Set up first: the memory handler stops the chain from new_file()
+        self.hasher = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        remaining = super().receive_data_chunk(raw_data, start)
+        # Only the handler that actually consumes the data hashes it
+        if remaining is None:
+            self.hasher.update(raw_data)
+        return remaining
+
+    def file_complete(self, file_size):
+        uploaded_file = super().file_complete(file_size)
+        if uploaded_file is not None:
+            uploaded_file.content_digest = self.hasher.hexdigest()
+        return uploaded_file
+
+
+class DigestMemoryFileUploadHandler(ContentDigestMixin, MemoryFileUploadHandler):
+    pass
+
+
+class DigestTemporaryFileUploadHandler(ContentDigestMixin, TemporaryFileUploadHandler):
+    pass
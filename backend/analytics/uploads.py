@@ -0,0 +1,107 @@
+import hashlib
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from .models import UploadSession
+
+
+READ_BLOCK_SIZE = 64 * 1024
+
+
+class ChunkError(ValueError):
+    """A chunk was rejected; the session is left unchanged."""
+
+
+def part_path(session: UploadSession) -> Path:
+    """File the chunks of an upload session are appended to."""
+    return Path(settings.MEDIA_ROOT) / 'uploads' / f'{session.pk}.part'
+
+
+def lock_path(session: UploadSession) -> Path:
+    return Path(settings.MEDIA_ROOT) / 'uploads' / f'{session.pk}.lock'
+
+
+@contextmanager
+def session_lock(session: UploadSession):
+    """
+    Serialise the requests that write an upload session's part file. Views
+    also lock the session row, but SQLite ignores select_for_update, so an
+    exclusive lock is taken on a file beside the part file as well. Take
+    it before the transaction that re-reads the session.
+    """
+    if fcntl is None:
+        yield
+        return
+    path = lock_path(session)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open('a+b') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def append_chunk(session: UploadSession, index: int, stream, checksum: str) -> None:
+    """
+    Append chunk `index` of an upload, read from `stream` in small blocks.
+
+    The chunk must be the next one expected, must not exceed the session's
+    chunk size and must match its SHA-256 `checksum`. A rejected chunk is
+    truncated away again, so the session can simply retry it.
+    """
+    if index != session.next_chunk:
+        raise ChunkError(f"Expected chunk {session.next_chunk}, got {index}")
+    if not checksum:
+        raise ChunkError("Missing chunk checksum")
+
+    path = part_path(session)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch(exist_ok=True)
+
+    hasher = hashlib.sha256()
+    size = 0
+    with path.open('r+b') as part:
+        # Anything past the recorded offset is left over from a failed attempt
+        part.seek(session.offset)
+        part.truncate()
+        for block in iter(lambda: stream.read(READ_BLOCK_SIZE), b''):
+            size += len(block)
+            if size > session.chunk_size or session.offset + size > session.total_size:
+                part.truncate(session.offset)
+                raise ChunkError("Chunk exceeds the session's chunk size or total size")
+            hasher.update(block)
+            part.write(block)
+
+        is_last = session.offset + size == session.total_size
+        if not size or (size != session.chunk_size and not is_last):
+            part.truncate(session.offset)
+            raise ChunkError(f"Chunk {index} has the wrong size ({size} bytes)")
+        if hasher.hexdigest() != checksum.lower():
+            part.truncate(session.offset)
+            raise ChunkError(f"Checksum mismatch for chunk {index}")
+
+    session.offset += size
+    session.next_chunk += 1
+    session.save(update_fields=['offset', 'next_chunk', 'updated_at'])
+
+
+def assembled_digest(session: UploadSession) -> str:
+    """SHA-256 of the assembled upload, read back from disk block by block."""
+    hasher = hashlib.sha256()
+    with part_path(session).open('rb') as part:
+        for block in iter(lambda: part.read(READ_BLOCK_SIZE), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def discard_part(session: UploadSession) -> None:
+    part_path(session).unlink(missing_ok=True)
+    lock_path(session).unlink(missing_ok=True)
@@ -1,10 +1,13 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import DatasetViewSet
+from .views import DatasetViewSet, IngestJobViewSet, UploadSessionViewSet, response_cache_stats
 
 router = DefaultRouter()
 router.register(r'datasets', DatasetViewSet, basename='dataset')
+router.register(r'jobs', IngestJobViewSet, basename='job')
+router.register(r'uploads', UploadSessionViewSet, basename='upload')
 
 urlpatterns = [
+    path('cache-stats/', response_cache_stats, name='response-cache-stats'),
     path('', include(router.urls)),
 ]
@@ -1,18 +1,96 @@
-from rest_framework import viewsets, status, generics
-from rest_framework.decorators import action
+from rest_framework import viewsets, mixins, status
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.permissions import IsAdminUser
+from rest_framework.reverse import reverse
+from rest_framework.settings import api_settings
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.db import transaction
 from django.http import HttpResponse
-from django.db.models import Count
 from io import BytesIO
+import os
+import time
 
-from .models import Dataset, Equipment
+from .models import Dataset, IngestJob, UploadSession
 from .serializers import (
     DatasetSerializer, DatasetDetailSerializer, 
-    EquipmentSerializer, UploadSerializer
+    UploadSerializer, IngestJobSerializer,
+    UploadSessionSerializer, ChartDataQuerySerializer, CorrelationQuerySerializer,
+    QuantileQuerySerializer, EquipmentQuerySerializer, EquipmentStreamQuerySerializer
 )
-from .services import parse_csv_and_save, get_type_distribution
+from .services import (
+    get_type_distribution,
+    get_type_summary,
+    get_status_counts,
+    compare_datasets,
+    merge_quantiles,
+    file_digest,
+    enforce_dataset_limit,
+    append_csv,
+    filter_equipment,
+)
+from .parsing import PARAMETERS
+from .jobs import enqueue_ingest, ingest_batch, start_batch_job
+from .storage import get_store
+from .conditional import conditional_dataset
+from .pagination import EquipmentCursorPagination
+from .response_cache import cache_stats, cached_response, reset_cache_stats
+from .streaming import streaming_rows_response
+from .renderers import ArrowIPCRenderer, MessagePackRenderer, NDJSONRenderer
+from .uploads import ChunkError, append_chunk, assembled_digest, discard_part, part_path, session_lock
 from .pdf_report import generate_pdf_report
+from .charts import compute_chart_data, correlation, stratified_sample
+from .sketches import DEFAULT_RANK_ERROR
+
+
+def _job_accepted(request, job):
+    return Response(
+        IngestJobSerializer(job).data,
+        status=status.HTTP_202_ACCEPTED,
+        headers={'Location': reverse('job-detail', args=[job.pk], request=request)}
+    )
+
+
+def _find_duplicate(request, digest):
+    """
+    Short-circuit a repeat upload of a file this user already has:
+    return the existing dataset, or its job if it is still ingesting.
+    """
+    existing = (
+        Dataset.objects.filter(user=request.user, content_hash=digest)
+        .order_by('-uploaded_at')
+        .first()
+    )
+    if existing is None:
+        return None
+    if existing.is_ready:
+        return Response(DatasetSerializer(existing).data, status=status.HTTP_200_OK)
+    job = existing.jobs.order_by('-created_at').first()
+    if job is None:
+        return None
+    return _job_accepted(request, job)
+
+
+def start_ingest(request, name, file, digest):
+    """Store an uploaded file as a new dataset and queue it for ingestion."""
+    duplicate = _find_duplicate(request, digest)
+    if duplicate is not None:
+        return duplicate
+    
+    # Create dataset (the upload is streamed to storage, never read whole)
+    dataset = Dataset.objects.create(
+        user=request.user,
+        name=name,
+        file=file,
+        content_hash=digest
+    )
+    
+    # Parsing, statistics and retention run on the ingest worker pool
+    job = enqueue_ingest(dataset)
+    return _job_accepted(request, job)
 
 
 class DatasetViewSet(viewsets.ModelViewSet):
@@ -24,7 +102,25 @@ class DatasetViewSet(viewsets.ModelViewSet):
         """Return only datasets for the current user."""
         # Don't slice here - it breaks detail lookups
         # We limit to 5 in the list action instead
-        return Dataset.objects.filter(user=self.request.user).order_by('-uploaded_at')
+        # Datasets still being ingested are only reachable through their job
+        queryset = Dataset.objects.filter(
+            user=self.request.user, is_ready=True
+        ).order_by('-uploaded_at')
+        if self.action == 'stats':
+            # Extended statistics come from the same row read as the dataset
+            queryset = queryset.select_related('statistics')
+        return queryset
+
+    def get_object(self):
+        # Conditional requests look the dataset up before the action runs
+        if not hasattr(self, '_dataset'):
+            self._dataset = super().get_object()
+        return self._dataset
+
+    @conditional_dataset
+    @cached_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
     def list(self, request, *args, **kwargs):
         """List datasets, limited to last 5."""
@@ -38,71 +134,295 @@ class DatasetViewSet(viewsets.ModelViewSet):
         return DatasetSerializer
 
     def create(self, request, *args, **kwargs):
-        """Handle CSV file upload."""
+        """Accept a CSV upload and queue it for background ingestion."""
         serializer = UploadSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
         uploaded_file = serializer.validated_data['file']
         
-        # Read file content BEFORE saving (Django will exhaust the stream when saving)
-        file_content = uploaded_file.read()
-        uploaded_file.seek(0)  # Reset file pointer for saving
-        
-        # Create dataset
-        dataset = Dataset.objects.create(
-            user=request.user,
-            name=uploaded_file.name,
-            file=uploaded_file
+        # The digest is computed by the upload handlers while the file streams in
+        digest = getattr(uploaded_file, 'content_digest', None) or file_digest(uploaded_file)
+        return start_ingest(request, uploaded_file.name, uploaded_file, digest)
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """
+        Upload several CSV files (the `files` field) in one request. Files are
+        parsed in parallel on a process pool and each is stored as soon as its
+        parse finishes, under an ingest job of its own. Retention is applied
+        once at the end, before the per-file results are reported.
+        """
+        started = time.perf_counter()
+        files = request.FILES.getlist('files')
+        if not files:
+            return Response({'error': 'No files provided'}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = []
+        pending = []
+        for uploaded_file in files:
+            result = {'file': uploaded_file.name}
+            results.append(result)
+            serializer = UploadSerializer(data={'file': uploaded_file})
+            if not serializer.is_valid():
+                result.update(status='failed', error=serializer.errors['file'][0])
+                continue
+            digest = getattr(uploaded_file, 'content_digest', None) or file_digest(uploaded_file)
+            existing = Dataset.objects.filter(user=request.user, content_hash=digest).first()
+            if existing is not None:
+                result.update(status='duplicate', dataset=existing.id)
+                continue
+            with transaction.atomic():
+                dataset = Dataset.objects.create(
+                    user=request.user,
+                    name=uploaded_file.name,
+                    file=uploaded_file,
+                    content_hash=digest
+                )
+                job = start_batch_job(dataset)
+            result['job'] = job.pk
+            pending.append((result, job))
+
+        ingest_started = time.perf_counter()
+        outcomes = ingest_batch([job for _, job in pending])
+
+        retention_started = time.perf_counter()
+        enforce_dataset_limit(request.user)
+        kept = set(
+            Dataset.objects.filter(pk__in=[job.dataset_id for _, job in pending]).values_list('pk', flat=True)
         )
-        
+        finished = time.perf_counter()
+
+        for (result, job), outcome in zip(pending, outcomes):
+            if isinstance(outcome, Exception):
+                result.update(status='failed', error=str(outcome))
+            elif job.dataset_id not in kept:
+                # Newer datasets, including later files of this batch, took its place
+                result.update(status='removed', error='Removed by the dataset retention limit')
+            else:
+                result.update(
+                    status='created',
+                    dataset=job.dataset_id,
+                    rows_parsed=outcome['rows_parsed'],
+                    rows_inserted=job.dataset.total_count,
+                    parse_seconds=round(outcome['parse_seconds'], 4),
+                    insert_seconds=round(outcome['insert_seconds'], 4),
+                )
+
+        return Response({
+            'results': results,
+            'timings': {
+                'ingest_seconds': round(retention_started - ingest_started, 4),
+                'retention_seconds': round(finished - retention_started, 4),
+                'total_seconds': round(finished - started, 4),
+            }
+        })
+
+    @action(detail=True, methods=['post'])
+    def append(self, request, pk=None):
+        """Append the rows of another CSV file to this dataset."""
+        dataset = self.get_object()
+        serializer = UploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
         try:
-            # Parse and save equipment data using the content we already read
-            parse_csv_and_save(dataset, file_content)
-            
-            # Enforce last 5 datasets limit
-            self._enforce_dataset_limit(request.user)
-            
-            return Response(
-                DatasetSerializer(dataset).data,
-                status=status.HTTP_201_CREATED
-            )
-        except Exception as e:
-            dataset.delete()
+            with serializer.validated_data['file'].open('rb') as uploaded_file:
+                append_csv(dataset, uploaded_file)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        dataset.refresh_from_db()
+        return Response(DatasetSerializer(dataset).data)
+
+    @action(detail=False, methods=['get'])
+    def compare(self, request):
+        """
+        Compare datasets side by side: `ids` is a comma-separated list and
+        deltas are taken against `baseline` (defaults to the first id).
+        """
+        try:
+            ids = [int(pk) for pk in request.query_params.get('ids', '').split(',') if pk.strip()]
+            baseline_id = int(request.query_params.get('baseline', ids[0] if ids else 0))
+        except ValueError:
+            return Response({'error': 'ids and baseline must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if not ids:
+            return Response({'error': 'No dataset ids provided'}, status=status.HTTP_400_BAD_REQUEST)
+        if baseline_id not in ids:
+            return Response({'error': 'baseline must be one of ids'}, status=status.HTTP_400_BAD_REQUEST)
+
+        found = self.get_queryset().filter(pk__in=ids).select_related('statistics').in_bulk()
+        missing = [pk for pk in ids if pk not in found]
+        if missing:
             return Response(
-                {'error': str(e)},
-                status=status.HTTP_400_BAD_REQUEST
+                {'error': f"Datasets not found: {', '.join(map(str, missing))}"},
+                status=status.HTTP_404_NOT_FOUND
             )
+        datasets = [found[pk] for pk in dict.fromkeys(ids)]
+        return Response({
+            'baseline': baseline_id,
+            'datasets': compare_datasets(datasets, found[baseline_id]),
+        })
+
+    @action(detail=False, methods=['get'])
+    def quantiles(self, request):
+        """
+        Approximate quantiles `q` of each parameter across datasets (`ids`,
+        default all of them), merged from their stored KLL sketches. Staff
+        users can merge across every user's datasets.
+        """
+        query = QuantileQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
 
-    def _enforce_dataset_limit(self, user, limit=5):
-        """Delete older datasets beyond the limit."""
-        datasets = Dataset.objects.filter(user=user).order_by('-uploaded_at')
-        if datasets.count() > limit:
-            for old_dataset in datasets[limit:]:
-                old_dataset.delete()
+        if request.user.is_staff:
+            datasets = Dataset.objects.filter(is_ready=True)
+        else:
+            datasets = self.get_queryset()
+        if 'ids' in params:
+            datasets = datasets.filter(pk__in=params['ids'])
+
+        result = merge_quantiles(datasets, params['parameters'], params['q'])
+        return Response({'rank_error': DEFAULT_RANK_ERROR, **result})
 
     @action(detail=True, methods=['get'])
+    @conditional_dataset
+    @cached_response
     def stats(self, request, pk=None):
         """Get detailed statistics for a dataset."""
         dataset = self.get_object()
-        type_distribution = get_type_distribution(dataset)
+        type_summary = get_type_summary(dataset)
+        type_distribution = {summary['equipment_type']: summary['count'] for summary in type_summary}
+        statistics = getattr(dataset, 'statistics', None)
         
         return Response({
             'total_count': dataset.total_count,
             'avg_flowrate': dataset.avg_flowrate,
             'avg_pressure': dataset.avg_pressure,
             'avg_temperature': dataset.avg_temperature,
-            'type_distribution': type_distribution
+            'type_distribution': type_distribution,
+            'type_summary': type_summary,
+            'status_counts': get_status_counts(dataset),
+            'statistics': statistics.as_dict() if statistics is not None else None
+        })
+
+    @action(detail=True, methods=['get'], url_path='chart-data')
+    @conditional_dataset
+    @cached_response
+    def chart_data(self, request, pk=None):
+        """
+        Histograms (`bins` per parameter) and LTTB-downsampled series (at most
+        `points` per parameter) for drawing charts without fetching every row.
+        """
+        dataset = self.get_object()
+        query = ChartDataQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        columns = get_store(dataset).read_columns(params['parameters'])
+        return Response({
+            'total_count': dataset.total_count,
+            'bins': params['bins'],
+            'points': params['points'],
+            'parameters': compute_chart_data(columns, params['bins'], params['points']),
         })
 
     @action(detail=True, methods=['get'])
+    @conditional_dataset
+    def correlation(self, request, pk=None):
+        """
+        Pearson or Spearman (`method`) correlation matrix between the
+        parameters, optionally also per `group_by=equipment_type`, plus a
+        seeded sample of at most `sample` points stratified by type for
+        scatter plots. Results are cached per dataset revision.
+        """
+        dataset = self.get_object()
+        query = CorrelationQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        cache_key = 'analytics:correlation:{}:{}:{method}:{group_by}:{sample}:{seed}'.format(
+            dataset.pk, dataset.revision, **params
+        )
+        data = cache.get(cache_key)
+        if data is None:
+            columns = get_store(dataset).read_columns(['equipment_type'] + PARAMETERS)
+            types = columns.pop('equipment_type')
+            data = {
+                'method': params['method'],
+                'parameters': PARAMETERS,
+                **correlation(columns, params['method'], types if params['group_by'] else None),
+            }
+            rows = stratified_sample(types, params['sample'], params['seed'])
+            data['sample'] = {
+                'equipment_type': types[rows].tolist(),
+                **{parameter: columns[parameter][rows].tolist() for parameter in PARAMETERS},
+            }
+            cache.set(cache_key, data, settings.ANALYTICS_ANALYSIS_CACHE_TIMEOUT)
+        return Response(data)
+
+    @action(
+        detail=True, methods=['get'], pagination_class=EquipmentCursorPagination,
+        renderer_classes=[*api_settings.DEFAULT_RENDERER_CLASSES, ArrowIPCRenderer, MessagePackRenderer]
+    )
+    @conditional_dataset
+    @cached_response
     def equipment(self, request, pk=None):
-        """Get all equipment data for a dataset."""
+        """
+        Equipment rows of a dataset, a page at a time (`cursor`,
+        `page_size`). `fields` limits the columns returned. Rows can be
+        filtered by `status`, `equipment_type` (comma-separated), a
+        `name_prefix` and `<parameter>_min`/`_max` ranges, and sorted by
+        `ordering`, a comma-separated list of fields, each descending with a
+        leading '-' (id order by default; ties are broken by id, running the
+        same way as the last key). Pages are JSON rows by default;
+        an Accept header of Arrow IPC or MessagePack returns them as
+        columns instead.
+        """
         dataset = self.get_object()
-        equipment = dataset.equipment.all()
-        serializer = EquipmentSerializer(equipment, many=True)
-        return Response(serializer.data)
+        query = EquipmentQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        # Cursors hold the sort keys of a row, so rows must carry them all
+        sort_fields = [key.lstrip('-') for key in params['ordering']]
+        extra = [field for field in sort_fields if field not in params['fields']]
+        page = self.paginate_queryset(filter_equipment(dataset.equipment.values(*params['fields'], *extra), params))
+        response = self.get_paginated_response(page)
+        # Column formats keep the requested columns on an empty page
+        response.fields = params['fields']
+        # The page links are built; drop the keys that were not asked for
+        if extra:
+            for row in page:
+                for field in extra:
+                    del row[field]
+        return response
+
+    @action(
+        detail=True, methods=['get'], url_path='equipment/stream',
+        renderer_classes=[*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer]
+    )
+    def equipment_stream(self, request, pk=None):
+        """
+        Every matching equipment row of a dataset, streamed as a JSON array
+        (`output=json`) or NDJSON (`output=ndjson`, or an Accept header of
+        application/x-ndjson) and compressed with brotli or gzip when the
+        client accepts it. Takes the same `fields`, filter and `ordering`
+        parameters as the paginated endpoint.
+        """
+        dataset = self.get_object()
+        query = EquipmentStreamQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        if 'output' not in request.query_params and request.accepted_renderer.format == 'ndjson':
+            params['output'] = 'ndjson'
+
+        return streaming_rows_response(
+            request, filter_equipment(dataset.equipment.all(), params), params['fields'],
+            params['output'], settings.ANALYTICS_STREAM_CHUNK_SIZE
+        )
 
     @action(detail=True, methods=['get'])
+    @conditional_dataset
+    @cached_response
     def report(self, request, pk=None):
         """Generate and download PDF report."""
         dataset = self.get_object()
@@ -114,3 +434,106 @@ class DatasetViewSet(viewsets.ModelViewSet):
         response = HttpResponse(pdf_buffer.getvalue(), content_type='application/pdf')
         response['Content-Disposition'] = f'attachment; filename="{dataset.name}_report.pdf"'
         return response
+
+
+class IngestJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """Progress of background dataset ingestion."""
+    serializer_class = IngestJobSerializer
+
+    def get_queryset(self):
+        """Return only jobs for the current user."""
+        return IngestJob.objects.filter(user=self.request.user)
+
+
+class UploadSessionViewSet(mixins.CreateModelMixin,
+                           mixins.RetrieveModelMixin,
+                           mixins.DestroyModelMixin,
+                           viewsets.GenericViewSet):
+    """
+    Resumable uploads: create a session, PUT numbered chunks, check the
+    current offset with GET, then finalize to start ingestion.
+    """
+    serializer_class = UploadSessionSerializer
+
+    def get_queryset(self):
+        """Return only upload sessions for the current user."""
+        return UploadSession.objects.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    def perform_destroy(self, instance):
+        with session_lock(instance):
+            instance.delete()
+        discard_part(instance)
+
+    @action(detail=True, methods=['put'], url_path=r'chunks/(?P<index>\d+)')
+    def chunk(self, request, pk=None, index=None):
+        """Append one chunk; the body is the raw bytes, X-Chunk-SHA256 its checksum."""
+        session = self.get_object()
+        index = int(index)
+        with session_lock(session), transaction.atomic():
+            # Re-read under the lock: a concurrent retry may have stored the chunk
+            session = UploadSession.objects.select_for_update().get(pk=session.pk)
+            if session.status != UploadSession.Status.ACTIVE:
+                return Response({'error': 'Upload already finalized'}, status=status.HTTP_409_CONFLICT)
+            if index < session.next_chunk:
+                # Already stored, e.g. a retry after a lost response
+                return Response(self.get_serializer(session).data)
+            if index > session.next_chunk:
+                return Response(
+                    {'error': f'Expected chunk {session.next_chunk}', **self.get_serializer(session).data},
+                    status=status.HTTP_409_CONFLICT
+                )
+            try:
+                append_chunk(session, index, request.stream or BytesIO(), request.headers.get('X-Chunk-SHA256', ''))
+            except ChunkError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(session).data)
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        """Turn a fully received upload into a dataset and start ingestion."""
+        session = self.get_object()
+        with session_lock(session), transaction.atomic():
+            # Re-read under the lock: a concurrent finalize may have taken the upload
+            session = UploadSession.objects.select_for_update().select_related('job').get(pk=session.pk)
+            if session.status != UploadSession.Status.ACTIVE:
+                if session.job is not None:
+                    return _job_accepted(request, session.job)
+                return Response({'error': 'Upload already finalized'}, status=status.HTTP_409_CONFLICT)
+            if session.offset != session.total_size:
+                return Response(
+                    {'error': f'Upload incomplete: {session.offset} of {session.total_size} bytes received'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            digest = assembled_digest(session)
+            with part_path(session).open('rb') as part:
+                response = start_ingest(request, session.filename, File(part, name=session.filename), digest)
+
+            session.status = UploadSession.Status.FINALIZED
+            if response.status_code == status.HTTP_202_ACCEPTED:
+                session.job_id = response.data['id']
+            session.save(update_fields=['status', 'job', 'updated_at'])
+        # The dataset holds its own copy once the session is committed as finalized
+        discard_part(session)
+        return response
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAdminUser])
+def response_cache_stats(request):
+    """
+    Response cache hits, misses and hit rate as counted by the process that
+    serves the request: with the locmem backend each worker process keeps
+    its own counts, which other processes cannot read. DELETE zeroes them.
+    """
+    if request.method == 'DELETE':
+        reset_cache_stats()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    return Response({
+        'backend': settings.ANALYTICS_RESPONSE_CACHE_BACKEND,
+        'pid': os.getpid(),
+        **cache_stats(),
+    })
@@ -14,3 +14,12 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_asgi_application()
+
+# Reclassify stored statuses if the thresholds changed, and start the
+# ingest pool now, so jobs interrupted by a restart are resumed without
+# waiting for the next upload
+from analytics.jobs import get_executor  # noqa: E402
+from analytics.status import sync_status_thresholds  # noqa: E402
+
+sync_status_thresholds()
+get_executor()
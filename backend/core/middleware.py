@@ -0,0 +1,46 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+
+class QueryStats:
+    """Database execute wrapper that counts queries and times them."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+class QueryCountMiddleware:
+    """
+    Report the SQL queries a request ran, and the time spent in them, as
+    X-Query-Count and X-Query-Time-Ms response headers. Only active when
+    QUERY_COUNT_HEADERS is set, which defaults to DEBUG. Place it first so
+    the queries of every other middleware are counted too.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.QUERY_COUNT_HEADERS:
+            return self.get_response(request)
+
+        stats = QueryStats()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            response = self.get_response(request)
+        response['X-Query-Count'] = str(stats.count)
+        response['X-Query-Time-Ms'] = f'{stats.duration * 1000:.1f}'
+        return response
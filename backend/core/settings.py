@@ -48,6 +48,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.QueryCountMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -68,11 +69,19 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'analytics.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 # CORS Settings
 CORS_ALLOWED_ORIGINS = os.environ.get('CORS_ALLOWED_ORIGINS', 'http://localhost:5173,http://127.0.0.1:5173').split(',')
 CORS_ALLOW_ALL_ORIGINS = DEBUG  # Only allow all origins in development
+CORS_EXPOSE_HEADERS = ['X-Query-Count', 'X-Query-Time-Ms', 'X-Cache']
+
+# Per-request query count and SQL time headers (see core.middleware)
+QUERY_COUNT_HEADERS = os.environ.get('QUERY_COUNT_HEADERS', str(DEBUG)).lower() == 'true'
 
 ROOT_URLCONF = 'core.urls'
 
@@ -148,6 +157,102 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Hash uploads while they stream in so repeat uploads can be deduplicated
+FILE_UPLOAD_HANDLERS = [
+    'analytics.uploadhandlers.DigestMemoryFileUploadHandler',
+    'analytics.uploadhandlers.DigestTemporaryFileUploadHandler',
+]
+
+# CSV ingestion
+# Uploads are parsed and inserted this many rows at a time to keep memory flat
+ANALYTICS_CSV_CHUNK_SIZE = int(os.environ.get('ANALYTICS_CSV_CHUNK_SIZE', '50000'))
+# CSV parser backend: 'pyarrow', 'c', 'python', or 'auto' for the fastest available
+ANALYTICS_CSV_ENGINE = os.environ.get('ANALYTICS_CSV_ENGINE', 'auto')
+# Rows per parameterized INSERT batch when writing equipment rows
+ANALYTICS_INSERT_BATCH_SIZE = int(os.environ.get('ANALYTICS_INSERT_BATCH_SIZE', '5000'))
+
+# Storage backend for analytics reads: 'row' reads the Equipment table,
+# 'columnar' also writes a compressed Arrow copy of each dataset at ingest
+# time and serves analytics from it through memory-mapped reads
+ANALYTICS_STORAGE_BACKEND = os.environ.get('ANALYTICS_STORAGE_BACKEND', 'columnar')
+# Arrow IPC compression codec: 'zstd', 'lz4' or 'none' (zero-copy reads)
+ANALYTICS_COLUMNAR_COMPRESSION = os.environ.get('ANALYTICS_COLUMNAR_COMPRESSION', 'zstd')
+# Each append adds a segment; past this many, a dataset's segments are merged
+ANALYTICS_COLUMNAR_MAX_SEGMENTS = int(os.environ.get('ANALYTICS_COLUMNAR_MAX_SEGMENTS', '8'))
+
+# Chart data: upper bounds on histogram bins and downsampled series points
+ANALYTICS_CHART_MAX_BINS = int(os.environ.get('ANALYTICS_CHART_MAX_BINS', '200'))
+ANALYTICS_CHART_MAX_POINTS = int(os.environ.get('ANALYTICS_CHART_MAX_POINTS', '5000'))
+# Seconds correlation results stay cached; keys include the dataset revision,
+# so appends never serve stale results
+ANALYTICS_ANALYSIS_CACHE_TIMEOUT = int(os.environ.get('ANALYTICS_ANALYSIS_CACHE_TIMEOUT', '3600'))
+
+# Response cache for dataset endpoints (see analytics.response_cache).
+# Backend: 'locmem' (per process), 'file' (a directory shared by the
+# processes of one host) or 'redis' (shared by every worker; LOCATION is
+# the server URL; needs the redis package). Beyond MAX_ENTRIES, locmem
+# evicts the least recently used entries and file culls a random third of
+# its files; Redis evicts by its own maxmemory policy
+ANALYTICS_RESPONSE_CACHE_BACKEND = os.environ.get('ANALYTICS_RESPONSE_CACHE_BACKEND', 'locmem')
+ANALYTICS_RESPONSE_CACHE_LOCATION = os.environ.get('ANALYTICS_RESPONSE_CACHE_LOCATION', {
+    'locmem': 'analytics-responses',
+    'file': str(BASE_DIR / 'cache' / 'responses'),
+    'redis': 'redis://127.0.0.1:6379/1',
+}[ANALYTICS_RESPONSE_CACHE_BACKEND])
+ANALYTICS_RESPONSE_CACHE_TIMEOUT = int(os.environ.get('ANALYTICS_RESPONSE_CACHE_TIMEOUT', '3600'))
+ANALYTICS_RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('ANALYTICS_RESPONSE_CACHE_MAX_ENTRIES', '500'))
+# Responses larger than this are never cached, bounding the cache at
+# MAX_ENTRIES * MAX_BYTES
+ANALYTICS_RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('ANALYTICS_RESPONSE_CACHE_MAX_BYTES', str(1024 * 1024)))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': {
+            'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+            'file': 'django.core.cache.backends.filebased.FileBasedCache',
+            'redis': 'django.core.cache.backends.redis.RedisCache',
+        }[ANALYTICS_RESPONSE_CACHE_BACKEND],
+        'LOCATION': ANALYTICS_RESPONSE_CACHE_LOCATION,
+        'TIMEOUT': ANALYTICS_RESPONSE_CACHE_TIMEOUT,
+        'OPTIONS': {} if ANALYTICS_RESPONSE_CACHE_BACKEND == 'redis' else {
+            'MAX_ENTRIES': ANALYTICS_RESPONSE_CACHE_MAX_ENTRIES,
+        },
+    },
+}
+
+# Equipment endpoint pages: default and largest page_size a client may request
+ANALYTICS_EQUIPMENT_PAGE_SIZE = int(os.environ.get('ANALYTICS_EQUIPMENT_PAGE_SIZE', '1000'))
+ANALYTICS_EQUIPMENT_MAX_PAGE_SIZE = int(os.environ.get('ANALYTICS_EQUIPMENT_MAX_PAGE_SIZE', '10000'))
+# Rows fetched and encoded per chunk when streaming every row of a dataset
+ANALYTICS_STREAM_CHUNK_SIZE = int(os.environ.get('ANALYTICS_STREAM_CHUNK_SIZE', '2000'))
+
+# Equipment status thresholds (temperature): Warning from the first,
+# Offline above the second. Run `manage.py recompute_status` after changing them
+ANALYTICS_STATUS_WARNING_TEMPERATURE = float(os.environ.get('ANALYTICS_STATUS_WARNING_TEMPERATURE', '90'))
+ANALYTICS_STATUS_OFFLINE_TEMPERATURE = float(os.environ.get('ANALYTICS_STATUS_OFFLINE_TEMPERATURE', '150'))
+
+# Resumable uploads: largest chunk accepted per PUT (also the default size)
+ANALYTICS_UPLOAD_MAX_CHUNK_SIZE = int(os.environ.get('ANALYTICS_UPLOAD_MAX_CHUNK_SIZE', str(8 * 1024 * 1024)))
+
+# Background ingestion
+# Uploads are processed by a local worker pool; job state lives in the database
+ANALYTICS_INGEST_WORKERS = int(os.environ.get('ANALYTICS_INGEST_WORKERS', '2'))
+# Run jobs inline in the request instead of on the pool (useful for tests)
+ANALYTICS_INGEST_EAGER = os.environ.get('ANALYTICS_INGEST_EAGER', 'False').lower() == 'true'
+# Seconds between heartbeats of the jobs a process is running
+ANALYTICS_INGEST_HEARTBEAT = int(os.environ.get('ANALYTICS_INGEST_HEARTBEAT', '30'))
+# Jobs without a heartbeat for this many seconds have lost their worker
+ANALYTICS_INGEST_STALE_AFTER = int(os.environ.get('ANALYTICS_INGEST_STALE_AFTER', '300'))
+# Seconds between checks, in every server process, for jobs of dead workers
+# and queued jobs a stopped process never started; they are requeued and
+# run (0 = only `manage.py process_ingest_jobs` does this)
+ANALYTICS_INGEST_RECOVERY_INTERVAL = int(os.environ.get('ANALYTICS_INGEST_RECOVERY_INTERVAL', '60'))
+# Processes used to parse batch uploads in parallel (0 = one per available core)
+ANALYTICS_BATCH_WORKERS = int(os.environ.get('ANALYTICS_BATCH_WORKERS', '0'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
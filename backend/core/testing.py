@@ -0,0 +1,25 @@
+from django.test import override_settings
+
+
+class QueryBudgetMixin:
+    """
+    TestCase mixin for pinning the number of SQL queries an endpoint runs.
+    Budgets are exact, so a new N+1 fails the test and a saving forces the
+    budget down with it. On failure the captured SQL is listed.
+    """
+
+    def assertQueryBudget(self, budget, method, path, *args, **kwargs):
+        """
+        Issue a request through self.client and check its query count.
+        Streamed responses are read to the end within the budget; their
+        header cannot count the queries run while streaming, so it is not
+        checked.
+        """
+        with override_settings(QUERY_COUNT_HEADERS=True), self.assertNumQueries(budget):
+            response = getattr(self.client, method)(path, *args, **kwargs)
+            if response.streaming:
+                response.streaming_content = [b''.join(response.streaming_content)]
+        if not response.streaming:
+            # The middleware sees the same queries the test does
+            self.assertEqual(int(response['X-Query-Count']), budget)
+        return response
@@ -1,5 +1,38 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+import msgpack
+import numpy as np
 import requests
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, Iterator, List, Tuple
+
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+EQUIPMENT_PAGE_SIZE = 5000
+# GET responses kept for revalidation with If-None-Match
+ETAG_CACHE_SIZE = 64
+# Pending resumable uploads, keyed by file path, size and modification time
+UPLOAD_STATE_PATH = os.path.join(os.path.expanduser("~"), ".chemical_equipment_uploads.json")
+
+
+def decode_columns(payload: bytes) -> Tuple[Dict[str, np.ndarray], Optional[str]]:
+    """
+    Columns of a MessagePack equipment page, and the next page's URL.
+    Numeric columns are read-only views over the payload (no copy);
+    dictionary-encoded columns are expanded from their codes.
+    """
+    page = msgpack.unpackb(payload, raw=False)
+    columns = {}
+    for name, column in page["columns"].items():
+        if column["dtype"] == "str":
+            columns[name] = np.array(column["values"], dtype=object)
+            continue
+        data = np.frombuffer(column["data"], dtype=column["dtype"])
+        if "categories" in column:
+            data = np.array(column["categories"], dtype=object)[data]
+        columns[name] = data
+    return columns, page["next"]
 
 
 class APIClient:
@@ -8,6 +41,7 @@ class APIClient:
     def __init__(self, base_url: str = "http://localhost:8000/api"):
         self.base_url = base_url
         self.token: Optional[str] = None
+        self._etag_cache: "OrderedDict[tuple, requests.Response]" = OrderedDict()
     
     def _headers(self) -> Dict[str, str]:
         headers = {"Content-Type": "application/json"}
@@ -16,11 +50,34 @@ class APIClient:
         return headers
     
     def _request(self, method: str, endpoint: str, **kwargs) -> requests.Response:
-        url = f"{self.base_url}{endpoint}"
-        headers = kwargs.pop("headers", {})
-        headers.update(self._headers())
+        # Pagination links are already absolute
+        url = endpoint if endpoint.startswith("http") else f"{self.base_url}{endpoint}"
+        headers = self._headers()
+        headers.update(kwargs.pop("headers", {}))
+        if method == "GET":
+            return self._conditional_get(url, headers, **kwargs)
         return requests.request(method, url, headers=headers, **kwargs)
     
+    def _conditional_get(self, url: str, headers: Dict[str, str], **kwargs) -> requests.Response:
+        """
+        GET that revalidates a previously fetched response with its ETag.
+        On 304 Not Modified the stored response is returned instead.
+        """
+        key = (url, repr(sorted(kwargs.get("params", {}).items())), headers.get("Accept"))
+        cached = self._etag_cache.get(key)
+        if cached is not None:
+            headers["If-None-Match"] = cached.headers["ETag"]
+        response = requests.get(url, headers=headers, **kwargs)
+        if response.status_code == 304 and cached is not None:
+            self._etag_cache.move_to_end(key)
+            return cached
+        if response.ok and "ETag" in response.headers:
+            self._etag_cache[key] = response
+            self._etag_cache.move_to_end(key)
+            while len(self._etag_cache) > ETAG_CACHE_SIZE:
+                self._etag_cache.popitem(last=False)
+        return response
+    
     # Authentication
     def login(self, username: str, password: str) -> Dict[str, Any]:
         response = self._request(
@@ -48,6 +105,7 @@ class APIClient:
         except Exception:
             pass
         self.token = None
+        self._etag_cache.clear()
     
     # Datasets
     def list_datasets(self) -> List[Dict[str, Any]]:
@@ -56,37 +114,260 @@ class APIClient:
         return response.json()
     
     def upload_dataset(self, file_path: str) -> Dict[str, Any]:
+        """Upload a CSV through a resumable session and wait for ingestion."""
+        result = self.upload_resumable(file_path)
+        if "stage" not in result:
+            # Identical file already uploaded; the server returns that dataset
+            return result
+        return self.wait_for_job(result["id"])
+    
+    def upload_resumable(self, file_path: str, chunk_size: int = UPLOAD_CHUNK_SIZE) -> Dict[str, Any]:
+        """
+        Send a file in checksummed chunks. The session id is remembered in
+        UPLOAD_STATE_PATH, so an upload interrupted by a dropped connection
+        or a crash resumes from the last chunk the server acknowledged.
+        """
+        key = self._upload_key(file_path)
+        state = self._load_upload_state()
+        session = None
+        if key in state:
+            response = self._request("GET", f"/uploads/{state[key]}/")
+            if response.ok and response.json()["status"] == "active":
+                session = response.json()
+        if session is None:
+            response = self._request("POST", "/uploads/", json={
+                "filename": os.path.basename(file_path),
+                "total_size": os.path.getsize(file_path),
+                "chunk_size": chunk_size,
+            })
+            response.raise_for_status()
+            session = response.json()
+            state[key] = session["id"]
+            self._save_upload_state(state)
+        
         with open(file_path, "rb") as f:
-            headers = {}
-            if self.token:
-                headers["Authorization"] = f"Token {self.token}"
+            # Always continue from the offset the server reports
+            while session["offset"] < session["total_size"]:
+                f.seek(session["offset"])
+                chunk = f.read(session["chunk_size"])
+                session = self._put_chunk(session["id"], session["next_chunk"], chunk)
+        
+        response = self._request("POST", f"/uploads/{session['id']}/finalize/")
+        response.raise_for_status()
+        state = self._load_upload_state()
+        state.pop(key, None)
+        self._save_upload_state(state)
+        return response.json()
+    
+    def _put_chunk(self, session_id: str, index: int, chunk: bytes, retries: int = 3) -> Dict[str, Any]:
+        headers = {
+            "Content-Type": "application/octet-stream",
+            "X-Chunk-SHA256": hashlib.sha256(chunk).hexdigest(),
+        }
+        for attempt in range(retries):
+            try:
+                response = self._request(
+                    "PUT", f"/uploads/{session_id}/chunks/{index}/",
+                    data=chunk, headers=headers
+                )
+                if response.status_code == 409 and "offset" in response.json():
+                    # Out of step with the server (e.g. a lost response); resync
+                    return response.json()
+                response.raise_for_status()
+                return response.json()
+            except requests.RequestException:
+                if attempt == retries - 1:
+                    raise
+                time.sleep(2 ** attempt)
+    
+    @staticmethod
+    def _upload_key(file_path: str) -> str:
+        stat = os.stat(file_path)
+        return f"{os.path.abspath(file_path)}|{stat.st_size}|{int(stat.st_mtime)}"
+    
+    @staticmethod
+    def _load_upload_state() -> Dict[str, str]:
+        try:
+            with open(UPLOAD_STATE_PATH) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    @staticmethod
+    def _save_upload_state(state: Dict[str, str]) -> None:
+        with open(UPLOAD_STATE_PATH, "w") as f:
+            json.dump(state, f)
+    
+    def upload_datasets(self, file_paths: List[str]) -> Dict[str, Any]:
+        """Upload several CSVs in one batch request; returns per-file results."""
+        headers = {}
+        if self.token:
+            headers["Authorization"] = f"Token {self.token}"
+        files = [("files", open(path, "rb")) for path in file_paths]
+        try:
             response = requests.post(
-                f"{self.base_url}/datasets/",
+                f"{self.base_url}/datasets/batch/",
+                headers=headers,
+                files=files
+            )
+        finally:
+            for _, f in files:
+                f.close()
+        response.raise_for_status()
+        return response.json()
+    
+    def append_to_dataset(self, dataset_id: int, file_path: str) -> Dict[str, Any]:
+        """Append the rows of a CSV file to an existing dataset."""
+        headers = {}
+        if self.token:
+            headers["Authorization"] = f"Token {self.token}"
+        with open(file_path, "rb") as f:
+            response = requests.post(
+                f"{self.base_url}/datasets/{dataset_id}/append/",
                 headers=headers,
                 files={"file": f}
             )
         response.raise_for_status()
         return response.json()
     
+    def get_job(self, job_id: int) -> Dict[str, Any]:
+        response = self._request("GET", f"/jobs/{job_id}/")
+        response.raise_for_status()
+        return response.json()
+    
+    def wait_for_job(self, job_id: int, poll_interval: float = 1.0,
+                     timeout: float = 3600) -> Dict[str, Any]:
+        """Poll an ingest job until it finishes; raises if it failed."""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get_job(job_id)
+            if job["stage"] == "completed":
+                return job
+            if job["stage"] == "failed":
+                raise RuntimeError(job.get("error") or "Dataset processing failed")
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Dataset processing did not finish (job {job_id})")
+            time.sleep(poll_interval)
+    
     def get_dataset_stats(self, dataset_id: int) -> Dict[str, Any]:
         response = self._request("GET", f"/datasets/{dataset_id}/stats/")
         response.raise_for_status()
         return response.json()
     
-    def get_equipment(self, dataset_id: int) -> List[Dict[str, Any]]:
-        response = self._request("GET", f"/datasets/{dataset_id}/equipment/")
+    def compare_datasets(self, dataset_ids: List[int], baseline: Optional[int] = None) -> Dict[str, Any]:
+        """Side-by-side summaries of several datasets, with deltas against the baseline."""
+        params = {"ids": ",".join(str(pk) for pk in dataset_ids)}
+        if baseline is not None:
+            params["baseline"] = baseline
+        response = self._request("GET", "/datasets/compare/", params=params)
         response.raise_for_status()
         return response.json()
     
-    def download_report(self, dataset_id: int, save_path: str) -> str:
-        headers = {}
-        if self.token:
-            headers["Authorization"] = f"Token {self.token}"
-        response = requests.get(
-            f"{self.base_url}/datasets/{dataset_id}/report/",
-            headers=headers
+    def get_quantiles(self, quantiles: List[float], parameters: Optional[List[str]] = None,
+                      dataset_ids: Optional[List[int]] = None) -> Dict[str, Any]:
+        """Approximate percentiles across datasets, merged from server-side sketches."""
+        params = {"q": ",".join(str(q) for q in quantiles)}
+        if parameters:
+            params["parameters"] = ",".join(parameters)
+        if dataset_ids:
+            params["ids"] = ",".join(str(pk) for pk in dataset_ids)
+        response = self._request("GET", "/datasets/quantiles/", params=params)
+        response.raise_for_status()
+        return response.json()
+    
+    def get_chart_data(self, dataset_id: int, bins: int = 30, points: int = 1000) -> Dict[str, Any]:
+        """Server-computed histograms and downsampled series for charts."""
+        response = self._request(
+            "GET", f"/datasets/{dataset_id}/chart-data/?bins={bins}&points={points}"
         )
         response.raise_for_status()
+        return response.json()
+    
+    def get_correlation(self, dataset_id: int, method: str = "pearson",
+                        by_type: bool = False, sample: int = 1000, seed: int = 0) -> Dict[str, Any]:
+        """Correlation matrix between parameters plus a stratified scatter sample."""
+        params = {"method": method, "sample": sample, "seed": seed}
+        if by_type:
+            params["group_by"] = "equipment_type"
+        response = self._request("GET", f"/datasets/{dataset_id}/correlation/", params=params)
+        response.raise_for_status()
+        return response.json()
+    
+    def get_equipment(self, dataset_id: int, fields: Optional[List[str]] = None,
+                      limit: Optional[int] = None, page_size: int = EQUIPMENT_PAGE_SIZE,
+                      query: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Equipment rows, following the cursor pages up to `limit` rows.
+        `query` holds filter and sort parameters as the API names them, e.g.
+        {"equipment_type": "Pump", "temperature_min": 90, "ordering": "-pressure"};
+        rows come in id order without one.
+        """
+        params = {**(query or {}), "page_size": min(page_size, limit) if limit else page_size}
+        if fields:
+            params["fields"] = ",".join(fields)
+        rows: List[Dict[str, Any]] = []
+        response = self._request("GET", f"/datasets/{dataset_id}/equipment/", params=params)
+        while True:
+            response.raise_for_status()
+            page = response.json()
+            rows.extend(page["results"])
+            if not page["next"] or (limit and len(rows) >= limit):
+                break
+            response = self._request("GET", page["next"])
+        return rows[:limit] if limit else rows
+
+    def get_equipment_columns(self, dataset_id: int, fields: Optional[List[str]] = None,
+                              limit: Optional[int] = None,
+                              page_size: int = EQUIPMENT_PAGE_SIZE,
+                              query: Optional[Dict[str, Any]] = None) -> Dict[str, np.ndarray]:
+        """
+        Equipment columns as NumPy arrays, fetched as MessagePack pages and
+        following the cursor up to `limit` rows. A single page is returned
+        without copying its numeric columns. `query` is as for get_equipment.
+        """
+        params = {**(query or {}), "page_size": min(page_size, limit) if limit else page_size}
+        if fields:
+            params["fields"] = ",".join(fields)
+        headers = {"Accept": "application/msgpack"}
+        pages = []
+        rows = 0
+        response = self._request("GET", f"/datasets/{dataset_id}/equipment/", params=params, headers=headers)
+        while True:
+            response.raise_for_status()
+            columns, next_url = decode_columns(response.content)
+            pages.append(columns)
+            rows += len(columns["id"])
+            if not next_url or (limit and rows >= limit):
+                break
+            response = self._request("GET", next_url, headers=headers)
+        if len(pages) == 1:
+            columns = pages[0]
+        else:
+            columns = {name: np.concatenate([page[name] for page in pages]) for name in pages[0]}
+        return {name: values[:limit] for name, values in columns.items()} if limit else columns
+    
+    def iter_equipment(self, dataset_id: int, fields: Optional[List[str]] = None,
+                       query: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Every matching equipment row of a dataset, streamed as gzip-compressed
+        NDJSON and yielded one at a time, so memory stays flat for any dataset
+        size. `query` is as for get_equipment.
+        """
+        params = {**(query or {}), "output": "ndjson"}
+        if fields:
+            params["fields"] = ",".join(fields)
+        with requests.get(
+            f"{self.base_url}/datasets/{dataset_id}/equipment/stream/",
+            params=params, headers=self._headers(), stream=True
+        ) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+    
+    def download_report(self, dataset_id: int, save_path: str) -> str:
+        response = self._request("GET", f"/datasets/{dataset_id}/report/")
+        response.raise_for_status()
         with open(save_path, "wb") as f:
             f.write(response.content)
         return save_path
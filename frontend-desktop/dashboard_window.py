@@ -11,10 +11,16 @@ from PyQt5.QtGui import QFont
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 import matplotlib.pyplot as plt
+import numpy as np
 
 from api_client import APIClient
 
 
+# Rows shown in the equipment table; charts use server-side summaries
+TABLE_ROW_LIMIT = 1000
+TABLE_FIELDS = ["name", "equipment_type", "flowrate", "pressure", "temperature"]
+
+
 class DataLoadThread(QThread):
     """Thread for loading data from API."""
     finished = pyqtSignal(dict)
@@ -28,7 +34,9 @@ class DataLoadThread(QThread):
     def run(self):
         try:
             stats = self.api_client.get_dataset_stats(self.dataset_id)
-            equipment = self.api_client.get_equipment(self.dataset_id)
+            equipment = self.api_client.get_equipment_columns(
+                self.dataset_id, fields=TABLE_FIELDS, limit=TABLE_ROW_LIMIT
+            )
             self.finished.emit({"stats": stats, "equipment": equipment})
         except Exception as e:
             self.error.emit(str(e))
@@ -330,19 +338,20 @@ class DashboardWindow(QMainWindow):
         self.pie_figure.tight_layout()
         self.pie_canvas.draw()
     
-    def update_table(self, equipment: list):
-        self.data_table.setRowCount(len(equipment))
-        
-        for row, item in enumerate(equipment):
-            self.data_table.setItem(row, 0, QTableWidgetItem(item['name']))
-            self.data_table.setItem(row, 1, QTableWidgetItem(item['equipment_type']))
-            self.data_table.setItem(row, 2, QTableWidgetItem(f"{item['flowrate']:.2f}"))
-            self.data_table.setItem(row, 3, QTableWidgetItem(f"{item['pressure']:.2f}"))
-            self.data_table.setItem(row, 4, QTableWidgetItem(f"{item['temperature']:.2f}"))
+    def update_table(self, equipment: dict):
+        # Columns as NumPy arrays, in TABLE_FIELDS order
+        self.data_table.setRowCount(len(equipment['id']))
+        
+        for column, field in enumerate(TABLE_FIELDS):
+            values = equipment[field]
+            if values.dtype.kind == 'f':
+                values = np.char.mod('%.2f', values)
+            for row, value in enumerate(values):
+                self.data_table.setItem(row, column, QTableWidgetItem(str(value)))
     
     def on_upload(self):
         file_path, _ = QFileDialog.getOpenFileName(
-            self, "Select CSV File", "", "CSV Files (*.csv)"
+            self, "Select CSV File", "", "CSV Files (*.csv *.csv.gz *.csv.zst)"
         )
         
         if file_path:
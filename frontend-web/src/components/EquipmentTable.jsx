@@ -20,13 +20,13 @@ const EquipmentTable = ({ equipment }) => {
         return icons[type] || 'settings';
     };
 
-    // Status logic based on temperature thresholds (explained in documentation)
-    // Active: temperature < 90°C (normal operating range)
-    // Warning: temperature 90-150°C (elevated, needs monitoring)
-    // Offline: temperature > 150°C (critical, requires attention)
+    // Status is classified by the server from temperature thresholds
+    // (explained in documentation):
+    // Active: normal operating range
+    // Warning: elevated, needs monitoring
+    // Offline: critical, requires attention
     const getStatusBadge = (equipment) => {
-        const temp = equipment.temperature || 0;
-        if (temp > 150) {
+        if (equipment.status === 'Offline') {
             return {
                 label: 'Offline',
                 bgColor: 'rgba(100, 116, 139, 0.1)',      // slate
@@ -34,7 +34,7 @@ const EquipmentTable = ({ equipment }) => {
                 borderColor: 'rgba(100, 116, 139, 0.2)',
                 dotColor: '#64748b'                       // slate-500
             };
-        } else if (temp >= 90) {
+        } else if (equipment.status === 'Warning') {
             return {
                 label: 'Warning',
                 bgColor: 'rgba(245, 158, 11, 0.1)',       // amber
@@ -28,7 +28,11 @@ const UploadDropzone = ({ onUpload, uploading, onError }) => {
     const { getRootProps, getInputProps, isDragActive } = useDropzone({
         onDrop,
         onDropRejected,
-        accept: { 'text/csv': ['.csv'] },
+        accept: {
+            'text/csv': ['.csv'],
+            'application/gzip': ['.gz'],
+            'application/zstd': ['.zst'],
+        },
         multiple: false,
         disabled: uploading,
     });
@@ -38,7 +38,8 @@ const Dashboard = () => {
                 datasetAPI.getEquipment(dataset.id),
             ]);
             setStats(statsRes.data);
-            setEquipment(equipmentRes.data);
+            // The table shows the first page of rows
+            setEquipment(equipmentRes.data.results);
         } catch (err) {
             console.error('Failed to load dataset details:', err);
         }
@@ -57,7 +58,11 @@ const Dashboard = () => {
     const handleUpload = async (file) => {
         setUploading(true);
         try {
-            await datasetAPI.upload(file);
+            const response = await datasetAPI.upload(file);
+            // 200 means an identical file was already uploaded
+            if (response.status === 202) {
+                await datasetAPI.waitForJob(response.data.id);
+            }
             await loadDatasets();
         } catch (err) {
             console.error('Upload failed:', err);
@@ -40,8 +40,39 @@ export const datasetAPI = {
             headers: { 'Content-Type': 'multipart/form-data' },
         });
     },
+    getJob: (jobId) => api.get(`/jobs/${jobId}/`),
+    // Uploads are processed in the background; poll the job until it settles
+    waitForJob: async (jobId, intervalMs = 1000, timeoutMs = 60 * 60 * 1000) => {
+        const deadline = Date.now() + timeoutMs;
+        for (;;) {
+            const { data: job } = await api.get(`/jobs/${jobId}/`);
+            if (job.stage === 'completed') return job;
+            if (job.stage === 'failed') throw new Error(job.error || 'Dataset processing failed');
+            if (Date.now() > deadline) throw new Error(`Dataset processing did not finish (job ${jobId})`);
+            await new Promise((resolve) => setTimeout(resolve, intervalMs));
+        }
+    },
+    compare: (ids, baseline) =>
+        api.get('/datasets/compare/', { params: { ids: ids.join(','), baseline } }),
+    quantiles: (q, { parameters, ids } = {}) =>
+        api.get('/datasets/quantiles/', {
+            params: { q: q.join(','), parameters: parameters?.join(','), ids: ids?.join(',') },
+        }),
     getStats: (id) => api.get(`/datasets/${id}/stats/`),
-    getEquipment: (id) => api.get(`/datasets/${id}/equipment/`),
+    getChartData: (id, { bins = 30, points = 1000 } = {}) =>
+        api.get(`/datasets/${id}/chart-data/`, { params: { bins, points } }),
+    getCorrelation: (id, { method = 'pearson', groupBy, sample = 1000, seed = 0 } = {}) =>
+        api.get(`/datasets/${id}/correlation/`, {
+            params: { method, group_by: groupBy, sample, seed },
+        }),
+    // Rows come a page at a time; pass the previous response's `next` URL to continue.
+    // `query` holds filter and sort parameters as the API names them, e.g.
+    // { equipment_type: 'Pump', temperature_min: 90, ordering: '-pressure' }
+    getEquipment: (id, { pageSize = 100, fields, status, query } = {}) =>
+        api.get(`/datasets/${id}/equipment/`, {
+            params: { ...query, page_size: pageSize, fields: fields?.join(','), status },
+        }),
+    getEquipmentPage: (nextUrl) => api.get(nextUrl),
     downloadReport: (id) =>
         api.get(`/datasets/${id}/report/`, { responseType: 'blob' }),
     delete: (id) => api.delete(`/datasets/${id}/`),